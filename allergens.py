@@ -0,0 +1,255 @@
+import ast
+
+import numpy as np
+
+
+# Canonical allergen names as they appear in the food database
+CANONICAL_ALLERGENS = ['Dairy', 'Eggs', 'Gluten', 'Nuts', 'Shellfish', 'Soy']
+
+# Values in the allergens column that mean "no allergens"
+EMPTY_ALLERGEN_VALUES = {'', 'none', 'nan', 'n/a', 'na', 'null'}
+
+# Common ways users (and data entry) refer to the canonical allergens
+ALLERGEN_SYNONYMS = {
+    'dairy': 'Dairy',
+    'milk': 'Dairy',
+    'lactose': 'Dairy',
+    'cheese': 'Dairy',
+    'butter': 'Dairy',
+    'cream': 'Dairy',
+    'yogurt': 'Dairy',
+    'yoghurt': 'Dairy',
+    'whey': 'Dairy',
+    'casein': 'Dairy',
+    'egg': 'Eggs',
+    'eggs': 'Eggs',
+    'gluten': 'Gluten',
+    'wheat': 'Gluten',
+    'barley': 'Gluten',
+    'rye': 'Gluten',
+    'spelt': 'Gluten',
+    'celiac': 'Gluten',
+    'coeliac': 'Gluten',
+    'nut': 'Nuts',
+    'nuts': 'Nuts',
+    'peanut': 'Nuts',
+    'peanuts': 'Nuts',
+    'tree nut': 'Nuts',
+    'tree nuts': 'Nuts',
+    'almond': 'Nuts',
+    'almonds': 'Nuts',
+    'cashew': 'Nuts',
+    'cashews': 'Nuts',
+    'walnut': 'Nuts',
+    'walnuts': 'Nuts',
+    'hazelnut': 'Nuts',
+    'hazelnuts': 'Nuts',
+    'pecan': 'Nuts',
+    'pecans': 'Nuts',
+    'pistachio': 'Nuts',
+    'pistachios': 'Nuts',
+    'shellfish': 'Shellfish',
+    'shrimp': 'Shellfish',
+    'prawn': 'Shellfish',
+    'prawns': 'Shellfish',
+    'crab': 'Shellfish',
+    'lobster': 'Shellfish',
+    'crustacean': 'Shellfish',
+    'crustaceans': 'Shellfish',
+    'mussel': 'Shellfish',
+    'mussels': 'Shellfish',
+    'oyster': 'Shellfish',
+    'oysters': 'Shellfish',
+    'clam': 'Shellfish',
+    'clams': 'Shellfish',
+    'scallop': 'Shellfish',
+    'scallops': 'Shellfish',
+    'soy': 'Soy',
+    'soya': 'Soy',
+    'soybean': 'Soy',
+    'soybeans': 'Soy',
+    'tofu': 'Soy',
+    'edamame': 'Soy',
+}
+
+
+def normalize_allergen(name, vocabulary=None):
+    """
+    Map a user-entered or stored allergen name to its canonical token.
+
+    Parameters:
+    -----------
+    name : str
+        Allergen name, e.g. "peanut" or " Dairy "
+    vocabulary : list, optional
+        Tokens present in the food database, used for names that are not
+        in the synonym table
+
+    Returns:
+    --------
+    str or None
+        The canonical token, or None if the name means "no allergen"
+    """
+    if not isinstance(name, str):
+        return None
+
+    key = ' '.join(name.strip().strip('\'"').lower().split())
+    if key in EMPTY_ALLERGEN_VALUES:
+        return None
+
+    if key in ALLERGEN_SYNONYMS:
+        return ALLERGEN_SYNONYMS[key]
+
+    # Fall back to a case-insensitive, singular/plural match on the vocabulary
+    for token in vocabulary or CANONICAL_ALLERGENS:
+        token_key = token.lower()
+        if key == token_key or key.rstrip('s') == token_key.rstrip('s'):
+            return token
+
+    # Unknown allergen, keep it as its own token
+    return name.strip().strip('\'"').title()
+
+
+def parse_allergens(value):
+    """
+    Parse one value of the allergens column into canonical tokens.
+
+    Values are stored as stringified Python lists, e.g.
+    "['Nuts', 'None', 'Dairy']"; plain comma-separated strings and real
+    lists are accepted too. Placeholders such as 'None' are dropped.
+    """
+    if isinstance(value, str):
+        text = value.strip()
+        items = None
+        if text.startswith('['):
+            try:
+                items = ast.literal_eval(text)
+            except (ValueError, SyntaxError):
+                items = None
+        if not isinstance(items, (list, tuple)):
+            items = text.strip('[]').split(',')
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        items = list(value)
+    else:
+        return []
+
+    tokens = []
+    for item in items:
+        token = normalize_allergen(item)
+        if token is not None and token not in tokens:
+            tokens.append(token)
+
+    return tokens
+
+
+class AllergenIndex:
+    """
+    Tokenized allergen matrix for the food table.
+
+    The allergens column is parsed once into canonical tokens and stored as
+    a boolean matrix of shape (n_foods, n_tokens). Excluding allergens is a
+    lookup of the requested token columns instead of a string scan.
+    """
+
+    def __init__(self, allergen_values):
+        """
+        Parse the allergens column.
+
+        Parameters:
+        -----------
+        allergen_values : array-like
+            Raw values of the allergens column, one per food
+        """
+        parsed = [parse_allergens(value) for value in allergen_values]
+
+        self.tokens = sorted({token for tokens in parsed for token in tokens})
+        self.token_ids = {token: i for i, token in enumerate(self.tokens)}
+
+        self.matrix = np.zeros((len(parsed), len(self.tokens)), dtype=bool)
+        for row, tokens in enumerate(parsed):
+            for token in tokens:
+                self.matrix[row, self.token_ids[token]] = True
+
+        # Masks for normalized allergen sets, filled on first use
+        self._mask_cache = {}
+
+    @classmethod
+    def from_codes(cls, codes, values):
+        """Parse a dictionary-encoded allergens column, each distinct value once"""
+        distinct = cls(values)
+        return cls.from_arrays(distinct.tokens, distinct.matrix[codes])
+
+    @classmethod
+    def from_arrays(cls, tokens, matrix):
+        """Rebuild an index from its token list and matrix, e.g. a memory-mapped bundle"""
+        index = cls.__new__(cls)
+        index.tokens = list(tokens)
+        index.token_ids = {token: i for i, token in enumerate(index.tokens)}
+        index.matrix = matrix
+        index._mask_cache = {}
+        return index
+
+    def select(self, rows):
+        """Return a new index with only some rows, dropping tokens no longer present"""
+        matrix = self.matrix[rows]
+        present = matrix.any(axis=0)
+        return AllergenIndex.from_arrays([token for token, kept in zip(self.tokens, present) if kept],
+                                         matrix[:, present])
+
+    def append(self, other):
+        """Return a new index with the rows of another index appended"""
+        tokens = sorted(set(self.tokens) | set(other.tokens))
+        token_ids = {token: i for i, token in enumerate(tokens)}
+        matrix = np.zeros((len(self.matrix) + len(other.matrix), len(tokens)), dtype=bool)
+        matrix[:len(self.matrix), [token_ids[token] for token in self.tokens]] = self.matrix
+        matrix[len(self.matrix):, [token_ids[token] for token in other.tokens]] = other.matrix
+        return AllergenIndex.from_arrays(tokens, matrix)
+
+    def allergen_columns(self, allergen):
+        """
+        Return the matrix columns of one user-entered allergen.
+
+        Names the synonym table does not know fall back to a
+        case-insensitive substring test against the token vocabulary, as
+        the original string scan of the allergens column did, so e.g.
+        'fish' still excludes Shellfish. The result is empty for names
+        meaning "no allergen" and for names that match no token.
+        """
+        token = normalize_allergen(allergen, self.tokens)
+        if token is None:
+            return ()
+        if token in self.token_ids:
+            return (self.token_ids[token],)
+
+        key = ' '.join(allergen.strip().strip('\'"').lower().split())
+        return tuple(i for i, vocabulary_token in enumerate(self.tokens) if key in vocabulary_token.lower())
+
+    def token_columns(self, allergens):
+        """Return the matrix columns for a list of user-entered allergens"""
+        columns = set()
+        for allergen in allergens or []:
+            columns.update(self.allergen_columns(allergen))
+        return tuple(sorted(columns))
+
+    def unmatched(self, allergens):
+        """Return the user-entered allergens that match no allergen of the food table"""
+        return [allergen for allergen in allergens or []
+                if normalize_allergen(allergen, self.tokens) is not None and not self.allergen_columns(allergen)]
+
+    def mask(self, allergens):
+        """Return a boolean mask of the foods containing any of the allergens"""
+        columns = self.token_columns(allergens)
+
+        mask = self._mask_cache.get(columns)
+        if mask is None:
+            if columns:
+                mask = self.matrix[:, list(columns)].any(axis=1)
+            else:
+                mask = np.zeros(len(self.matrix), dtype=bool)
+            self._mask_cache[columns] = mask
+
+        return mask
+
+    def row_tokens(self, row):
+        """Return the canonical allergen tokens of one food"""
+        return [self.tokens[i] for i in np.flatnonzero(self.matrix[row])]
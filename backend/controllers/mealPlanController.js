@@ -1,98 +1,25 @@
 const MealPlan = require('../models/MealPlan');
 
+// Python recommendation service (see server.py at the repository root)
+const RECOMMENDER_URL = process.env.RECOMMENDER_URL || 'http://127.0.0.1:8000';
+
 // Generate a new meal plan
 exports.generateMealPlan = async (req, res) => {
   try {
-    // TODO: Implement meal plan generation logic
-    // For now, we'll return a mock meal plan
-    const mockMealPlan = {
-      userProfile: req.body,
-      mealPlan: {
-        daily_targets: {
-          daily_calories: 2000,
-          protein_g: 150,
-          carbs_g: 200,
-          fat_g: 67
-        },
-        meals: {
-          breakfast: {
-            target_calories: 500,
-            options: [
-              {
-                food_name: "Oatmeal with Berries",
-                calories: 350,
-                protein_g: 12,
-                carbs_g: 60,
-                fat_g: 8,
-                fiber_g: 8,
-                diet_type: "vegetarian",
-                cuisine_type: "american",
-                allergens: []
-              }
-            ]
-          },
-          lunch: {
-            target_calories: 600,
-            options: [
-              {
-                food_name: "Grilled Chicken Salad",
-                calories: 450,
-                protein_g: 35,
-                carbs_g: 20,
-                fat_g: 25,
-                fiber_g: 6,
-                diet_type: "regular",
-                cuisine_type: "american",
-                allergens: []
-              }
-            ]
-          },
-          dinner: {
-            target_calories: 700,
-            options: [
-              {
-                food_name: "Salmon with Quinoa",
-                calories: 550,
-                protein_g: 40,
-                carbs_g: 45,
-                fat_g: 20,
-                fiber_g: 8,
-                diet_type: "regular",
-                cuisine_type: "american",
-                allergens: []
-              }
-            ]
-          },
-          snack: {
-            target_calories: 200,
-            options: [
-              {
-                food_name: "Greek Yogurt with Nuts",
-                calories: 200,
-                protein_g: 15,
-                carbs_g: 10,
-                fat_g: 12,
-                fiber_g: 3,
-                diet_type: "regular",
-                cuisine_type: "american",
-                allergens: ["dairy"]
-              }
-            ]
-          }
-        },
-        current_season: "summer",
-        seasonal_recommendations: {
-          breakfast: [{ food_name: "Fresh Fruit Smoothie" }],
-          lunch: [{ food_name: "Grilled Vegetable Wrap" }],
-          dinner: [{ food_name: "Grilled Fish with Summer Vegetables" }],
-          snack: [{ food_name: "Fresh Berries" }]
-        }
-      }
-    };
+    const response = await fetch(`${RECOMMENDER_URL}/plans/daily?seasonal=1`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(req.body)
+    });
+    const mealPlan = await response.json();
+
+    if (!response.ok) {
+      return res.status(response.status).json({ message: 'Error generating meal plan', error: mealPlan.error });
+    }
 
-    res.status(200).json(mockMealPlan);
+    res.status(200).json({ userProfile: req.body, mealPlan });
   } catch (error) {
-    res.status(500).json({ message: 'Error generating meal plan', error: error.message });
+    res.status(502).json({ message: 'Recommendation service unavailable', error: error.message });
   }
 };
 
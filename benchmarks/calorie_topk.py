@@ -0,0 +1,71 @@
+"""
+Microbenchmark for the per-meal nearest-calorie selection.
+
+Compares the old DataFrame path (add a calorie_diff column, sort_values,
+head) with SortedCalories.nearest on synthetic candidate sets, and checks
+that both return the same foods in the same order.
+
+Usage:
+    python benchmarks/calorie_topk.py [--sizes 1000 10000 100000] [--queries 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from food_index import SortedCalories
+
+
+def legacy_top_k(candidates_df, target, k):
+    """Old path: add a calorie_diff column, sort by it and take the head"""
+    candidates_df = candidates_df.copy()
+    candidates_df['calorie_diff'] = abs(candidates_df['calories'] - target)
+    candidates_df = candidates_df.sort_values('calorie_diff', kind='stable')
+    return candidates_df.index.to_numpy()[:k]
+
+
+def time_per_call(func, targets):
+    """Average wall time of func over all targets, in microseconds"""
+    start = time.perf_counter()
+    for target in targets:
+        func(target)
+    return (time.perf_counter() - start) / len(targets) * 1e6
+
+
+def run(sizes, n_queries, k, seed):
+    rng = np.random.default_rng(seed)
+    print(f"{'rows':>10} {'legacy us':>12} {'sorted us':>12} {'speedup':>9} {'match':>6}")
+
+    for size in sizes:
+        # Calories with one decimal, like the food database, so ties occur
+        calories = np.round(rng.uniform(20, 900, size), 1)
+        rows = np.arange(size)
+        targets = rng.uniform(50, 1000, n_queries).round(2)
+
+        candidates_df = pd.DataFrame({'calories': calories})
+        candidates = SortedCalories(rows, calories)
+
+        match = all(
+            np.array_equal(legacy_top_k(candidates_df, t, k), candidates.nearest(t, k)[0])
+            for t in targets[:20]
+        )
+
+        legacy_us = time_per_call(lambda t: legacy_top_k(candidates_df, t, k), targets)
+        sorted_us = time_per_call(lambda t: candidates.nearest(t, k), targets)
+        print(f"{size:>10} {legacy_us:>12.1f} {sorted_us:>12.1f} {legacy_us / sorted_us:>8.0f}x {str(match):>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    run(args.sizes, args.queries, args.k, args.seed)
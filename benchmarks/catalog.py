@@ -0,0 +1,96 @@
+"""
+Synthetic food catalog generator.
+
+Produces catalogs of any size with the schema of seasonal_food_database.csv.
+Each synthetic food copies the categorical fields of a randomly drawn real
+food (cuisine, region, country, diet type, meal type, suitability and
+season flags, allergen list), so their joint distribution is preserved.
+Its nutrients are the real food's values with multiplicative noise.
+
+Usage:
+    python benchmarks/catalog.py --rows 100000 --out catalog_100k.csv
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_CSV = os.path.join(REPO_ROOT, 'seasonal_food_database.csv')
+
+# Columns that get multiplicative noise, with the number of decimals kept
+NUMERIC_COLUMNS = {
+    'calories': 1,
+    'protein_g': 1,
+    'fat_g': 1,
+    'carbs_g': 1,
+    'fiber_g': 1,
+    'sugar_g': 1,
+    'sodium_mg': 1,
+    'cholesterol_mg': 1,
+}
+
+
+def generate_catalog(n_rows, seed=0, source=SOURCE_CSV, noise=0.1):
+    """
+    Generate a synthetic catalog.
+
+    Parameters:
+    -----------
+    n_rows : int
+        Number of foods
+    seed : int
+        Random seed
+    source : str or pandas.DataFrame
+        Real catalog to sample from
+    noise : float
+        Relative standard deviation of the nutrient noise
+
+    Returns:
+    --------
+    pandas.DataFrame
+    """
+    source_df = pd.read_csv(source) if isinstance(source, str) else source
+    rng = np.random.default_rng(seed)
+
+    picks = rng.integers(0, len(source_df), n_rows)
+    catalog = source_df.iloc[picks].reset_index(drop=True)
+
+    catalog['food_id'] = np.arange(1, n_rows + 1)
+    # Keep names unique beyond the size of the source catalog
+    repeat = np.arange(n_rows) // len(source_df)
+    catalog['food_name'] = np.where(
+        repeat == 0,
+        catalog['food_name'],
+        catalog['food_name'] + ' #' + repeat.astype(str)
+    )
+
+    for column, decimals in NUMERIC_COLUMNS.items():
+        if column in catalog.columns:
+            factor = np.clip(rng.normal(1.0, noise, n_rows), 0.5, 1.5)
+            catalog[column] = np.round(catalog[column].to_numpy(dtype=float) * factor, decimals)
+
+    return catalog[source_df.columns]
+
+
+def catalog_path(work_dir, n_rows, seed=0):
+    """Generate a catalog CSV in work_dir unless it already exists, and return its path"""
+    path = os.path.join(work_dir, f"catalog_{n_rows}_{seed}.csv")
+    if not os.path.exists(path):
+        os.makedirs(work_dir, exist_ok=True)
+        generate_catalog(n_rows, seed).to_csv(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, required=True)
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--source', default=SOURCE_CSV)
+    args = parser.parse_args()
+
+    generate_catalog(args.rows, args.seed, args.source).to_csv(args.out, index=False)
+    print(f"Wrote {args.rows} foods to {args.out}")
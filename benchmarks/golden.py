@@ -0,0 +1,240 @@
+"""
+Golden-output harness for the daily meal plans.
+
+Generates a fixed corpus of user profiles and plans each one twice: with
+the frozen original implementation (legacy_recommender.py) and with the
+current DietRecommendationApp.recommend_daily_meals. Both plans are
+encoded as canonical JSON, the way save_meal_plan writes them, and must
+be identical. Each case is timed on both paths, so one run checks a
+performance change for identical results and measures its speedup.
+
+The corpus only depends on the seed and the catalog. Every profile gives
+its season, as the original used today's date otherwise, and allergies
+use the catalog's own spellings: the original matches allergens as
+substrings of the stored value, while the app maps known names and
+synonyms to whole allergens and only falls back to substrings for names
+it does not know (so 'Egg' matches Eggs, and 'Fish' would not exclude
+Shellfish in a catalog that also lists Fish). Profiles also cover
+unknown diet types, unknown cuisines and long allergy lists, which
+exercise the fallbacks for constraints that leave no food.
+
+Meals may name the constraints the app relaxed to find options
+('relaxed_constraints'). The original has no such key, so it is left
+out of the comparison.
+
+Usage:
+    python benchmarks/golden.py [--profiles 2000] [--seed 0] [--out golden.json]
+    python benchmarks/golden.py --rows 100000 --profiles 500
+
+Exits with status 1 if any plan differs.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from catalog import REPO_ROOT, SOURCE_CSV
+from legacy_recommender import LegacyRecommender
+from plan_sinks import json_default
+from suite import (ACTIVITY_LEVELS, EXACT_NEIGHBORS_MAX_ROWS, GOALS, MEALS, SEASONS, SEXES, git_revision,
+                   prepare_size)
+
+# Diet types as spelled in the catalog, a lower-case spelling, an unknown one and none
+DIET_TYPES = ['Vegan', 'Vegetarian', 'Non-Vegetarian', 'vegan', 'Regular', None]
+
+# Allergens as spelled in the catalog
+ALLERGENS = ['Nuts', 'Dairy', 'Gluten', 'Soy', 'Eggs', 'Shellfish']
+
+# Keys the app adds to a meal that the original plans do not have
+ADDED_MEAL_KEYS = {'relaxed_constraints'}
+
+# Profiles planned on both paths before timing starts
+WARMUP_PROFILES = 20
+
+
+def golden_profile(rng, cuisines):
+    """A random user profile over the catalog's cuisines"""
+    meal_cuisines = {}
+    for meal in MEALS:
+        if rng.random() < 0.3:
+            meal_cuisines[meal] = [str(cuisine) for cuisine in
+                                   rng.choice(cuisines, size=rng.integers(1, 3), replace=False)]
+            if rng.random() < 0.1:
+                meal_cuisines[meal] = ['Nowhere']
+
+    if rng.random() < 0.05:
+        allergies = list(ALLERGENS)
+    else:
+        allergies = [str(allergen) for allergen in rng.choice(ALLERGENS, size=rng.integers(0, 4), replace=False)]
+
+    return {
+        'age': int(rng.integers(18, 80)),
+        'sex': str(rng.choice(SEXES)),
+        'weight_kg': round(float(rng.uniform(45, 120)), 1),
+        'height_cm': round(float(rng.uniform(150, 200)), 1),
+        'activity_level': str(rng.choice(ACTIVITY_LEVELS)),
+        'goal': str(rng.choice(GOALS)),
+        'diet_type': DIET_TYPES[rng.integers(len(DIET_TYPES))],
+        'cuisines': meal_cuisines,
+        'allergies': allergies,
+        'season': str(rng.choice(SEASONS)),
+    }
+
+
+def golden_corpus(n_profiles, seed, cuisines):
+    """The profiles of a corpus; the same for the same arguments"""
+    rng = np.random.default_rng(seed)
+    cuisines = sorted(cuisines)
+    return [golden_profile(rng, cuisines) for _ in range(n_profiles)]
+
+
+def comparable_plan(plan):
+    """A plan without the keys only the app adds"""
+    meals = {
+        meal: {key: value for key, value in entry.items() if key not in ADDED_MEAL_KEYS}
+        for meal, entry in plan['meals'].items()
+    }
+    return dict(plan, meals=meals)
+
+
+def canonical_plan(plan):
+    """A comparable plan as canonical JSON text"""
+    return json.dumps(comparable_plan(plan), sort_keys=True, default=json_default)
+
+
+def first_difference(expected, actual, path='$'):
+    """Return (path, expected, actual) of the first difference between two plans in key order, None if equal"""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in list(expected) + [key for key in actual if key not in expected]:
+            if key not in actual or key not in expected:
+                return f"{path}.{key}", expected.get(key, '<missing>'), actual.get(key, '<missing>')
+            difference = first_difference(expected[key], actual[key], f"{path}.{key}")
+            if difference is not None:
+                return difference
+        return None
+    if isinstance(expected, list) and isinstance(actual, list):
+        for i, (left, right) in enumerate(zip(expected, actual)):
+            difference = first_difference(left, right, f"{path}[{i}]")
+            if difference is not None:
+                return difference
+        if len(expected) != len(actual):
+            return f"{path}.length", len(expected), len(actual)
+        return None
+    if json.dumps(expected, default=json_default) != json.dumps(actual, default=json_default):
+        return path, expected, actual
+    return None
+
+
+def timed(function, *args):
+    """Call a function, returning (result, milliseconds)"""
+    start = time.perf_counter_ns()
+    result = function(*args)
+    return result, (time.perf_counter_ns() - start) / 1e6
+
+
+def timing_summary(times_ms):
+    """Total and percentiles of per-case times"""
+    times_ms = np.asarray(times_ms)
+    return {
+        'total_ms': float(times_ms.sum()),
+        'p50_ms': float(np.percentile(times_ms, 50)),
+        'p90_ms': float(np.percentile(times_ms, 90)),
+        'p99_ms': float(np.percentile(times_ms, 99)),
+        'max_ms': float(times_ms.max()),
+    }
+
+
+def run(args):
+    from diet_recommender import DietRecommendationApp
+
+    if args.rows:
+        neighbors = 'exact' if args.rows <= EXACT_NEIGHBORS_MAX_ROWS else 'approximate'
+        print(f"Preparing {args.rows} foods ({neighbors} neighbours)...", flush=True)
+        csv, models_dir = prepare_size(args.work_dir, args.rows, args.seed, neighbors)
+    else:
+        csv, models_dir, neighbors = args.csv, args.models, 'exact'
+
+    legacy = LegacyRecommender(pd.read_csv(csv))
+    app = DietRecommendationApp(csv, models_dir, neighbor_backend=neighbors)
+    profiles = golden_corpus(args.profiles, args.seed, legacy.food_df['cuisine_type'].dropna().unique())
+
+    for profile in profiles[:WARMUP_PROFILES]:
+        legacy.recommend_daily_meals(profile)
+        app.recommend_daily_meals(profile)
+
+    cases = []
+    mismatches = []
+    for case, profile in enumerate(profiles):
+        expected, legacy_ms = timed(legacy.recommend_daily_meals, profile)
+        actual, current_ms = timed(app.recommend_daily_meals, profile)
+        match = canonical_plan(expected) == canonical_plan(actual)
+        cases.append({'case': case, 'match': match, 'legacy_ms': legacy_ms, 'current_ms': current_ms})
+        if not match:
+            path, left, right = first_difference(comparable_plan(expected), comparable_plan(actual))
+            mismatches.append({'case': case, 'profile': profile, 'path': path, 'legacy': left, 'current': right})
+            if len(mismatches) <= args.show:
+                print(f"case {case}: {path}: legacy {left!r}, current {right!r}")
+
+    legacy_ms = [case['legacy_ms'] for case in cases]
+    current_ms = [case['current_ms'] for case in cases]
+    summary = {
+        'profiles': len(cases),
+        'mismatches': len(mismatches),
+        'legacy': timing_summary(legacy_ms),
+        'current': timing_summary(current_ms),
+        'speedup': sum(legacy_ms) / sum(current_ms),
+        'median_case_speedup': float(np.median(np.divide(legacy_ms, current_ms))),
+    }
+
+    print(f"{summary['profiles']} profiles, {summary['mismatches']} mismatches")
+    for path in ('legacy', 'current'):
+        timing = summary[path]
+        print(f"{path:<8} p50 {timing['p50_ms']:9.3f} ms  p90 {timing['p90_ms']:9.3f} ms  "
+              f"p99 {timing['p99_ms']:9.3f} ms  total {timing['total_ms'] / 1000:8.2f} s")
+    print(f"speedup {summary['speedup']:.1f}x overall, {summary['median_case_speedup']:.1f}x median per case")
+
+    if args.out:
+        report = {
+            'meta': {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'git': git_revision(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'pandas': pd.__version__,
+                'platform': platform.platform(),
+                'catalog': csv,
+                'args': vars(args),
+            },
+            'summary': summary,
+            'mismatches': mismatches,
+            'cases': cases,
+        }
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2, default=json_default)
+        print(f"Results written to {args.out}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0, help="seed of the corpus and of a generated catalog")
+    parser.add_argument('--csv', default=SOURCE_CSV, help="food database to plan from")
+    parser.add_argument('--models', default=REPO_ROOT, help="model directory of --csv")
+    parser.add_argument('--rows', type=int, help="plan from a generated catalog of this size instead of --csv")
+    parser.add_argument('--work-dir', default=os.path.join(REPO_ROOT, '.bench'),
+                        help="where generated catalogs and neighbour tables are kept")
+    parser.add_argument('--show', type=int, default=10, help="mismatches printed")
+    parser.add_argument('--out', help="write the summary, mismatches and per-case timings as JSON")
+    run(parser.parse_args())
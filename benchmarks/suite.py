@@ -0,0 +1,415 @@
+"""
+Benchmark suite for the recommendation entry points.
+
+Runs every entry point against synthetic catalogs (see catalog.py) of
+several sizes and reports latency percentiles, throughput and peak RSS.
+Each (size, entry point) case runs in a fresh process, so peak RSS is
+per case. Results are written as JSON and two result files can be
+compared to catch regressions.
+
+Usage:
+    python benchmarks/suite.py run --sizes 1000 10000 --out bench.json
+    python benchmarks/suite.py compare base.json bench.json [--threshold 0.1]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from catalog import REPO_ROOT, catalog_path
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+MODEL_FILES = ['food_encoder.pkl', 'food_scaler.pkl', 'food_clusters.pkl', 'breakfast_predictor.pkl',
+               'lunch_predictor.pkl', 'dinner_predictor.pkl', 'snack_predictor.pkl']
+
+# Catalog size above which --neighbors auto uses the approximate backend
+EXACT_NEIGHBORS_MAX_ROWS = 50000
+
+# Entry points that rebuild everything per call get fewer iterations
+HEAVY_ENTRY_POINTS = {'init', 'compute_neighbors'}
+
+SEXES = ['male', 'female']
+ACTIVITY_LEVELS = ['sedentary', 'light', 'moderate', 'active', 'very_active']
+GOALS = ['lose_weight', 'maintain', 'gain_weight']
+DIET_TYPES = ['Regular', 'Vegetarian', 'Vegan', None]
+MEALS = ['breakfast', 'lunch', 'dinner', 'snack']
+SEASONS = ['spring', 'summer', 'fall', 'winter']
+ALLERGENS = ['Nuts', 'Dairy', 'Gluten', 'Soy', 'Eggs', 'Shellfish', 'Fish']
+
+
+def random_profile(rng, cuisines):
+    """A random user profile over the catalog's cuisines"""
+    meal_cuisines = {}
+    for meal in MEALS:
+        if rng.random() < 0.3:
+            meal_cuisines[meal] = list(rng.choice(cuisines, size=rng.integers(1, 3), replace=False))
+    return {
+        'age': int(rng.integers(18, 80)),
+        'sex': str(rng.choice(SEXES)),
+        'weight_kg': float(rng.uniform(45, 120)),
+        'height_cm': float(rng.uniform(150, 200)),
+        'activity_level': str(rng.choice(ACTIVITY_LEVELS)),
+        'goal': str(rng.choice(GOALS)),
+        'diet_type': DIET_TYPES[rng.integers(len(DIET_TYPES))],
+        'cuisines': meal_cuisines,
+        'allergies': list(rng.choice(ALLERGENS, size=rng.integers(0, 3), replace=False)),
+        'season': str(rng.choice(SEASONS)),
+    }
+
+
+def cycle(args):
+    """Return a function that yields the given argument tuples round-robin"""
+    state = {'i': 0}
+
+    def next_args():
+        value = args[state['i'] % len(args)]
+        state['i'] += 1
+        return value
+
+    return next_args
+
+
+def bench_init(app, rng, case):
+    from diet_recommender import DietRecommendationApp
+    return lambda: DietRecommendationApp(case['csv'], case['models_dir'], neighbor_backend=case['neighbors']), 1
+
+
+def bench_compute_neighbors(app, rng, case):
+    return app._compute_neighbors, len(app.foods)
+
+
+def bench_filter(app, rng, case):
+    cuisines = app.food_df['cuisine_type'].unique()
+    args = cycle([(random_profile(rng, cuisines), str(rng.choice(MEALS))) for _ in range(256)])
+
+    def step():
+        profile, meal = args()
+        app.filter_foods_by_constraints(profile['diet_type'], meal, profile['season'],
+                                        profile['cuisines'].get(meal), profile['allergies'])
+    return step, 1
+
+
+def bench_recommend(app, rng, case):
+    cuisines = app.food_df['cuisine_type'].unique()
+    args = cycle([random_profile(rng, cuisines) for _ in range(256)])
+    return lambda: app.recommend_daily_meals(args()), 1
+
+
+def bench_recommend_cached(app, rng, case):
+    # Repeat-shaped traffic: profiles a few kcal apart, served from the plan cache
+    cuisines = app.food_df['cuisine_type'].unique()
+    profiles = [random_profile(rng, cuisines) for _ in range(64)]
+    args = cycle([dict(profile, weight_kg=profile['weight_kg'] + float(rng.uniform(-0.5, 0.5)))
+                  for profile in profiles for _ in range(4)])
+    app.configure_plan_cache(25)
+    return lambda: app.recommend_daily_meals(args()), 1
+
+
+def bench_recommend_blended(app, rng, case):
+    cuisines = app.food_df['cuisine_type'].unique()
+    args = cycle([random_profile(rng, cuisines) for _ in range(256)])
+    app.configure_ranker('blended')
+    return lambda: app.recommend_daily_meals(args()), 1
+
+
+def bench_recommend_async(app, rng, case):
+    cuisines = app.food_df['cuisine_type'].unique()
+    profiles = [random_profile(rng, cuisines) for _ in range(case['batch_size'])]
+    loop = asyncio.new_event_loop()
+    return lambda: loop.run_until_complete(app.arecommend_many(profiles)), len(profiles)
+
+
+def bench_recommend_batch(app, rng, case):
+    cuisines = app.food_df['cuisine_type'].unique()
+    profiles = [random_profile(rng, cuisines) for _ in range(case['batch_size'])]
+    return lambda: app.recommend_daily_meals_batch(profiles), len(profiles)
+
+
+def bench_weekly(app, rng, case):
+    cuisines = app.food_df['cuisine_type'].unique()
+    args = cycle([random_profile(rng, cuisines) for _ in range(64)])
+    return lambda: app.recommend_weekly_meals(args()), 1
+
+
+def bench_similar(app, rng, case):
+    food_ids = app.food_df['food_id'].to_numpy()
+    args = cycle(rng.choice(food_ids, 256).tolist())
+    return lambda: app.get_similar_foods(args(), 5), 1
+
+
+def bench_seasonal(app, rng, case):
+    cuisines = app.food_df['cuisine_type'].unique()
+    args = cycle([random_profile(rng, cuisines) for _ in range(256)])
+
+    def step():
+        profile = args()
+        meal = str(rng.choice(MEALS))
+        app.get_seasonal_recommendations(profile['diet_type'], meal, profile['cuisines'].get(meal))
+    return step, 1
+
+
+def bench_update(app, rng, case):
+    # Add a batch of copies of existing foods, then remove them again
+    foods = app.foods.frame(rng.choice(len(app.foods), 10, replace=False)).reset_index(drop=True)
+    foods['food_id'] = app.foods.food_id.max() + 1 + np.arange(len(foods))
+    state = {'added': False}
+
+    def step():
+        if state['added']:
+            app.remove_foods(foods['food_id'].tolist())
+        else:
+            app.add_foods(foods)
+        state['added'] = not state['added']
+    return step, len(foods)
+
+
+ENTRY_POINTS = {
+    'init': bench_init,
+    'compute_neighbors': bench_compute_neighbors,
+    'filter': bench_filter,
+    'recommend': bench_recommend,
+    'recommend_cached': bench_recommend_cached,
+    'recommend_blended': bench_recommend_blended,
+    'recommend_async': bench_recommend_async,
+    'recommend_batch': bench_recommend_batch,
+    'weekly': bench_weekly,
+    'similar': bench_similar,
+    'seasonal': bench_seasonal,
+    'update': bench_update,
+}
+
+
+def current_rss_mb():
+    """Resident set size of this process, if available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def reset_peak_rss():
+    """Reset the peak RSS to the current RSS where the kernel supports it (Linux)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, if available"""
+    # VmHWM is per address space, ru_maxrss also covers the process before exec
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def run_case(case):
+    """Run one (size, entry point) case; called in a fresh process"""
+    from diet_recommender import DietRecommendationApp
+
+    rng = np.random.default_rng(case['seed'])
+    app = DietRecommendationApp(case['csv'], case['models_dir'], neighbor_backend=case['neighbors'])
+    step, items = ENTRY_POINTS[case['entry_point']](app, rng, case)
+    setup_rss = current_rss_mb()
+
+    heavy = case['entry_point'] in HEAVY_ENTRY_POINTS
+    for _ in range(min(case['warmup'], 1) if heavy else case['warmup']):
+        step()
+    reset_peak_rss()
+
+    max_iterations = min(case['iterations'], 3) if heavy else case['iterations']
+    deadline = time.perf_counter() + case['max_seconds']
+    times = []
+    while len(times) < max_iterations and (len(times) < 3 or time.perf_counter() < deadline):
+        start = time.perf_counter_ns()
+        step()
+        times.append(time.perf_counter_ns() - start)
+
+    times_ms = np.array(times) / 1e6
+    total_seconds = times_ms.sum() / 1000
+    return {
+        'size': case['size'],
+        'entry_point': case['entry_point'],
+        'neighbors': case['neighbors'],
+        'iterations': len(times),
+        'items_per_call': items,
+        'p50_ms': float(np.percentile(times_ms, 50)),
+        'p90_ms': float(np.percentile(times_ms, 90)),
+        'p99_ms': float(np.percentile(times_ms, 99)),
+        'mean_ms': float(times_ms.mean()),
+        'min_ms': float(times_ms.min()),
+        'max_ms': float(times_ms.max()),
+        'calls_per_second': len(times) / total_seconds if total_seconds else None,
+        'items_per_second': len(times) * items / total_seconds if total_seconds else None,
+        'setup_rss_mb': setup_rss,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def prepare_size(work_dir, size, seed, neighbors):
+    """Generate the catalog for a size and a models directory holding its neighbour table"""
+    csv = catalog_path(work_dir, size, seed)
+    models_dir = os.path.join(work_dir, f"models_{size}_{seed}")
+    os.makedirs(models_dir, exist_ok=True)
+    for name in MODEL_FILES:
+        source = os.path.join(REPO_ROOT, name)
+        target = os.path.join(models_dir, name)
+        if os.path.exists(source) and not os.path.lexists(target):
+            try:
+                os.symlink(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+
+    # Build and cache the neighbour table once, outside the timed cases
+    from diet_recommender import DietRecommendationApp
+    DietRecommendationApp(csv, models_dir, neighbor_backend=neighbors)
+    return csv, models_dir
+
+
+def git_revision():
+    """Current commit and whether the tree has local changes, if in a git checkout"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return {'commit': commit, 'dirty': dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def run(args):
+    entry_points = args.entry_points or list(ENTRY_POINTS)
+    unknown = set(entry_points) - set(ENTRY_POINTS)
+    if unknown:
+        raise SystemExit(f"Unknown entry points: {', '.join(sorted(unknown))}")
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for size in args.sizes:
+        neighbors = args.neighbors
+        if neighbors == 'auto':
+            neighbors = 'exact' if size <= EXACT_NEIGHBORS_MAX_ROWS else 'approximate'
+        print(f"Preparing {size} foods ({neighbors} neighbours)...", flush=True)
+        csv, models_dir = prepare_size(args.work_dir, size, args.seed, neighbors)
+
+        for entry_point in entry_points:
+            case = {
+                'size': size, 'entry_point': entry_point, 'csv': csv, 'models_dir': models_dir,
+                'neighbors': neighbors, 'seed': args.seed, 'iterations': args.iterations,
+                'warmup': args.warmup, 'max_seconds': args.max_seconds, 'batch_size': args.batch_size,
+            }
+            with context.Pool(1) as pool:
+                result = pool.apply(run_case, (case,))
+            results.append(result)
+            print(f"{size:>9} {entry_point:<18} p50 {result['p50_ms']:10.3f} ms  p99 {result['p99_ms']:10.3f} ms  "
+                  f"{result['items_per_second'] or 0:12.1f} items/s  peak {result['peak_rss_mb'] or 0:8.1f} MB",
+                  flush=True)
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git': git_revision(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': {key: value for key, value in vars(args).items() if key != 'func'},
+        },
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.out}")
+
+
+def compare(args):
+    """Print the change of each metric between two result files; exit 1 on regressions"""
+    with open(args.base) as f:
+        base = {(r['size'], r['entry_point']): r for r in json.load(f)['results']}
+    with open(args.head) as f:
+        head = {(r['size'], r['entry_point']): r for r in json.load(f)['results']}
+
+    metrics = ['p50_ms', 'p99_ms', 'peak_rss_mb']
+    regressions = []
+    print(f"{'size':>9} {'entry point':<18}" + ''.join(f" {metric:>20}" for metric in metrics))
+    for key in sorted(base.keys() & head.keys()):
+        cells = []
+        for metric in metrics:
+            old, new = base[key].get(metric), head[key].get(metric)
+            if not old or new is None:
+                cells.append(f" {'n/a':>20}")
+                continue
+            change = new / old - 1
+            flag = ''
+            if change > args.threshold:
+                flag = ' !'
+                regressions.append((key, metric, change))
+            cells.append(f" {f'{old:.3f} -> {new:.3f} {change:+.0%}{flag}':>20}")
+        print(f"{key[0]:>9} {key[1]:<18}" + ''.join(cells))
+
+    for key in sorted(base.keys() ^ head.keys()):
+        print(f"{key[0]:>9} {key[1]:<18} only in {'base' if key in base else 'head'}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="run the benchmarks")
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    run_parser.add_argument('--entry-points', nargs='+', choices=list(ENTRY_POINTS))
+    run_parser.add_argument('--neighbors', choices=['auto', 'exact', 'approximate'], default='auto')
+    run_parser.add_argument('--iterations', type=int, default=200, help="maximum timed calls per case")
+    run_parser.add_argument('--warmup', type=int, default=3)
+    run_parser.add_argument('--max-seconds', type=float, default=10, help="time budget per case")
+    run_parser.add_argument('--batch-size', type=int, default=1000, help="profiles per recommend_batch call")
+    run_parser.add_argument('--work-dir', default=os.path.join(REPO_ROOT, '.bench'),
+                            help="where generated catalogs and neighbour tables are kept")
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--out', default='bench.json')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser('compare', help="compare two result files")
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('head')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help="relative increase reported as a regression")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,228 @@
+"""
+Versioned, memory-mappable artifact bundle for DietRecommendationApp.
+
+A bundle is a directory holding everything the app needs at start-up:
+
+    manifest.json          schema version, content hashes, array names
+    catalog/**/*.npy       the arrays of FoodCatalog.to_arrays: the FoodStore
+                           columns, constraint bitsets, allergen matrix,
+                           neighbour table, feature vectors and ranking arrays
+    catalog.pkl            their layout and the precomputed seasonal lists
+    models/*.pkl           the pickled models, copied unchanged
+
+Arrays are opened with mmap_mode='r' and used as they are, so start-up
+does not parse the CSV or rebuild any index, and worker processes share
+pages through the OS page cache. Only the small string vocabularies,
+which hold Python objects, are read into memory.
+
+Usage:
+    python bundle.py build --csv seasonal_food_database.csv --models ./ --out food_bundle
+    python bundle.py verify food_bundle
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+# Bump when the bundle layout changes in a way old readers cannot handle
+BUNDLE_SCHEMA_VERSION = 2
+
+MANIFEST_NAME = 'manifest.json'
+
+CATALOG_METADATA_NAME = 'catalog.pkl'
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Return the hex SHA-256 digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_bundle(food_data_path, models_dir, bundle_dir, neighbor_backend='exact', neighbor_k=20, workers=1):
+    """
+    Build a bundle from the food CSV and the pickled models.
+
+    The bundle is written to a temporary directory next to bundle_dir and
+    moved into place once complete, replacing any previous bundle.
+
+    Parameters:
+    -----------
+    food_data_path : str
+        Path to the food database CSV file
+    models_dir : str
+        Directory containing the pickled model files
+    bundle_dir : str
+        Output directory
+    neighbor_backend : str
+        'exact' or 'approximate', see neighbors.py
+    neighbor_k : int
+        Number of similar foods stored per food
+    workers : int
+        Processes used to compute an exact neighbour table not yet in models_dir
+
+    Returns:
+    --------
+    dict
+        The bundle manifest
+    """
+    from diet_recommender import DietRecommendationApp
+
+    app = DietRecommendationApp(food_data_path, models_dir,
+                                neighbor_backend=neighbor_backend, neighbor_k=neighbor_k,
+                                neighbor_workers=workers)
+
+    parent = os.path.dirname(os.path.abspath(bundle_dir))
+    staging = tempfile.mkdtemp(prefix='.bundle-', dir=parent)
+    os.makedirs(os.path.join(staging, 'models'))
+
+    # The catalog as the arrays FoodCatalog.from_arrays uses without copying
+    catalog_arrays, catalog_metadata = app.catalog.to_arrays()
+    arrays = {}
+    for name, array in catalog_arrays.items():
+        rel = f'catalog/{name}.npy'
+        os.makedirs(os.path.dirname(os.path.join(staging, rel)), exist_ok=True)
+        np.save(os.path.join(staging, rel), np.ascontiguousarray(array), allow_pickle=array.dtype == object)
+        arrays[name] = rel
+    with open(os.path.join(staging, CATALOG_METADATA_NAME), 'wb') as f:
+        pickle.dump(catalog_metadata, f)
+
+    # Models are copied as they are
+    for name in sorted(os.listdir(models_dir)):
+        if name.endswith('.pkl') and name != 'similarity_matrix.pkl':
+            shutil.copy2(os.path.join(models_dir, name), os.path.join(staging, 'models', name))
+
+    files = {}
+    for root, _, names in os.walk(staging):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, staging).replace(os.sep, '/')
+            files[rel] = {'sha256': file_sha256(path), 'bytes': os.path.getsize(path)}
+
+    manifest = {
+        'schema_version': BUNDLE_SCHEMA_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'source': {
+            'food_data': os.path.basename(food_data_path),
+            'food_data_sha256': file_sha256(food_data_path),
+        },
+        'n_foods': len(app.foods),
+        'arrays': arrays,
+        'neighbors': {'backend': neighbor_backend, 'k': neighbor_k},
+        'files': files,
+    }
+    with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Swap the finished bundle into place
+    if os.path.exists(bundle_dir):
+        old = tempfile.mkdtemp(prefix='.bundle-old-', dir=parent)
+        os.rename(bundle_dir, os.path.join(old, 'bundle'))
+        os.rename(staging, bundle_dir)
+        shutil.rmtree(old)
+    else:
+        os.rename(staging, bundle_dir)
+
+    return manifest
+
+
+class ArtifactBundle:
+    """
+    Read access to a bundle directory written by build_bundle.
+
+    Opening a bundle only reads the manifest; arrays are memory-mapped when
+    the corresponding accessor is called.
+    """
+
+    def __init__(self, bundle_dir, verify=False):
+        """
+        Open a bundle.
+
+        Parameters:
+        -----------
+        bundle_dir : str
+            Bundle directory
+        verify : bool
+            Check every file against its content hash (reads all files)
+        """
+        self.bundle_dir = bundle_dir
+        self.models_dir = os.path.join(bundle_dir, 'models')
+
+        with open(os.path.join(bundle_dir, MANIFEST_NAME)) as f:
+            self.manifest = json.load(f)
+
+        version = self.manifest.get('schema_version')
+        if version != BUNDLE_SCHEMA_VERSION:
+            raise ValueError(f"Unsupported bundle schema version {version} in {bundle_dir}, "
+                             f"expected {BUNDLE_SCHEMA_VERSION}. Rebuild it with 'python bundle.py build'.")
+
+        if verify:
+            self.verify()
+
+    def verify(self):
+        """Raise ValueError if any file is missing or does not match its hash"""
+        for rel, info in self.manifest['files'].items():
+            path = os.path.join(self.bundle_dir, rel)
+            if not os.path.exists(path):
+                raise ValueError(f"Bundle file {rel} is missing")
+            if file_sha256(path) != info['sha256']:
+                raise ValueError(f"Bundle file {rel} does not match its content hash")
+
+    def array(self, rel):
+        """Memory-map one array of the bundle read-only; arrays of Python objects are read into memory"""
+        path = os.path.join(self.bundle_dir, rel)
+        try:
+            return np.load(path, mmap_mode='r')
+        except ValueError:
+            return np.load(path, allow_pickle=True)
+
+    def catalog_arrays(self):
+        """
+        Open the catalog arrays for FoodCatalog.from_arrays.
+
+        Returns:
+        --------
+        tuple
+            (arrays, metadata): the memory-mapped arrays by name, and the
+            layout and seasonal lists
+        """
+        arrays = {name: self.array(rel) for name, rel in self.manifest['arrays'].items()}
+        with open(os.path.join(self.bundle_dir, CATALOG_METADATA_NAME), 'rb') as f:
+            metadata = pickle.load(f)
+        return arrays, metadata
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or verify a DietRecommendationApp artifact bundle")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="build a bundle from the CSV and pickled models")
+    build.add_argument('--csv', default='seasonal_food_database.csv', help="food database CSV")
+    build.add_argument('--models', default='./', help="directory with the pickled models")
+    build.add_argument('--out', default='food_bundle', help="output bundle directory")
+    build.add_argument('--neighbors', default='exact', choices=['exact', 'approximate'])
+    build.add_argument('--k', type=int, default=20, help="similar foods stored per food")
+    build.add_argument('--workers', type=int, default=os.cpu_count(),
+                       help="processes for computing an exact neighbour table")
+
+    verify = commands.add_parser('verify', help="check a bundle against its content hashes")
+    verify.add_argument('bundle', help="bundle directory")
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        manifest = build_bundle(args.csv, args.models, args.out, args.neighbors, args.k, args.workers)
+        total = sum(info['bytes'] for info in manifest['files'].values())
+        print(f"Bundle written to {args.out}: {manifest['n_foods']} foods, "
+              f"{len(manifest['files'])} files, {total / 1e6:.1f} MB")
+    else:
+        ArtifactBundle(args.bundle, verify=True)
+        print(f"Bundle {args.bundle} is valid")
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+
+from instrumentation import NULL_INSTRUMENTATION
+
+
+class ConstraintCache:
+    """
+    Bounded LRU cache with optional time-to-live, keyed on normalized constraints.
+
+    Used for candidate sets and seasonal lists. Entries are evicted when
+    the cache is over max_entries (least recently used first) or when they
+    are older than ttl_seconds. invalidate() drops everything and starts a
+    new generation, so values computed against an older food table are
+    never stored after a reload.
+    """
+
+    # Replaced by the owning app to report lookups
+    instrumentation = NULL_INSTRUMENTATION
+
+    def __init__(self, max_entries=1024, ttl_seconds=None, name='cache'):
+        """
+        Parameters:
+        -----------
+        max_entries : int
+            Maximum number of cached entries
+        ttl_seconds : float, optional
+            Maximum age of an entry, unlimited if None
+        name : str
+            Label of the cache in instrumentation counters
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value for a key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                self.instrumentation.count('cache_lookups', cache=self.name, result='miss')
+                return None
+
+            value, stored_at = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                self.instrumentation.count('cache_lookups', cache=self.name, result='expired')
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.instrumentation.count('cache_lookups', cache=self.name, result='hit')
+            return value
+
+    def put(self, key, value, generation=None):
+        """
+        Store a value.
+
+        If generation is given and the cache has been invalidated since,
+        the value is dropped instead of stored.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for a key, computing and storing it on a miss"""
+        value = self.get(key)
+        if value is None:
+            generation = self.generation
+            value = compute()
+            self.put(key, value, generation)
+        return value
+
+    def invalidate(self):
+        """Drop every entry, e.g. after the food table was reloaded"""
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self):
+        """Return hit, miss, eviction and expiration counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'generation': self.generation,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
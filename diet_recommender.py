@@ -1,17 +1,63 @@
 import pandas as pd
 import numpy as np
 import joblib
-import re
-import json
+import asyncio
+import os
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 
+from bundle import ArtifactBundle, file_sha256
+from cache import ConstraintCache
+from food_catalog import FoodCatalog
+from food_index import ConstraintIndex
+from food_query import QueryEngine
+from food_store import FoodStore
+from instrumentation import NULL_INSTRUMENTATION, traced
+from meal_planner import WeeklyPlanner
+from model_registry import ModelMapping, ModelRegistry
+from neighbors import NeighborTable, build_approximate_neighbors, build_exact_neighbors
+from plan_cache import PlanCache
+from plan_sinks import encode_json
+from scoring import BlendedRanker, FoodScores
+
 class DietRecommendationApp:
     """
     A standalone diet recommendation system that uses pre-trained models
     to provide personalized meal plans based on user profiles.
     """
 
-    def __init__(self, food_data_path, models_dir="./"):
+    # Activity factors applied to the BMR
+    ACTIVITY_FACTORS = {
+        'sedentary': 1.2,      # Little or no exercise
+        'light': 1.375,        # Light exercise 1-3 days/week
+        'moderate': 1.55,      # Moderate exercise 3-5 days/week
+        'active': 1.725,       # Hard exercise 6-7 days/week
+        'very_active': 1.9     # Very hard exercise & physical job or 2x training
+    }
+
+    # Meal distribution (percentage of daily calories)
+    MEAL_DISTRIBUTION = {
+        'breakfast': 0.25,
+        'lunch': 0.35,
+        'dinner': 0.30,
+        'snack': 0.10
+    }
+
+    # Food columns returned by the batch API
+    BATCH_OPTION_COLUMNS = ['food_id', 'food_name', 'calories', 'protein_g', 'fat_g',
+                            'carbs_g', 'diet_type', 'cuisine_type']
+
+    # Candidate rankers, see configure_ranker
+    RANKERS = ('legacy', 'blended')
+
+    # Maximum number of cached candidate sets, and their maximum age in seconds
+    CANDIDATE_CACHE_SIZE = 1024
+    CANDIDATE_CACHE_TTL = None
+
+    def __init__(self, food_data_path, models_dir="./", neighbor_backend="exact", neighbor_k=20,
+                 max_resident_models=None, instrumentation=None, neighbor_workers=1):
         """
         Initialize the recommendation system by loading the food database and model files.
 
@@ -21,58 +67,471 @@ class DietRecommendationApp:
             Path to the food database CSV file
         models_dir : str
             Directory containing the pickled model files
+        neighbor_backend : str
+            How the similar-foods table is built when it is not on disk:
+            'exact' (blocked top-k) or 'approximate' (inverted-file index)
+        neighbor_k : int
+            Number of similar foods stored per food
+        max_resident_models : int, optional
+            Maximum number of model artifacts kept in memory at once
+        instrumentation : Instrumentation, optional
+            Receives timing spans and counters, disabled if None
+        neighbor_workers : int
+            Processes used to compute an exact neighbour table that is not
+            on disk; see build_neighbor_table to build it ahead of start-up
         """
-        # Load the food database
-        self.food_df = pd.read_csv(food_data_path)
-        
-        # Load models and encoders
-        try:
-            self.encoder = joblib.load(f"{models_dir}/food_encoder.pkl")
-            self.scaler = joblib.load(f"{models_dir}/food_scaler.pkl")
-            self.kmeans = joblib.load(f"{models_dir}/food_clusters.pkl")
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
 
-            # Load meal type predictors
-            self.meal_predictors = {}
-            for meal_type in ['breakfast', 'lunch', 'dinner', 'snack']:
-                self.meal_predictors[meal_type] = joblib.load(f"{models_dir}/{meal_type}_predictor.pkl")
-        except FileNotFoundError as e:
-            print(f"Error loading model files: {e}")
-            print("Make sure you've run the training code first to generate the model files.")
-            raise
+        # Load the food database into the compact typed store
+        foods = FoodStore.from_csv(food_data_path)
+
+        # Register models and encoders, they are loaded on first use
+        self._load_models(models_dir, max_resident_models)
 
-        # Load similarity matrix if available, otherwise compute it
+        # Load the nearest-neighbour table if available, otherwise compute it
+        self.neighbor_backend = neighbor_backend
+        self.neighbor_k = neighbor_k
+        self.neighbor_workers = neighbor_workers
+        neighbors_path = self._neighbors_path(models_dir, neighbor_backend)
+        # A table computed from other nutrient values is stale even if the food ids match
+        source_sha256 = file_sha256(food_data_path)
         try:
-            self.similarity_matrix = joblib.load(f"{models_dir}/similarity_matrix.pkl")
-        except FileNotFoundError:
-            self.similarity_matrix = self._compute_similarity_matrix()
-            joblib.dump(self.similarity_matrix, f"{models_dir}/similarity_matrix.pkl")
+            neighbors = NeighborTable.load(neighbors_path, food_ids=foods.food_id, source_sha256=source_sha256)
+        except (FileNotFoundError, ValueError):
+            neighbors = self._compute_neighbors(foods)
+            neighbors.save(neighbors_path, food_ids=foods.food_id, source_sha256=source_sha256)
 
-    def _compute_similarity_matrix(self):
-        """Compute similarity matrix based on nutritional values"""
-        from sklearn.metrics.pairwise import cosine_similarity
+        self._set_catalog(foods, neighbors)
 
-        # Get features that were used for scaling
-        scaler_features = self.scaler.feature_names_in_
+    @classmethod
+    def from_bundle(cls, bundle_dir, verify=False, max_resident_models=None, instrumentation=None):
+        """
+        Initialize the recommendation system from an artifact bundle.
+
+        The catalog (food table, constraint index, neighbour table and
+        ranking arrays) is used directly over the memory-mapped arrays of
+        the bundle, so start-up does not parse the CSV or rebuild any index,
+        and processes opening the same bundle share its pages.
+
+        Parameters:
+        -----------
+        bundle_dir : str
+            Directory written by bundle.build_bundle
+        verify : bool
+            Check every file against the content hashes in the manifest
+        max_resident_models : int, optional
+            Maximum number of model artifacts kept in memory at once
+        instrumentation : Instrumentation, optional
+            Receives timing spans and counters, disabled if None
+        """
+        artifacts = ArtifactBundle(bundle_dir, verify=verify)
+        arrays, metadata = artifacts.catalog_arrays()
+        return cls.from_catalog_arrays(arrays, metadata, artifacts.models_dir,
+                                       neighbor_backend=artifacts.manifest['neighbors']['backend'],
+                                       neighbor_k=artifacts.manifest['neighbors']['k'],
+                                       max_resident_models=max_resident_models,
+                                       instrumentation=instrumentation)
+
+    @classmethod
+    def from_catalog_arrays(cls, arrays, metadata, models_dir="./", neighbor_backend="exact", neighbor_k=20,
+                            max_resident_models=None, instrumentation=None):
+        """
+        Initialize the recommendation system around a catalog exported with FoodCatalog.to_arrays.
+
+        The arrays are used as they are, e.g. read-only views of a shared
+        memory block (see worker_pool.py), so nothing derived from the food
+        table is copied or rebuilt.
+
+        Parameters:
+        -----------
+        arrays : dict
+            Catalog arrays by name
+        metadata : dict
+            Catalog metadata
+        models_dir : str
+            Directory containing the pickled model files
+        neighbor_backend : str
+            Backend the neighbour table was built with
+        neighbor_k : int
+            Number of similar foods stored per food
+        max_resident_models : int, optional
+            Maximum number of model artifacts kept in memory at once
+        instrumentation : Instrumentation, optional
+            Receives timing spans and counters, disabled if None
+        """
+        app = cls.__new__(cls)
+        app.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        app._load_models(models_dir, max_resident_models)
+
+        app.neighbor_backend = neighbor_backend
+        app.neighbor_k = neighbor_k
+        app.neighbor_workers = 1
+        app._init_catalog_state()
+        app.load_catalog_arrays(arrays, metadata)
+        return app
+
+    @classmethod
+    def build_neighbor_table(cls, food_data_path, models_dir="./", neighbor_backend="exact", neighbor_k=20,
+                             workers=1, checkpoint_dir=None, progress=None):
+        """
+        Compute the neighbour table offline and save it where __init__ loads it from.
+
+        Only the food table and the scaler are loaded. An exact table is
+        computed in row chunks across a process pool and can resume from
+        checkpoint_dir after an interruption, see
+        neighbors.build_exact_neighbors.
+
+        Parameters:
+        -----------
+        food_data_path : str
+            Path to the food database CSV file
+        models_dir : str
+            Directory containing the pickled model files; the table is saved there
+        neighbor_backend : str
+            'exact' or 'approximate'
+        neighbor_k : int
+            Number of similar foods stored per food
+        workers : int
+            Number of processes for an exact table
+        checkpoint_dir : str, optional
+            Directory for the finished chunks of an exact table
+        progress : callable, optional
+            Called as progress(rows_done, n_rows)
+
+        Returns:
+        --------
+        str
+            Path of the saved table
+        """
+        app = cls.__new__(cls)
+        app.instrumentation = NULL_INSTRUMENTATION
+        app._load_models(models_dir)
+        app.neighbor_backend = neighbor_backend
+        app.neighbor_k = neighbor_k
+        app.neighbor_workers = workers
+
+        foods = FoodStore.from_csv(food_data_path)
+        neighbors = app._compute_neighbors(foods, checkpoint_dir=checkpoint_dir, progress=progress)
+        neighbors_path = cls._neighbors_path(models_dir, neighbor_backend)
+        neighbors.save(neighbors_path, food_ids=foods.food_id, source_sha256=file_sha256(food_data_path))
+        return neighbors_path
+
+    @staticmethod
+    def _neighbors_path(models_dir, neighbor_backend):
+        return f"{models_dir}/neighbors_{neighbor_backend}.npz"
+
+    def _load_models(self, models_dir, max_resident_models=None):
+        """Register the pickled encoder, scaler, clustering and meal type models"""
+        self.models_dir = models_dir
+        self.models = ModelRegistry(max_resident=max_resident_models)
+        self.models.instrumentation = self.instrumentation
+        self.models.register_file('encoder', f"{models_dir}/food_encoder.pkl")
+        self.models.register_file('scaler', f"{models_dir}/food_scaler.pkl")
+        self.models.register_file('kmeans', f"{models_dir}/food_clusters.pkl")
+
+        # Meal type predictors
+        predictor_names = {}
+        for meal_type in ['breakfast', 'lunch', 'dinner', 'snack']:
+            predictor_names[meal_type] = f"{meal_type}_predictor"
+            self.models.register_file(predictor_names[meal_type], f"{models_dir}/{meal_type}_predictor.pkl")
+        self._meal_predictors = ModelMapping(self.models, predictor_names)
+
+    def set_instrumentation(self, instrumentation):
+        """Replace the instrumentation of the app and of the components it owns"""
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self.models.instrumentation = self.instrumentation
+        self.constraint_index.instrumentation = self.instrumentation
+        self.candidate_cache.instrumentation = self.instrumentation
+        self.query_engine.plans.instrumentation = self.instrumentation
+        if self.plan_cache is not None:
+            self.plan_cache.entries.instrumentation = self.instrumentation
+
+    def configure_plan_cache(self, bucket_kcal=25, exact=True, max_entries=4096, ttl_seconds=None):
+        """
+        Serve recommend_daily_meals options from a cache of calorie buckets.
+
+        Meal calorie targets are quantized into buckets of bucket_kcal and the
+        options of every (constraint key, bucket) are memoized, see PlanCache.
+        With exact=True results are identical to the uncached path; otherwise
+        each option's calorie difference may exceed the exact one by up to
+        bucket_kcal, which plans report under 'plan_cache'. The cache serves
+        the legacy ranker only; blended scores also depend on the macro
+        targets, so the blended ranker bypasses it.
+
+        Parameters:
+        -----------
+        bucket_kcal : float, optional
+            Width of a calorie bucket, None disables the cache
+        exact : bool
+            Return exactly the options of the uncached path
+        max_entries : int
+            Maximum number of cached buckets
+        ttl_seconds : float, optional
+            Maximum age of an entry, unlimited if None
+        """
+        plan_cache = None
+        if bucket_kcal is not None:
+            plan_cache = PlanCache(bucket_kcal, exact, max_entries, ttl_seconds)
+            plan_cache.entries.instrumentation = self.instrumentation
+        self.plan_cache = plan_cache
+        return plan_cache
+
+    def configure_ranker(self, ranker='blended', weights=None, pool_size=20):
+        """
+        Choose how a meal's candidates are ranked.
+
+        'legacy' picks the foods closest to the meal's calorie target.
+        'blended' scores the closest-calorie pool with BlendedRanker, using
+        each food's meal suitability and cluster as predicted by the models.
+        Those are computed for the whole catalog when the blended ranker is
+        first enabled, and for new foods on every update, never per request.
+
+        Parameters:
+        -----------
+        ranker : str
+            'legacy' or 'blended'
+        weights : dict, optional
+            Weights of the blended score, see BlendedRanker.DEFAULT_WEIGHTS
+        pool_size : int
+            Number of candidates scored on each side of a meal's calorie target
+
+        Returns:
+        --------
+        BlendedRanker or None
+            The blended ranker, None for the legacy one
+        """
+        if ranker not in self.RANKERS:
+            raise ValueError(f"Unknown ranker: {ranker}, expected one of {self.RANKERS}")
+
+        with self._update_lock:
+            if ranker == 'legacy':
+                self.ranker = None
+            else:
+                blended = BlendedRanker(weights, pool_size)
+                if self.catalog.scores is None:
+                    self._publish(self.catalog.with_scores(self._food_scores(self.catalog.foods)))
+                self.ranker = blended
+        return self.ranker
+
+    @property
+    def foods(self):
+        """The food table of the current catalog"""
+        return self.catalog.foods
+
+    @property
+    def constraint_index(self):
+        return self.catalog.constraint_index
+
+    @property
+    def neighbors(self):
+        return self.catalog.neighbors
+
+    @property
+    def food_df(self):
+        """The food table as a DataFrame, materialized from the compact store on each access"""
+        return self.catalog.foods.frame()
+
+    @property
+    def encoder(self):
+        return self.models.get('encoder')
+
+    @property
+    def scaler(self):
+        return self.models.get('scaler')
+
+    @property
+    def kmeans(self):
+        return self.models.get('kmeans')
+
+    @property
+    def meal_predictors(self):
+        return self._meal_predictors
+
+    def _init_catalog_state(self):
+        """Create the caches, ranker setting and update lock shared by every catalog version"""
+        self.candidate_cache = ConstraintCache(self.CANDIDATE_CACHE_SIZE, self.CANDIDATE_CACHE_TTL, 'candidates')
+        self.candidate_cache.instrumentation = self.instrumentation
+        self.query_engine = QueryEngine()
+        self.query_engine.plans.instrumentation = self.instrumentation
+        self.plan_cache = None
+        self.ranker = None
+        self._update_lock = threading.Lock()
+
+    def _set_catalog(self, foods, neighbors, constraint_index=None):
+        """Publish a catalog built from scratch for a food table"""
+        if getattr(self, 'candidate_cache', None) is None:
+            self._init_catalog_state()
+        if constraint_index is None:
+            constraint_index = ConstraintIndex.from_store(foods)
+
+        version = self.catalog.version + 1 if getattr(self, 'catalog', None) is not None else 0
+        scores = self._food_scores(foods) if self.ranker is not None else None
+        self._publish(FoodCatalog(foods, constraint_index, neighbors, self.candidate_cache, version, scores))
+
+    def _publish(self, catalog):
+        """Make a catalog visible to new requests; requests already running keep theirs"""
+        catalog.constraint_index.instrumentation = self.instrumentation
+        self.catalog = catalog
+        # Entries are keyed by catalog version, older ones can no longer be hit
+        self.candidate_cache.invalidate()
+        if self.plan_cache is not None:
+            self.plan_cache.invalidate()
+
+    def load_catalog_arrays(self, arrays, metadata):
+        """Publish a catalog exported with FoodCatalog.to_arrays, using its arrays without copying them"""
+        with self._update_lock:
+            self._publish(FoodCatalog.from_arrays(arrays, metadata, self.candidate_cache))
+
+    def reload_food_data(self, food_data_path):
+        """Reload the food database and rebuild everything derived from it"""
+        with self._update_lock:
+            foods = FoodStore.from_csv(food_data_path)
+            self._set_catalog(foods, self._compute_neighbors(foods))
+
+    def _new_foods(self, foods):
+        """Convert new foods to a store with the columns of the catalog"""
+        food_df = foods if isinstance(foods, pd.DataFrame) else pd.DataFrame(list(foods))
+        if 'food_id' not in food_df.columns or food_df['food_id'].isna().any():
+            raise ValueError("Every food needs a food_id")
+        unknown = [column for column in food_df.columns if column not in self.catalog.foods.columns]
+        if unknown:
+            raise ValueError(f"Unknown food columns: {unknown}")
+        food_df = food_df.reindex(columns=self.catalog.foods.columns).reset_index(drop=True)
+
+        # Missing nutrients used as similarity features default to 0, as in _scaled_features,
+        # so a partial food gets no NaN feature vector or model scores
+        features = [column for column in self.scaler.feature_names_in_ if column in food_df.columns]
+        food_df[features] = food_df[features].fillna(0)
+        return FoodStore.from_frame(food_df)
+
+    def add_foods(self, foods):
+        """
+        Add foods to the catalog without reloading it.
 
-        # Check which of those features are in our dataframe
-        valid_cols = [col for col in scaler_features if col in self.food_df.columns]
-        missing_cols = [col for col in scaler_features if col not in self.food_df.columns]
+        The constraint index and food table are extended, only the new foods'
+        similar foods are computed and the existing lists they enter are
+        repaired. Requests already running finish on the previous catalog.
 
-        if missing_cols:
-            # Add missing columns with default values (0)
-            for col in missing_cols:
-                self.food_df[col] = 0
+        Parameters:
+        -----------
+        foods : pandas.DataFrame or list of dict
+            New foods with the columns of the food database; missing
+            nutrients used as similarity features are 0, other missing
+            columns are left empty
+
+        Returns:
+        --------
+        FoodCatalog
+            The published catalog
+        """
+        new_foods = self._new_foods(foods)
+        with self._update_lock:
+            catalog = self.catalog
+            food_ids = new_foods.food_id
+            duplicates = set(food_ids[np.isin(food_ids, catalog.foods.food_id)].tolist())
+            duplicates |= set(pd.Series(food_ids)[pd.Series(food_ids).duplicated()].tolist())
+            if duplicates:
+                raise ValueError(f"Duplicate food ids: {sorted(duplicates)}")
+
+            features = self._scaled_features(new_foods)
+            scores = self._food_scores(new_foods, features) if catalog.scores is not None else None
+            catalog = catalog.added(new_foods, features, self.neighbor_k, scores)
+            self._publish(catalog)
+        return catalog
+
+    def remove_foods(self, food_ids):
+        """
+        Remove foods from the catalog without reloading it.
+
+        Similar-food lists that contained a removed food are recomputed.
+
+        Parameters:
+        -----------
+        food_ids : list
+            Ids of the foods to remove; every food with one of them is removed
+
+        Returns:
+        --------
+        FoodCatalog
+            The published catalog
+        """
+        food_ids = np.asarray(food_ids)
+        with self._update_lock:
+            catalog = self.catalog
+            unknown = food_ids[~np.isin(food_ids, catalog.foods.food_id)]
+            if len(unknown):
+                raise ValueError(f"Unknown food ids: {unknown.tolist()}")
+
+            catalog = catalog.removed(catalog.rows_of(food_ids), self.neighbor_k)
+            self._publish(catalog)
+        return catalog
+
+    def update_food(self, food_id, values):
+        """
+        Change some fields of a food without reloading the catalog.
+
+        Parameters:
+        -----------
+        food_id : int
+            Id of the food
+        values : dict
+            New value of each changed column
+
+        Returns:
+        --------
+        FoodCatalog
+            The published catalog
+        """
+        with self._update_lock:
+            catalog = self.catalog
+            row = catalog.foods.row_of(food_id)
+            if row is None:
+                raise ValueError(f"Unknown food_id: {food_id}")
+            food = catalog.foods.records([row])[0]
+            food.update(values)
+            if food['food_id'] != food_id and catalog.foods.row_of(food['food_id']) is not None:
+                raise ValueError(f"Duplicate food ids: {[food['food_id']]}")
+
+            new_foods = self._new_foods([food])
+            features = self._scaled_features(new_foods)
+            scores = self._food_scores(new_foods, features) if catalog.scores is not None else None
+            catalog = catalog.updated([row], new_foods, features, self.neighbor_k, scores)
+            self._publish(catalog)
+        return catalog
+
+    def _scaled_features(self, foods=None):
+        """Scale the nutritional features of a food store (the catalog's by default) the same way as during training"""
+        foods = self.catalog.foods if foods is None else foods
+
+        # Get features that were used for scaling
+        scaler_features = self.scaler.feature_names_in_
 
-        # Create a dataframe with all the necessary columns in the same order as during training
-        features_df = self.food_df[scaler_features].copy()
+        # Create a dataframe with all the necessary columns in the same order as during training,
+        # features missing from the food table default to 0
+        features_df = pd.DataFrame({
+            col: foods.take(col) if col in foods else np.zeros(len(foods), dtype=np.int64)
+            for col in scaler_features
+        })
 
         # Scale the features
-        features = self.scaler.transform(features_df)
+        return self.scaler.transform(features_df)
 
-        # Compute cosine similarity
-        similarity = cosine_similarity(features)
+    def _food_scores(self, foods, features=None):
+        """Score foods with the meal predictors and clusters for the blended ranker"""
+        if features is None:
+            features = self._scaled_features(foods)
+        return FoodScores.from_models(foods, features, self.scaler.feature_names_in_, self.encoder,
+                                      self.kmeans, self.meal_predictors)
 
-        return similarity
+    @traced('compute_neighbors')
+    def _compute_neighbors(self, foods=None, checkpoint_dir=None, progress=None):
+        """Compute the top-k similar foods of every food based on nutritional values"""
+        features = self._scaled_features(foods)
+
+        if self.neighbor_backend == 'approximate':
+            return build_approximate_neighbors(features, k=self.neighbor_k)
+        return build_exact_neighbors(features, k=self.neighbor_k, workers=self.neighbor_workers,
+                                     checkpoint_dir=checkpoint_dir, progress=progress)
 
     def calculate_bmr(self, age, sex, weight_kg, height_cm, activity_level):
         """Calculate Basal Metabolic Rate using the Mifflin-St Jeor Equation"""
@@ -83,15 +542,7 @@ class DietRecommendationApp:
             bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age - 161
 
         # Apply activity factor
-        activity_factors = {
-            'sedentary': 1.2,      # Little or no exercise
-            'light': 1.375,        # Light exercise 1-3 days/week
-            'moderate': 1.55,      # Moderate exercise 3-5 days/week
-            'active': 1.725,       # Hard exercise 6-7 days/week
-            'very_active': 1.9     # Very hard exercise & physical job or 2x training
-        }
-
-        factor = activity_factors.get(activity_level.lower(), 1.2)
+        factor = self.ACTIVITY_FACTORS.get(activity_level.lower(), 1.2)
         tdee = bmr * factor
 
         return {
@@ -149,155 +600,74 @@ class DietRecommendationApp:
             'carbs_g': round(carb_target)
         }
 
+    @traced('filter_foods_by_constraints')
     def filter_foods_by_constraints(self, diet_type, meal_type, season, cuisines=None, allergens=None):
         """Filter foods based on user constraints with error handling and fallbacks"""
-        # Start with all foods
-        filtered_df = self.food_df.copy()
-
-        # Filter by diet type if specified
-        if diet_type:
-            diet_mask = filtered_df['diet_type'] == diet_type
-            if diet_mask.sum() > 0:
-                filtered_df = filtered_df[diet_mask]
-            else:
-                # Try case-insensitive match
-                diet_mask = filtered_df['diet_type'].str.lower() == diet_type.lower()
-                if diet_mask.sum() > 0:
-                    filtered_df = filtered_df[diet_mask]
-
-        # Filter by meal type if specified
-        if meal_type:
-            column = f'suitable_{meal_type.lower()}'
-            if column in filtered_df.columns:
-                meal_mask = filtered_df[column] == 1
-                if meal_mask.sum() > 0:
-                    filtered_df = filtered_df[meal_mask]
-
-        # Filter by season if specified
-        if season and season in filtered_df.columns:
-            season_mask = filtered_df[season] == 1
-            if season_mask.sum() > 0:
-                filtered_df = filtered_df[season_mask]
-
-        # Filter by cuisine type if specified
-        if cuisines and len(cuisines) > 0 and 'cuisine_type' in filtered_df.columns:
-            cuisine_mask = filtered_df['cuisine_type'].isin(cuisines)
-            if cuisine_mask.sum() > 0:
-                filtered_df = filtered_df[cuisine_mask]
-
-        # Filter by allergens if specified
-        if allergens and len(allergens) > 0 and 'allergens' in filtered_df.columns:
-            for allergen in allergens:
-                if not allergen or allergen.strip() == '':
-                    continue
-
-                # Check if allergens column is string type
-                if filtered_df['allergens'].dtype == 'object':
-                    allergen_mask = filtered_df['allergens'].notna() & filtered_df['allergens'].str.contains(
-                        re.escape(allergen.strip()), case=False, na=False)
-                    filtered_df = filtered_df[~allergen_mask]
-
-        # If no foods remain after filtering, implement fallback strategy
-        if len(filtered_df) == 0:
-            # Fallback 1: Try without cuisine constraint
-            if cuisines and len(cuisines) > 0:
-                fallback_df = self.filter_foods_by_constraints(
-                    diet_type=diet_type,
-                    meal_type=meal_type,
-                    season=season,
-                    cuisines=None,
-                    allergens=allergens
-                )
-                if len(fallback_df) > 0:
-                    return fallback_df
-
-            # Fallback 2: Try without meal type constraint
-            if meal_type:
-                fallback_df = self.filter_foods_by_constraints(
-                    diet_type=diet_type,
-                    meal_type=None,
-                    season=season,
-                    cuisines=cuisines,
-                    allergens=allergens
-                )
-                if len(fallback_df) > 0:
-                    return fallback_df
-
-            # Fallback 3: Try without season constraint
-            if season:
-                fallback_df = self.filter_foods_by_constraints(
-                    diet_type=diet_type,
-                    meal_type=meal_type,
-                    season=None,
-                    cuisines=cuisines,
-                    allergens=allergens
-                )
-                if len(fallback_df) > 0:
-                    return fallback_df
-
-            # Fallback 4: Try with just diet type and allergens
-            if diet_type and allergens:
-                fallback_df = self.food_df.copy()
-
-                # Apply diet type filter
-                diet_mask = fallback_df['diet_type'] == diet_type
-                fallback_df = fallback_df[diet_mask]
-
-                # Apply allergen filter
-                if 'allergens' in fallback_df.columns:
-                    for allergen in allergens:
-                        if allergen.strip() == '':
-                            continue
-                        allergen_mask = fallback_df['allergens'].notna() & fallback_df['allergens'].str.contains(
-                            re.escape(allergen), case=False, na=False)
-                        fallback_df = fallback_df[~allergen_mask]
+        catalog = self.catalog
+        rows = catalog.constraint_index.candidate_rows(
+            diet_type=diet_type,
+            meal_type=meal_type,
+            season=season,
+            cuisines=cuisines,
+            allergens=allergens
+        )
 
-                if len(fallback_df) > 0:
-                    return fallback_df
+        return catalog.foods.frame(rows)
 
-            # Final fallback: Return any foods that don't contain allergens
-            fallback_df = self.food_df.copy()
+    @traced('query_foods')
+    def query_foods(self, query):
+        """
+        Find foods with a declarative query.
 
-            if allergens and 'allergens' in fallback_df.columns:
-                for allergen in allergens:
-                    if allergen.strip() == '':
-                        continue
-                    allergen_mask = fallback_df['allergens'].notna() & fallback_df['allergens'].str.contains(
-                        re.escape(allergen), case=False, na=False)
-                    fallback_df = fallback_df[~allergen_mask]
+        Queries combine ranges on numeric columns, value lists, allergen
+        exclusion, a sort column and a limit, e.g.
 
-            if len(fallback_df) > 0:
-                return fallback_df.head(10)  # Return at least some options
+            {"where": {"protein_g": {"min": 20}, "calories": {"max": 400},
+                       "sodium_mg": {"max": 300}},
+             "exclude_allergens": ["dairy"], "sort": "-protein_g", "limit": 10}
 
-            # If all else fails, return the first 10 items from the original database
-            return self.food_df.sample(min(10, len(self.food_df)))
+        See food_query.py for the full syntax. Each query shape is compiled
+        once and runs over the catalog's bitsets and sorted column indexes.
 
-        return filtered_df
+        Parameters:
+        -----------
+        query : dict
+            The query
+
+        Returns:
+        --------
+        dict
+            'total' number of matching foods and 'foods' the records of the
+            first 'limit' of them
+
+        Raises:
+        -------
+        ValueError
+            If the query is malformed or names an unknown column
+        """
+        return self.query_engine.run(self.catalog, query)
 
+    @traced('get_similar_foods')
     def get_similar_foods(self, food_id, top_n=5):
-        """Find similar foods based on similarity matrix"""
+        """Find similar foods based on the precomputed neighbour table"""
         # Get index of the food
-        food_indices = self.food_df.index[self.food_df['food_id'] == food_id].tolist()
+        catalog = self.catalog
+        idx = catalog.foods.row_of(food_id)
 
-        if not food_indices:
+        if idx is None:
             return []
 
-        idx = food_indices[0]
-
-        # Get similarity scores
-        similarity_scores = list(enumerate(self.similarity_matrix[idx]))
-
-        # Sort by similarity (exclude itself)
-        similarity_scores = sorted(similarity_scores, key=lambda x: x[1], reverse=True)[1:top_n+1]
+        # Get the most similar foods (excluding itself)
+        rows, scores = catalog.neighbors.query(idx, top_n)
 
         # Get food details
+        foods = catalog.foods.records(rows, ['food_id', 'food_name', 'calories', 'protein_g', 'diet_type'])
         similar_foods = []
-        for i, score in similarity_scores:
-            food = self.food_df.iloc[i]
+        for food, score in zip(foods, scores):
             similar_foods.append({
                 'food_id': food['food_id'],
                 'food_name': food['food_name'],
-                'similarity': score,
+                'similarity': float(score),
                 'calories': food['calories'],
                 'protein_g': food['protein_g'],
                 'diet_type': food['diet_type']
@@ -320,8 +690,20 @@ class DietRecommendationApp:
         else:
             return 'winter'
 
+    @traced('recommend_daily_meals')
     def recommend_daily_meals(self, user_profile):
         """Generate complete meal recommendations for a day"""
+        request = self._daily_request(user_profile)
+
+        # Generate recommendations for each meal
+        daily_meals = {}
+        for meal in self.MEAL_DISTRIBUTION:
+            daily_meals[meal] = self._recommend_meal(request, meal)
+
+        return self._daily_plan(request, daily_meals)
+
+    def _daily_request(self, user_profile):
+        """Resolve the targets, constraints and catalog shared by the meals of a daily plan"""
         # Calculate targets
         targets = self.get_user_calorie_targets(user_profile)
 
@@ -330,107 +712,476 @@ class DietRecommendationApp:
         if not season:
             season = self.determine_current_season()
 
-        # Meal distribution (percentage of daily calories)
-        meal_distribution = {
-            'breakfast': 0.25,
-            'lunch': 0.35,
-            'dinner': 0.30,
-            'snack': 0.10
+        catalog = self.catalog
+        # Catalogs published before the blended ranker was enabled have no scores
+        ranker = self.ranker if catalog.scores is not None else None
+
+        return {
+            'profile': user_profile,
+            'targets': targets,
+            'season': season,
+            'allergens': user_profile.get('allergies', []),
+            'diet_type': user_profile.get('diet_type', None),
+            'cuisines': user_profile.get('cuisines', {}),
+            'catalog': catalog,
+            'ranker': ranker,
+            'plan_cache': self.plan_cache if ranker is None else None,
+        }
+
+    def _recommend_meal(self, request, meal):
+        """Recommend the options of one meal of a daily plan"""
+        targets = request['targets']
+        catalog = request['catalog']
+        ranker = request['ranker']
+        plan_cache = request['plan_cache']
+        diet_type = request['diet_type']
+        season = request['season']
+        allergens = request['allergens']
+
+        percentage = self.MEAL_DISTRIBUTION[meal]
+        meal_calories = targets['daily_calories'] * percentage
+
+        # Get cuisines specific to this meal if available
+        meal_cuisines = request['cuisines'].get(meal, None)
+
+        # Find suitable foods
+        with self.instrumentation.span('candidates', meal=meal):
+            candidates = catalog.candidate_set(
+                diet_type=diet_type,
+                meal_type=meal,
+                season=season,
+                cuisines=meal_cuisines,
+                allergens=allergens
+            )
+
+        if len(candidates) == 0:
+            return {"error": f"No suitable {meal} options found with your constraints"}
+
+        # Take the top 3 options closest to the target calories
+        if plan_cache is not None:
+            with self.instrumentation.span('plan_cache', meal=meal):
+                key = catalog.constraint_index.constraint_key(diet_type, meal, season, meal_cuisines, allergens)
+                top_options = plan_cache.options(catalog, candidates, key, meal_calories, 3)
+        else:
+            with self.instrumentation.span('select', meal=meal):
+                if ranker is not None:
+                    macro_targets = [targets[key] * percentage for key in ('protein_g', 'fat_g', 'carbs_g')]
+                    top_rows, top_diffs = ranker.rank_one(catalog, candidates, meal, meal_calories, macro_targets, 3)
+                else:
+                    top_rows, top_diffs = candidates.nearest(meal_calories, 3)
+            with self.instrumentation.span('materialize', meal=meal):
+                top_options = catalog.foods.records(top_rows)
+                for option, diff in zip(top_options, top_diffs):
+                    option['calorie_diff'] = float(diff)
+
+        meal_plan = {
+            'target_calories': round(meal_calories),
+            'options': top_options
+        }
+        if candidates.relaxed:
+            # Constraints the options do not satisfy, so clients can explain them
+            meal_plan['relaxed_constraints'] = list(candidates.relaxed)
+        return meal_plan
+
+    @staticmethod
+    def _daily_plan(request, daily_meals):
+        """Assemble a daily plan from its meals"""
+        plan = {
+            'daily_targets': request['targets'],
+            'current_season': request['season'],
+            'meals': daily_meals
         }
+        plan_cache = request['plan_cache']
+        if plan_cache is not None and not plan_cache.exact:
+            # Options were chosen for the centre of the target's calorie bucket
+            plan['plan_cache'] = {'bucket_kcal': plan_cache.bucket_kcal,
+                                  'max_calorie_deviation': plan_cache.max_deviation}
+        unmatched = request['catalog'].constraint_index.unmatched_allergens(request['allergens'])
+        if unmatched:
+            # Allergies no food is known to contain; nothing was excluded for them
+            plan['unmatched_allergens'] = unmatched
+        return plan
+
+    def configure_async(self, executor=None, max_concurrency=None):
+        """
+        Set where the async API runs its work.
 
-        allergens = user_profile.get('allergies', [])
-        diet_type = user_profile.get('diet_type', None)
-        cuisines = user_profile.get('cuisines', {})
+        Parameters:
+        -----------
+        executor : concurrent.futures.Executor, optional
+            Runs one meal per task. Defaults to a thread pool owned by the
+            app; a process pool must come from process_executor()
+        max_concurrency : int, optional
+            Maximum number of meal tasks submitted at once across all
+            requests, defaults to twice the executor's worker count.
+            Further tasks wait without blocking the event loop.
+        """
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4),
+                                          thread_name_prefix='recommender-async')
+        if max_concurrency is None:
+            max_concurrency = 2 * getattr(executor, '_max_workers', 4)
+
+        self.async_executor = executor
+        self.async_max_concurrency = max_concurrency
+        # One semaphore per event loop, as asyncio primitives cannot be shared between loops
+        self._async_slots = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def process_executor(cls, max_workers=None, bundle_dir=None, food_data_path=None, models_dir="./"):
+        """
+        Create a process pool for configure_async whose workers each load the app once.
+
+        Workers load from bundle_dir if given (sharing its memory-mapped
+        arrays), otherwise from food_data_path and models_dir. They keep
+        the catalog they loaded; updates made in the parent process are not
+        seen by them.
+        """
+        return ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker_app,
+                                   initargs=(cls, bundle_dir, food_data_path, models_dir))
+
+    async def arecommend_daily_meals(self, user_profile, timeout=None):
+        """
+        Async version of recommend_daily_meals, planning the meals concurrently.
+
+        Each meal runs as a separate task on the async executor (see
+        configure_async), so the event loop is never blocked. A meal that
+        fails or is not done within timeout seconds gets an "error" entry
+        instead of options, and the other meals are still returned.
+        Cancelling the call cancels the meals not started yet.
+
+        Parameters:
+        -----------
+        user_profile : dict
+            Same profile as for recommend_daily_meals
+        timeout : float, optional
+            Deadline for the whole plan in seconds, unlimited if None
+
+        Returns:
+        --------
+        dict
+            The plan, in the shape of recommend_daily_meals
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        return await self._arecommend(user_profile, deadline)
+
+    async def arecommend_many(self, user_profiles, timeout=None):
+        """
+        Plan many users concurrently, see arecommend_daily_meals.
+
+        All meals of all users share the concurrency limit of the async
+        executor. A profile that cannot be planned at all, e.g. because a
+        required field is missing, gets {"error": ...} instead of a plan.
+
+        Parameters:
+        -----------
+        user_profiles : list of dict
+            One profile per user
+        timeout : float, optional
+            Deadline of every plan in seconds from the call, unlimited if None
+
+        Returns:
+        --------
+        list of dict
+            One plan per profile, in order
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        return await asyncio.gather(*[self._arecommend(profile, deadline, catch=True) for profile in user_profiles])
+
+    async def _arecommend(self, user_profile, deadline, catch=False):
+        """Plan the meals of one profile as concurrent tasks, collecting errors per meal"""
+        if getattr(self, 'async_executor', None) is None:
+            self.configure_async()
+
+        try:
+            request = self._daily_request(user_profile)
+        except Exception as e:
+            if not catch:
+                raise
+            return {"error": f"Invalid user profile: {e!r}"}
+
+        if isinstance(self.async_executor, ProcessPoolExecutor):
+            # Workers resolve their own copy of the request; the season is fixed here
+            profile = dict(user_profile, season=request['season'])
+            calls = {meal: (_recommend_meal_in_worker, profile, meal) for meal in self.MEAL_DISTRIBUTION}
+        else:
+            calls = {meal: (self._recommend_meal, request, meal) for meal in self.MEAL_DISTRIBUTION}
+
+        loop = asyncio.get_running_loop()
+        tasks = {meal: loop.create_task(self._run_async(*call)) for meal, call in calls.items()}
+        try:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            _, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+        except asyncio.CancelledError:
+            for task in tasks.values():
+                task.cancel()
+            raise
 
         daily_meals = {}
+        for meal, task in tasks.items():
+            if task in pending:
+                task.cancel()
+                daily_meals[meal] = {"error": f"Planning {meal} did not finish before the deadline"}
+            elif task.exception() is not None:
+                daily_meals[meal] = {"error": f"Planning {meal} failed: {task.exception()!r}"}
+            else:
+                daily_meals[meal] = task.result()
 
-        # Generate recommendations for each meal
-        for meal, percentage in meal_distribution.items():
-            meal_calories = targets['daily_calories'] * percentage
+        return self._daily_plan(request, daily_meals)
+
+    async def _run_async(self, func, *args):
+        """Run one call on the async executor within the concurrency limit"""
+        loop = asyncio.get_running_loop()
+        slots = self._async_slots.get(loop)
+        if slots is None:
+            slots = self._async_slots[loop] = asyncio.Semaphore(self.async_max_concurrency)
+
+        await slots.acquire()
+        try:
+            future = self.async_executor.submit(func, *args)
+        except BaseException:
+            slots.release()
+            raise
+        def release(_):
+            # The slot is held until the call really ends, also when the caller stops waiting for it
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(slots.release)
+
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    def weekly_planner(self, user_profile, days=7, **options):
+        """
+        Create a multi-day planner for a user profile.
+
+        The planner keeps its state, so single meals can be swapped and
+        re-planned incrementally with WeeklyPlanner.swap().
+        See WeeklyPlanner for the options.
+        """
+        return WeeklyPlanner(self, user_profile, days, **options).solve()
+
+    @traced('recommend_weekly_meals')
+    def recommend_weekly_meals(self, user_profile, days=7, **options):
+        """Generate one food per meal for several days, balancing macros and variety"""
+        return self.weekly_planner(user_profile, days, **options).plan()
+
+    def _profiles_frame(self, profiles):
+        """Convert a batch of user profiles to a DataFrame"""
+        if isinstance(profiles, pd.DataFrame):
+            return profiles
+        if hasattr(profiles, 'to_pandas'):  # pyarrow.Table
+            return profiles.to_pandas()
+        return pd.DataFrame(list(profiles))
+
+    @staticmethod
+    def _profile_field(profiles, column, default=None):
+        """Read an optional profile column, replacing missing values with a default"""
+        if column not in profiles.columns:
+            return [default] * len(profiles)
+
+        values = []
+        for value in profiles[column].tolist():
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                value = default
+            values.append(value)
+        return values
+
+    def get_user_calorie_targets_batch(self, profiles):
+        """Calculate calorie and macronutrient targets for a table of user profiles"""
+        profiles = self._profiles_frame(profiles)
+
+        age = profiles['age'].to_numpy(dtype=float)
+        weight_kg = profiles['weight_kg'].to_numpy(dtype=float)
+        height_cm = profiles['height_cm'].to_numpy(dtype=float)
+        male = profiles['sex'].str.lower().to_numpy() == 'male'
+        factor = profiles['activity_level'].str.lower().map(self.ACTIVITY_FACTORS).fillna(1.2).to_numpy(dtype=float)
+        goal = profiles['goal'].to_numpy()
+
+        # Mifflin-St Jeor Equation with activity factor
+        bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age
+        bmr = np.where(male, bmr + 5, bmr - 161)
+        tdee = bmr * factor
 
-            # Get cuisines specific to this meal if available
-            meal_cuisines = cuisines.get(meal, None)
+        # Set targets based on goal
+        calorie_target = np.where(goal == 'lose_weight', np.round(tdee * 0.8),
+                                  np.where(goal == 'gain_weight', np.round(tdee * 1.15), np.round(tdee)))
+
+        # Calculate macronutrient targets
+        protein_target = weight_kg * 1.6
+        fat_target = (calorie_target * 0.25) / 9
+        carb_target = (calorie_target - (protein_target * 4 + fat_target * 9)) / 4
+
+        return pd.DataFrame({
+            'bmr': np.round(bmr).astype(np.int64),
+            'tdee': np.round(tdee).astype(np.int64),
+            'daily_calories': calorie_target.astype(np.int64),
+            'protein_g': np.round(protein_target).astype(np.int64),
+            'fat_g': np.round(fat_target).astype(np.int64),
+            'carbs_g': np.round(carb_target).astype(np.int64)
+        }, index=profiles.index)
+
+    @traced('recommend_daily_meals_batch')
+    def recommend_daily_meals_batch(self, profiles, top_k=3, option_columns=None):
+        """
+        Generate meal recommendations for many user profiles at once.
 
-            # Filter suitable foods
-            suitable_foods = self.filter_foods_by_constraints(
+        Profiles sharing the same constraints for a meal (diet type, season,
+        cuisines and allergens) are grouped so that each distinct candidate
+        set is filtered once, and the closest-calorie options for the whole
+        group are selected in one vectorized step.
+
+        Parameters:
+        -----------
+        profiles : pandas.DataFrame, pyarrow.Table or list of dict
+            One user profile per row, with the same fields as recommend_daily_meals
+        top_k : int
+            Number of options returned per meal
+        option_columns : list, optional
+            Food columns copied into the result, defaults to BATCH_OPTION_COLUMNS
+
+        Returns:
+        --------
+        dict
+            'daily_targets': DataFrame with one row per profile;
+            'meals': DataFrame with one row per (profile, meal, rank); its
+            relaxed_constraints column names the constraints relaxed to
+            find the meal's options, as in recommend_daily_meals
+        """
+        profiles = self._profiles_frame(profiles)
+        if option_columns is None:
+            option_columns = self.BATCH_OPTION_COLUMNS
+
+        targets = self.get_user_calorie_targets_batch(profiles)
+        daily_calories = targets['daily_calories'].to_numpy(dtype=float)
+        daily_macros = targets[['protein_g', 'fat_g', 'carbs_g']].to_numpy(dtype=float)
+
+        # Determine current season where not specified
+        current_season = self.determine_current_season()
+        seasons = [season or current_season for season in self._profile_field(profiles, 'season')]
+        targets['season'] = seasons
+
+        diet_types = self._profile_field(profiles, 'diet_type')
+        cuisines = self._profile_field(profiles, 'cuisines', {})
+        allergies = self._profile_field(profiles, 'allergies', [])
+
+        # Group (profile, meal) pairs by normalized constraint key
+        catalog = self.catalog
+        ranker = self.ranker if catalog.scores is not None else None
+        groups = {}
+        for i in range(len(profiles)):
+            for meal in self.MEAL_DISTRIBUTION:
+                meal_cuisines = (cuisines[i] or {}).get(meal, None)
+                key = catalog.constraint_index.constraint_key(
+                    diet_types[i], meal, seasons[i], meal_cuisines, allergies[i])
+                if key not in groups:
+                    groups[key] = (meal_cuisines, allergies[i], [])
+                groups[key][2].append(i)
+
+        profile_pos, meal_names, ranks, option_rows, option_diffs, meal_targets = [], [], [], [], [], []
+        relaxed = []
+        for (diet_type, meal, season, _, _), (meal_cuisines, meal_allergens, positions) in groups.items():
+            candidates = catalog.candidate_set(
                 diet_type=diet_type,
                 meal_type=meal,
                 season=season,
                 cuisines=meal_cuisines,
-                allergens=allergens
+                allergens=meal_allergens
             )
 
-            if len(suitable_foods) == 0:
-                daily_meals[meal] = {"error": f"No suitable {meal} options found with your constraints"}
-                continue
-
-            # Sort by how close they are to the target calories
-            suitable_foods['calorie_diff'] = abs(suitable_foods['calories'] - meal_calories)
-            suitable_foods = suitable_foods.sort_values('calorie_diff')
-
-            # Take top 3 options
-            top_options = suitable_foods.head(3).to_dict('records')
-
-            daily_meals[meal] = {
-                'target_calories': round(meal_calories),
-                'options': top_options
-            }
+            positions = np.asarray(positions)
+            meal_calories = daily_calories[positions] * self.MEAL_DISTRIBUTION[meal]
+            if ranker is not None:
+                top_rows, top_diffs = ranker.rank(catalog, candidates, meal, meal_calories,
+                                                  daily_macros[positions] * self.MEAL_DISTRIBUTION[meal], top_k)
+            else:
+                top_rows, top_diffs = candidates.nearest_batch(meal_calories, top_k)
+
+            k = top_rows.shape[1]
+            profile_pos.append(np.repeat(positions, k))
+            meal_names.append(np.full(len(positions) * k, meal, dtype=object))
+            ranks.append(np.tile(np.arange(1, k + 1), len(positions)))
+            option_rows.append(top_rows.ravel())
+            option_diffs.append(top_diffs.ravel())
+            meal_targets.append(np.repeat(np.round(meal_calories).astype(np.int64), k))
+            relaxed.extend([tuple(candidates.relaxed)] * (len(positions) * k))
+
+        if groups:
+            profile_pos = np.concatenate(profile_pos)
+            meal_names = np.concatenate(meal_names)
+            ranks = np.concatenate(ranks)
+            option_rows = np.concatenate(option_rows)
+            option_diffs = np.concatenate(option_diffs)
+            meal_targets = np.concatenate(meal_targets)
+        else:
+            profile_pos = ranks = option_rows = meal_targets = np.empty(0, dtype=np.int64)
+            meal_names = np.empty(0, dtype=object)
+            option_diffs = np.empty(0)
+
+        # Order by profile, meal and rank
+        meal_order = {meal: i for i, meal in enumerate(self.MEAL_DISTRIBUTION)}
+        meal_codes = np.array([meal_order[meal] for meal in meal_names], dtype=np.int64)
+        order = np.lexsort((ranks, meal_codes, profile_pos))
+
+        meals = catalog.foods.frame(option_rows[order], option_columns).reset_index(drop=True)
+        meals.insert(0, 'profile', profiles.index[profile_pos[order]])
+        meals.insert(1, 'meal', meal_names[order])
+        meals.insert(2, 'rank', ranks[order])
+        meals.insert(3, 'target_calories', meal_targets[order])
+        meals['calorie_diff'] = option_diffs[order]
+        meals['relaxed_constraints'] = pd.Series([relaxed[i] for i in order.tolist()], dtype=object)
 
         return {
             'daily_targets': targets,
-            'current_season': season,
-            'meals': daily_meals
+            'meals': meals
         }
-    
+
+    @traced('get_seasonal_recommendations')
     def get_seasonal_recommendations(self, diet_type=None, meal_type=None, cuisines=None):
         """Get food recommendations for the current season"""
         season = self.determine_current_season()
-        
-        filtered_foods = self.filter_foods_by_constraints(
-            diet_type=diet_type,
-            meal_type=meal_type,
-            season=season,
-            cuisines=cuisines
-        )
-        
-        # Sort by nutritional value (protein to calorie ratio as an example)
-        if 'protein_g' in filtered_foods.columns and 'calories' in filtered_foods.columns:
-            filtered_foods['protein_ratio'] = filtered_foods['protein_g'] / filtered_foods['calories'].replace(0, 1)
-            filtered_foods = filtered_foods.sort_values('protein_ratio', ascending=False)
-        
+
+        catalog = self.catalog
+        rows, protein_ratio = catalog.seasonal_top(season, diet_type, meal_type, cuisines)
+
+        foods = catalog.foods.records(rows)
+        for food, ratio in zip(foods, protein_ratio):
+            food['protein_ratio'] = float(ratio)
+
         return {
             'season': season,
-            'foods': filtered_foods.head(10).to_dict('records')
+            'foods': foods
         }
 
+    @traced('save_meal_plan')
     def save_meal_plan(self, meal_plan, filename=None):
         """Save a meal plan to a JSON file"""
         if filename is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"meal_plan_{timestamp}.json"
 
-        # Convert to serializable format
-        serializable_plan = self._make_serializable(meal_plan)
-
-        with open(filename, 'w') as f:
-            json.dump(serializable_plan, f, indent=2)
+        # NumPy values are encoded in place, see plan_sinks.encode_json
+        with open(filename, 'wb') as f:
+            f.write(encode_json(meal_plan, indent=True))
 
         return filename
 
-    def _make_serializable(self, obj):
-        """Convert numpy types to Python native types for JSON serialization"""
-        if isinstance(obj, dict):
-            return {key: self._make_serializable(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [self._make_serializable(item) for item in obj]
-        elif isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        else:
-            return obj
+
+# App of a process_executor worker
+_worker_app = None
+
+
+def _init_worker_app(app_class, bundle_dir, food_data_path, models_dir):
+    global _worker_app
+    if bundle_dir is not None:
+        _worker_app = app_class.from_bundle(bundle_dir)
+    else:
+        _worker_app = app_class(food_data_path, models_dir)
+
+
+def _recommend_meal_in_worker(user_profile, meal):
+    return _worker_app._recommend_meal(_worker_app._daily_request(user_profile), meal)
 
 
 # Usage with dynamic user input
@@ -0,0 +1,263 @@
+import numpy as np
+import pandas as pd
+
+from food_index import ConstraintIndex, SortedCalories, SortedColumn
+from food_store import FoodStore
+from meal_planner import WeeklyPlanner
+from neighbors import NeighborTable
+from scoring import FoodScores
+
+
+class FoodCatalog:
+    """
+    One immutable version of the food table and everything derived from it.
+
+    Holds the FoodStore, its constraint index, neighbour table, the exact
+    calorie and nutrient arrays used for ranking, the precomputed
+    seasonal lists and, for the blended ranker, the model scores.
+
+    Updates never modify a published catalog: added(), removed() and
+    updated() return a new catalog, sharing the parts that did not
+    change. The app publishes it with a single attribute assignment, so a
+    request that reads app.catalog once sees a consistent version for its
+    whole duration, even while the catalog is being updated.
+    """
+
+    # Number of foods in a seasonal recommendation list
+    SEASONAL_TOP_N = 10
+
+    def __init__(self, foods, constraint_index, neighbors, candidate_cache, version=0, scores=None):
+        """
+        Parameters:
+        -----------
+        foods : FoodStore
+            The food table
+        constraint_index : ConstraintIndex
+            Index over the same rows as foods
+        neighbors : NeighborTable
+            Similar-foods table over the same rows as foods
+        candidate_cache : ConstraintCache
+            Cache shared by every version; entries are keyed by version
+        version : int
+            Increases with every published catalog
+        scores : FoodScores, optional
+            Model scores over the same rows as foods
+        """
+        self.foods = foods
+        self.constraint_index = constraint_index
+        self.neighbors = neighbors
+        self.candidate_cache = candidate_cache
+        self.version = version
+        self.scores = scores
+
+        # Hot numeric columns are restored to their exact float64 values once,
+        # so rankings and totals match the CSV values
+        self.calories = foods.take('calories').astype(float)
+        self.protein = foods.take('protein_g').astype(float)
+        self.nutrients = np.column_stack([foods.take(column).astype(float) for column in WeeklyPlanner.NUTRIENTS])
+        self.cuisine_codes = pd.factorize(foods.take('cuisine_type'))[0]
+
+        # Sorted indexes of numeric columns for range queries, built on first use
+        self._sorted_columns = {}
+        self._precompute_seasonal()
+
+    def __len__(self):
+        return len(self.foods)
+
+    def to_arrays(self):
+        """
+        Export the catalog as plain arrays, e.g. to place them in shared memory.
+
+        Besides the food table, constraint index, neighbour table and
+        scores, the arrays hold the ranking arrays computed from the table,
+        so from_arrays does not compute anything per copy.
+
+        Returns:
+        --------
+        tuple
+            (arrays, metadata): arrays named '<part>/<name>', and the
+            layout, version and seasonal lists needed by from_arrays
+        """
+        food_arrays, food_metadata = self.foods.to_arrays()
+        index_arrays, index_metadata = self.constraint_index.to_arrays()
+        arrays = {f'foods/{name}': array for name, array in food_arrays.items()}
+        arrays.update({f'index/{name}': array for name, array in index_arrays.items()})
+        arrays['neighbors/ids'] = self.neighbors.ids
+        arrays['neighbors/scores'] = self.neighbors.scores
+        if self.neighbors.vectors is not None:
+            arrays['neighbors/vectors'] = self.neighbors.vectors
+        if self.scores is not None:
+            arrays['scores/suitability'] = self.scores.suitability
+            arrays['scores/clusters'] = self.scores.clusters
+        arrays.update({'calories': self.calories, 'protein': self.protein,
+                       'nutrients': self.nutrients, 'cuisine_codes': self.cuisine_codes})
+
+        metadata = {
+            'version': self.version,
+            'foods': food_metadata,
+            'constraint_index': index_metadata,
+            'seasonal_lists': self._seasonal_lists,
+        }
+        return arrays, metadata
+
+    @classmethod
+    def from_arrays(cls, arrays, metadata, candidate_cache):
+        """
+        Rebuild a catalog from the output of to_arrays, using the arrays without copying them.
+
+        Parameters:
+        -----------
+        arrays : dict
+            Arrays by name, as returned by to_arrays
+        metadata : dict
+            Metadata returned by to_arrays
+        candidate_cache : ConstraintCache
+            Cache shared by every version; entries are keyed by version
+        """
+        def part(prefix):
+            return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+
+        catalog = cls.__new__(cls)
+        catalog.foods = FoodStore.from_arrays(part('foods/'), metadata['foods'])
+        catalog.constraint_index = ConstraintIndex.from_arrays(part('index/'), metadata['constraint_index'])
+        neighbors = part('neighbors/')
+        catalog.neighbors = NeighborTable(neighbors['ids'], neighbors['scores'], neighbors.get('vectors'))
+        catalog.candidate_cache = candidate_cache
+        catalog.version = metadata['version']
+        catalog.scores = None
+        if 'scores/suitability' in arrays:
+            catalog.scores = FoodScores(arrays['scores/suitability'], arrays['scores/clusters'])
+
+        catalog.calories = arrays['calories']
+        catalog.protein = arrays['protein']
+        catalog.nutrients = arrays['nutrients']
+        catalog.cuisine_codes = arrays['cuisine_codes']
+        catalog._seasonal_lists = metadata['seasonal_lists']
+        catalog._sorted_columns = {}
+        return catalog
+
+    def candidate_set(self, diet_type, meal_type, season, cuisines=None, allergens=None):
+        """Return the calorie-sorted candidate foods for a set of constraints"""
+        key = self.constraint_index.constraint_key(diet_type, meal_type, season, cuisines, allergens)
+
+        def compute():
+            rows, relaxed = self.constraint_index.candidate_rows_explained(
+                diet_type=diet_type,
+                meal_type=meal_type,
+                season=season,
+                cuisines=cuisines,
+                allergens=allergens
+            )
+            return SortedCalories(rows, self.calories, relaxed)
+
+        return self.candidate_cache.get_or_compute(('candidates', self.version) + key, compute)
+
+    def _seasonal_top(self, season, diet_type=None, meal_type=None, cuisines=None):
+        """Return the best foods of a season by protein to calorie ratio, as (rows, ratios)"""
+        rows = self.constraint_index.candidate_rows(
+            diet_type=diet_type,
+            meal_type=meal_type,
+            season=season,
+            cuisines=cuisines
+        )
+
+        # Sort by nutritional value (protein to calorie ratio as an example)
+        calories = self.calories[rows]
+        protein_ratio = self.protein[rows] / np.where(calories == 0, 1, calories)
+        if len(rows) > self.SEASONAL_TOP_N:
+            # Foods below the N-th best ratio cannot make the list (NaN ratios are kept, they sort last)
+            cutoff = np.partition(-protein_ratio, self.SEASONAL_TOP_N - 1)[self.SEASONAL_TOP_N - 1]
+            best = np.flatnonzero(~(-protein_ratio > cutoff))
+            rows, protein_ratio = rows[best], protein_ratio[best]
+        order = np.argsort(-protein_ratio, kind='stable')[:self.SEASONAL_TOP_N]
+
+        return rows[order], protein_ratio[order]
+
+    def _precompute_seasonal(self):
+        """Precompute the seasonal lists for every season, diet type and meal type"""
+        self._seasonal_lists = {}
+        diet_types = [None] + list(self.constraint_index.diet_bits)
+        for season in ConstraintIndex.SEASONS:
+            for diet_type in diet_types:
+                for meal_type in [None, 'breakfast', 'lunch', 'dinner', 'snack']:
+                    self._seasonal_lists[(season, diet_type, meal_type)] = self._seasonal_top(
+                        season, diet_type, meal_type)
+
+    def seasonal_top(self, season, diet_type=None, meal_type=None, cuisines=None):
+        """Return the seasonal list for a set of constraints, precomputed or cached, as (rows, ratios)"""
+        # Lists without a cuisine preference were computed with the catalog
+        top = None
+        if not cuisines:
+            top = self._seasonal_lists.get((season, diet_type, meal_type))
+        if top is None:
+            key = ('seasonal', self.version) + self.constraint_index.constraint_key(
+                diet_type, meal_type, season, cuisines)
+            top = self.candidate_cache.get_or_compute(
+                key, lambda: self._seasonal_top(season, diet_type, meal_type, cuisines))
+        return top
+
+    def sorted_column(self, column):
+        """Sorted index of a numeric column, see food_query.py"""
+        index = self._sorted_columns.get(column)
+        if index is None:
+            index = SortedColumn(self.calories if column == 'calories' else self.foods.take(column))
+            self._sorted_columns[column] = index
+        return index
+
+    def rows_of(self, food_ids):
+        """Row positions of every food with one of the given ids"""
+        return np.flatnonzero(np.isin(self.foods.food_id, food_ids))
+
+    def with_scores(self, scores):
+        """Return a new catalog with the same foods and the given model scores"""
+        return FoodCatalog(self.foods, self.constraint_index, self.neighbors, self.candidate_cache,
+                           self.version + 1, scores)
+
+    def added(self, new_foods, features, k=None, scores=None):
+        """
+        Return a new catalog with foods appended.
+
+        Parameters:
+        -----------
+        new_foods : FoodStore
+            The new foods
+        features : numpy.ndarray
+            Their scaled feature vectors, for the neighbour table
+        k : int, optional
+            Number of neighbours per food
+        scores : FoodScores, optional
+            Model scores of the new foods, needed if the catalog has scores
+        """
+        return FoodCatalog(
+            self.foods.append(new_foods.frame()),
+            self.constraint_index.append(ConstraintIndex.from_store(new_foods)),
+            self.neighbors.append(features, k),
+            self.candidate_cache,
+            self.version + 1,
+            self.scores.append(scores) if self.scores is not None else None
+        )
+
+    def removed(self, rows, k=None):
+        """Return a new catalog without the foods at the given rows"""
+        keep = np.ones(len(self), dtype=bool)
+        keep[rows] = False
+        keep = np.flatnonzero(keep)
+        return FoodCatalog(
+            self.foods.select(keep),
+            self.constraint_index.select(keep),
+            self.neighbors.remove(rows, k),
+            self.candidate_cache,
+            self.version + 1,
+            self.scores.select(keep) if self.scores is not None else None
+        )
+
+    def updated(self, rows, new_foods, features, k=None, scores=None):
+        """Return a new catalog where the foods at the given rows are replaced by new_foods (and their scores)"""
+        return FoodCatalog(
+            self.foods.replace(rows, new_foods.frame()),
+            self.constraint_index.replace(rows, ConstraintIndex.from_store(new_foods)),
+            self.neighbors.replace(rows, features, k),
+            self.candidate_cache,
+            self.version + 1,
+            self.scores.replace(rows, scores) if self.scores is not None else None
+        )
@@ -0,0 +1,531 @@
+import numpy as np
+import pandas as pd
+
+from allergens import AllergenIndex
+from instrumentation import NULL_INSTRUMENTATION
+
+
+class ConstraintIndex:
+    """
+    Bitset index over the food table used to answer constraint queries.
+
+    Every filterable value (diet type, each suitable_* flag, each season
+    column, cuisine type and canonical allergen token) is stored once as a
+    boolean array over row positions. A request is evaluated with AND /
+    AND NOT operations over those arrays, so no rows are copied until the
+    caller materializes the final candidates.
+    """
+
+    SEASONS = ['spring', 'summer', 'fall', 'winter']
+
+    # Replaced by the owning app to report fallbacks and surviving rows
+    instrumentation = NULL_INSTRUMENTATION
+
+    def __init__(self, food_df):
+        """
+        Build the index from the food table.
+
+        Parameters:
+        -----------
+        food_df : pandas.DataFrame
+            The food database as loaded from the CSV file
+        """
+        self.n_rows = len(food_df)
+        self.all_rows = np.ones(self.n_rows, dtype=bool)
+        self.no_rows = np.zeros(self.n_rows, dtype=bool)
+
+        # Diet type, exact and case-insensitive
+        self.diet_bits = self._value_bits(food_df, 'diet_type')
+        self.diet_bits_lower = self._lowercase_bits(self.diet_bits)
+
+        # Meal suitability flags and season columns
+        self.flag_bits = {}
+        for column in food_df.columns:
+            if column.startswith('suitable_') or column in self.SEASONS:
+                self.flag_bits[column] = food_df[column].to_numpy() == 1
+
+        # Cuisine type, exact and case-insensitive
+        self.cuisine_bits = self._value_bits(food_df, 'cuisine_type')
+        self.cuisine_bits_lower = self._lowercase_bits(self.cuisine_bits)
+
+        # Allergen tokens parsed from the stringified lists
+        if 'allergens' in food_df.columns:
+            self.allergens = AllergenIndex(food_df['allergens'].to_numpy())
+        else:
+            self.allergens = AllergenIndex([None] * self.n_rows)
+
+    @classmethod
+    def from_store(cls, store):
+        """Build the index from a FoodStore, comparing dictionary codes instead of strings"""
+        index = cls.__new__(cls)
+        index.n_rows = len(store)
+        index.all_rows = np.ones(index.n_rows, dtype=bool)
+        index.no_rows = np.zeros(index.n_rows, dtype=bool)
+
+        index.diet_bits = index._code_bits(store, 'diet_type')
+        index.diet_bits_lower = index._lowercase_bits(index.diet_bits)
+        index.flag_bits = {}
+        for column in store.columns:
+            if column in store.flag_bits:
+                index.flag_bits[column] = store.flag(column)
+            elif column.startswith('suitable_') or column in cls.SEASONS:
+                index.flag_bits[column] = store.take(column) == 1
+        index.cuisine_bits = index._code_bits(store, 'cuisine_type')
+        index.cuisine_bits_lower = index._lowercase_bits(index.cuisine_bits)
+
+        allergens = store.strings.get('allergens')
+        if allergens is None:
+            index.allergens = AllergenIndex([None] * index.n_rows)
+        elif store.kinds['allergens'] == 'dictionary':
+            index.allergens = AllergenIndex.from_codes(allergens.codes, allergens.vocabulary)
+        else:
+            index.allergens = AllergenIndex(allergens.decode())
+        return index
+
+    def _with_bits(self, n_rows, diet_bits, flag_bits, cuisine_bits, allergens):
+        """New index sharing this one's instrumentation"""
+        index = self.__class__.__new__(self.__class__)
+        if 'instrumentation' in self.__dict__:
+            index.instrumentation = self.instrumentation
+        index.n_rows = n_rows
+        index.all_rows = np.ones(n_rows, dtype=bool)
+        index.no_rows = np.zeros(n_rows, dtype=bool)
+        index.diet_bits = diet_bits
+        index.diet_bits_lower = index._lowercase_bits(diet_bits)
+        index.flag_bits = flag_bits
+        index.cuisine_bits = cuisine_bits
+        index.cuisine_bits_lower = index._lowercase_bits(cuisine_bits)
+        index.allergens = allergens
+        return index
+
+    def select(self, rows):
+        """Return a new index over some rows, in the given order, dropping values no longer present"""
+        def select_bits(bitsets):
+            selected = {value: bits[rows] for value, bits in bitsets.items()}
+            return {value: bits for value, bits in selected.items() if bits.any()}
+
+        return self._with_bits(len(rows), select_bits(self.diet_bits),
+                               {column: bits[rows] for column, bits in self.flag_bits.items()},
+                               select_bits(self.cuisine_bits), self.allergens.select(rows))
+
+    def append(self, other):
+        """Return a new index with the rows of another index appended, e.g. one built for new foods"""
+        def append_bits(bitsets, other_bitsets):
+            appended = {}
+            for value in list(bitsets) + [value for value in other_bitsets if value not in bitsets]:
+                appended[value] = np.concatenate([bitsets.get(value, self.no_rows),
+                                                  other_bitsets.get(value, other.no_rows)])
+            return appended
+
+        return self._with_bits(self.n_rows + other.n_rows, append_bits(self.diet_bits, other.diet_bits),
+                               append_bits(self.flag_bits, other.flag_bits),
+                               append_bits(self.cuisine_bits, other.cuisine_bits),
+                               self.allergens.append(other.allergens))
+
+    def replace(self, rows, other):
+        """Return a new index where the given rows are replaced by the rows of another index"""
+        order = np.arange(self.n_rows)
+        order[rows] = self.n_rows + np.arange(len(rows))
+        return self.append(other).select(order)
+
+    def to_arrays(self):
+        """
+        Export the index as plain arrays for on-disk storage.
+
+        Returns:
+        --------
+        tuple
+            (arrays, metadata): 'bits' stacks every bitset as one row of a
+            (n_bitsets, n_rows) matrix, 'allergen_matrix' is the allergen
+            token matrix; metadata names each bitset row and token column
+        """
+        names = []
+        rows = []
+        for group, bitsets in (('diet_type', self.diet_bits),
+                               ('flag', self.flag_bits),
+                               ('cuisine_type', self.cuisine_bits)):
+            for value, bits in bitsets.items():
+                names.append([group, value])
+                rows.append(bits)
+
+        bits = np.vstack(rows) if rows else np.zeros((0, self.n_rows), dtype=bool)
+        arrays = {'bits': bits, 'allergen_matrix': self.allergens.matrix}
+        metadata = {'n_rows': self.n_rows, 'bit_names': names, 'allergen_tokens': self.allergens.tokens}
+        return arrays, metadata
+
+    @classmethod
+    def from_arrays(cls, arrays, metadata):
+        """Rebuild an index from the output of to_arrays, without the food table"""
+        index = cls.__new__(cls)
+        index.n_rows = metadata['n_rows']
+        index.all_rows = np.ones(index.n_rows, dtype=bool)
+        index.no_rows = np.zeros(index.n_rows, dtype=bool)
+
+        groups = {'diet_type': {}, 'flag': {}, 'cuisine_type': {}}
+        for (group, value), bits in zip(metadata['bit_names'], arrays['bits']):
+            groups[group][value] = bits
+        index.diet_bits = groups['diet_type']
+        index.flag_bits = groups['flag']
+        index.cuisine_bits = groups['cuisine_type']
+        index.diet_bits_lower = index._lowercase_bits(index.diet_bits)
+        index.cuisine_bits_lower = index._lowercase_bits(index.cuisine_bits)
+
+        index.allergens = AllergenIndex.from_arrays(metadata['allergen_tokens'], arrays['allergen_matrix'])
+        return index
+
+    @staticmethod
+    def _lowercase_bits(bitsets):
+        """Merge bitsets whose values only differ by case"""
+        lower = {}
+        for value, bits in bitsets.items():
+            key = str(value).lower()
+            if key in lower:
+                lower[key] = lower[key] | bits
+            else:
+                lower[key] = bits
+        return lower
+
+    @staticmethod
+    def _code_bits(store, column):
+        """Build one boolean array per distinct non-missing value of a store column"""
+        if column not in store:
+            return {}
+
+        if store.kinds[column] != 'dictionary':
+            codes, values = pd.factorize(store.take(column))
+        else:
+            codes, values = store.strings[column].codes, store.strings[column].vocabulary
+        return {value: codes == code for code, value in enumerate(values) if not pd.isna(value)}
+
+    def _value_bits(self, food_df, column):
+        """Build one boolean array per distinct value of a column"""
+        if column not in food_df.columns:
+            return {}
+
+        codes, values = food_df[column].factorize()
+        return {value: codes == code for code, value in enumerate(values)}
+
+    def diet_mask(self, diet_type):
+        """Return the rows matching a diet type, or None if nothing matches"""
+        bits = self.diet_bits.get(diet_type)
+        if bits is not None and bits.any():
+            return bits
+
+        # Try case-insensitive match
+        bits = self.diet_bits_lower.get(diet_type.lower())
+        if bits is not None and bits.any():
+            return bits
+
+        return None
+
+    def cuisine_mask(self, cuisines):
+        """Return the rows belonging to any of the given cuisines"""
+        mask = self.no_rows
+        for cuisine in cuisines:
+            bits = self.cuisine_bits.get(cuisine)
+            if bits is not None:
+                mask = mask | bits
+        return mask
+
+    def allergen_mask(self, allergens):
+        """Return the rows containing any of the given allergens"""
+        if not allergens:
+            return self.no_rows
+
+        return self.allergens.mask(allergens)
+
+    def unmatched_allergens(self, allergens):
+        """Return the given allergens that match no allergen of any food, so they exclude nothing"""
+        return self.allergens.unmatched(allergens)
+
+    # Soft constraints in the order they are applied, and allergens, which are always applied
+    CONSTRAINTS = ('diet_type', 'meal_type', 'season', 'cuisine', 'allergens')
+
+    # Order in which soft constraints are dropped when nothing is left
+    RELAXATION_ORDER = ('cuisine', 'meal_type', 'season')
+
+    def _soft_masks(self, diet_type, meal_type, season, cuisines=None):
+        """Bitset of every given soft constraint in the order they are applied, None if it matches nothing"""
+        masks = {}
+        if diet_type:
+            masks['diet_type'] = self.diet_mask(diet_type)
+        if meal_type:
+            masks['meal_type'] = self.flag_bits.get(f'suitable_{meal_type.lower()}')
+        if season:
+            masks['season'] = self.flag_bits.get(season)
+        if cuisines and len(cuisines) > 0 and self.cuisine_bits:
+            masks['cuisine'] = self.cuisine_mask(cuisines)
+        return masks
+
+    def _combine(self, masks, dropped=()):
+        """
+        AND the soft constraints in order, skipping any that would leave no row.
+
+        Returns:
+        --------
+        tuple
+            (mask, names of the constraints that were applied)
+        """
+        mask = self.all_rows
+        applied = []
+        instrumentation = self.instrumentation
+        for name, bits in masks.items():
+            if name in dropped:
+                continue
+            if bits is not None:
+                narrowed = bits if mask is self.all_rows else mask & bits
+                if narrowed.any():
+                    mask = narrowed
+                    applied.append(name)
+            if instrumentation.enabled:
+                instrumentation.observe('filter_rows', int(mask.sum()), stage=name)
+        return mask, applied
+
+    def constraint_mask(self, diet_type, meal_type, season, cuisines=None):
+        """Combine the soft constraints in the order they are applied"""
+        return self._combine(self._soft_masks(diet_type, meal_type, season, cuisines))[0]
+
+    def constraint_key(self, diet_type, meal_type, season, cuisines=None, allergens=None):
+        """Normalize constraints into a hashable key, ignoring cuisine and allergen order"""
+        cuisine_key = tuple(sorted(set(cuisines))) if cuisines else None
+        return (diet_type, meal_type, season, cuisine_key, self.allergens.token_columns(allergens))
+
+    def candidate_rows(self, diet_type, meal_type, season, cuisines=None, allergens=None):
+        """
+        Return the row positions satisfying the constraints.
+
+        Diet, meal type, season and cuisine are only applied when they leave
+        at least one food; allergens are always excluded. When nothing is
+        left, the constraints are relaxed in the same order as the original
+        DataFrame filter: cuisine, meal type, season, then diet plus
+        allergens only, then allergens only. See candidate_rows_explained.
+        """
+        return self.candidate_rows_explained(diet_type, meal_type, season, cuisines, allergens)[0]
+
+    def candidate_rows_explained(self, diet_type, meal_type, season, cuisines=None, allergens=None):
+        """
+        Return the row positions satisfying the constraints, and the constraints that were relaxed.
+
+        Every constraint's bitset is computed once. The relaxation lattice
+        is then walked in a fixed order with bitset ANDs only, and the
+        first non-empty level is returned:
+
+            1. all given constraints
+            2. without cuisine
+            3. without cuisine and meal type
+            4. without cuisine, meal type and season
+            5. exact diet type and allergens (if both are given)
+            6. allergens only, first 10 foods
+            7. 10 random foods
+
+        Levels that drop a constraint which was not applied are skipped, as
+        they cannot differ from the previous level. The worst case is
+        therefore 4 soft-constraint ANDs for each of levels 1-4 plus one
+        AND each for levels 5 and 6, i.e. at most 18 AND operations over
+        n_rows booleans, whatever the combination of constraints.
+
+        Returns:
+        --------
+        tuple
+            (rows, relaxed): relaxed names every given constraint, in the
+            order of CONSTRAINTS, that does not hold for the returned rows,
+            either because it was dropped or because applying it would
+            have left no food
+        """
+        rows, fallback, relaxed = self._relax(diet_type, meal_type, season, cuisines, allergens)
+        self.instrumentation.count('constraint_fallback', fallback=fallback)
+        return rows, relaxed
+
+    def _relax(self, diet_type, meal_type, season, cuisines=None, allergens=None):
+        """Walk the relaxation lattice, returning (rows, fallbacks taken joined by +, relaxed constraints)"""
+        allowed = ~self.allergen_mask(allergens) if allergens else self.all_rows
+        masks = self._soft_masks(diet_type, meal_type, season, cuisines)
+        given = (diet_type, meal_type, season, cuisines, allergens)
+
+        dropped = []
+        applied = []
+        for name in (None,) + self.RELAXATION_ORDER:
+            if name is not None:
+                if not given[self.CONSTRAINTS.index(name)]:
+                    continue
+                dropped.append(name)
+                if name not in applied:
+                    # Dropping a constraint that was not applied leaves the same rows
+                    continue
+            mask, applied = self._combine(masks, dropped)
+            if allergens:
+                mask = mask & allowed
+            if self.instrumentation.enabled:
+                self.instrumentation.observe('filter_rows', int(mask.sum()), stage='allergens')
+            if mask.any():
+                return np.flatnonzero(mask), '+'.join(dropped) or 'none', self._relaxed(given, applied)
+
+        # Soft constraints are all dropped from here on
+        fallback = '+'.join(dropped + [''])
+
+        # Fallback 4: Try with just diet type and allergens
+        if diet_type and allergens:
+            rows = np.flatnonzero(self.diet_bits.get(diet_type, self.no_rows) & allowed)
+            if len(rows) > 0:
+                return rows, fallback + 'diet_and_allergens', self._relaxed(given, ['diet_type'])
+
+        # Final fallback: Return any foods that don't contain allergens
+        rows = np.flatnonzero(allowed)
+        if len(rows) > 0:
+            # Return at least some options
+            return rows[:10], fallback + 'allergens_only', self._relaxed(given, [])
+
+        # If all else fails, return 10 random items from the database
+        return np.random.permutation(self.n_rows)[:10], fallback + 'random', self._relaxed(given, [], False)
+
+    def _relaxed(self, given, applied, allergens_applied=True):
+        """Names of the given constraints (values in CONSTRAINTS order) that were not applied"""
+        relaxed = ()
+        for name, value in zip(self.CONSTRAINTS, given):
+            if value and name not in applied and (name != 'allergens' or not allergens_applied):
+                relaxed += (name,)
+        return relaxed
+
+
+class SortedCalories:
+    """
+    A candidate set ordered by calories for nearest-calorie lookups.
+
+    Candidates are kept sorted by (calories, row) and, for walking down from
+    a target, by (calories, -row). The k foods closest to a target are then
+    found from the k neighbours on either side of its insertion point, with
+    ties on calorie difference broken by catalog order.
+    """
+
+    def __init__(self, rows, calories, relaxed=()):
+        """
+        Sort a candidate set.
+
+        Parameters:
+        -----------
+        rows : numpy.ndarray
+            Row positions of the candidate foods
+        calories : numpy.ndarray
+            Calories of every food in the table, indexed by row position
+        relaxed : tuple
+            Constraints the candidates do not satisfy, see ConstraintIndex.candidate_rows_explained
+        """
+        self.relaxed = tuple(relaxed)
+        rows = np.asarray(rows)
+        candidate_calories = calories[rows]
+
+        order = np.lexsort((rows, candidate_calories))
+        self.rows = rows[order]
+        self.calories = candidate_calories[order]
+
+        # Same calorie order, but highest row first within equal calories
+        self.rows_down = rows[np.lexsort((-rows, candidate_calories))]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def nearest(self, target, k=3):
+        """
+        Find the k closest-calorie foods for one target.
+
+        A binary search places the target in the sorted calories, then the
+        two sides are merged outwards by (calorie difference, row). Walking
+        up through (calories, row) and down through (calories, -row) both
+        produce rows in that order, so the merge is exact including ties,
+        at O(log n + k) per call.
+
+        Returns:
+        --------
+        tuple of numpy.ndarray
+            Row positions and calorie differences, closest first
+        """
+        n = len(self.rows)
+        up = int(np.searchsorted(self.calories, target, side='left'))
+        down = up - 1
+
+        top_rows = []
+        top_diffs = []
+        while len(top_rows) < k and (up < n or down >= 0):
+            if up < n:
+                up_diff = abs(self.calories[up] - target)
+                up_row = self.rows[up]
+            if down >= 0:
+                down_diff = abs(self.calories[down] - target)
+                down_row = self.rows_down[down]
+
+            if down < 0 or (up < n and (up_diff, up_row) < (down_diff, down_row)):
+                top_rows.append(up_row)
+                top_diffs.append(up_diff)
+                up += 1
+            else:
+                top_rows.append(down_row)
+                top_diffs.append(down_diff)
+                down -= 1
+
+        return np.array(top_rows, dtype=self.rows.dtype), np.array(top_diffs, dtype=float)
+
+    def nearest_batch(self, targets, k=3):
+        """
+        Find the k closest-calorie foods for many targets at once.
+
+        Returns:
+        --------
+        tuple of numpy.ndarray
+            Row positions and calorie differences, both of shape
+            (len(targets), min(k, len(self))), closest first
+        """
+        targets = np.asarray(targets, dtype=float)
+        n = len(self.rows)
+        k = min(k, n)
+        if k == 0:
+            empty = np.empty((len(targets), 0))
+            return empty.astype(self.rows.dtype), empty
+
+        # The k nearest lie within k positions on either side of the target
+        pos = np.searchsorted(self.calories, targets, side='left')
+        offsets = np.arange(k)
+        up = pos[:, None] + offsets
+        down = pos[:, None] - 1 - offsets
+        up_valid = up < n
+        down_valid = down >= 0
+        up = np.where(up_valid, up, 0)
+        down = np.where(down_valid, down, 0)
+
+        window_rows = np.concatenate([self.rows[up], self.rows_down[down]], axis=1)
+        window_diff = np.concatenate([
+            np.where(up_valid, np.abs(self.calories[up] - targets[:, None]), np.inf),
+            np.where(down_valid, np.abs(self.calories[down] - targets[:, None]), np.inf)
+        ], axis=1)
+
+        # Order each window by calorie difference, then by catalog order
+        order = np.lexsort((window_rows, window_diff), axis=-1)[:, :k]
+        return (np.take_along_axis(window_rows, order, axis=1),
+                np.take_along_axis(window_diff, order, axis=1))
+
+
+class SortedColumn:
+    """
+    Sorted index over one numeric column of a catalog.
+
+    values holds the exact values by row; order lists the rows by
+    ascending value, ties and missing values as in a stable sort, so a
+    range is a slice of order found by binary search.
+    """
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=float)
+        self.order = np.argsort(self.values, kind='stable')
+        self.sorted = self.values[self.order]
+        self._descending = None
+
+    def span(self, low, high):
+        """Positions in order of the rows with low <= value <= high"""
+        return (int(np.searchsorted(self.sorted, low, side='left')),
+                int(np.searchsorted(self.sorted, high, side='right')))
+
+    @property
+    def descending_order(self):
+        """Rows by descending value, ties in catalog order and missing values last"""
+        if self._descending is None:
+            self._descending = np.argsort(-self.values, kind='stable')
+        return self._descending
@@ -0,0 +1,372 @@
+"""
+Declarative food queries compiled to cached, vectorized plans.
+
+A query is a JSON-friendly dict:
+
+    {
+        "where": {
+            "calories": {"max": 400},                 # numeric range, bounds inclusive
+            "protein_g": {"min": 20},
+            "sodium_mg": {"min": 0, "max": 300},
+            "diet_type": {"in": ["vegan", "vegetarian"]},
+            "cuisine_type": {"not_in": ["Thai"]},
+            "suitable_breakfast": 1                   # a single value means {"in": [value]}
+        },
+        "exclude_allergens": ["dairy", "nuts"],
+        "sort": "-protein_g",                         # numeric column, '-' for descending
+        "limit": 20,
+        "columns": ["food_id", "food_name", "calories", "protein_g"]
+    }
+
+Every key is optional. Rows with a missing value never match a range or
+an "in" list. String values match regardless of case, as the diet type
+of a meal plan does. Ties, and rows without a sort value, keep catalog
+order; rows without a sort value come last.
+
+A query is split into its shape (columns, operators, sort and output
+columns) and its values. A shape is compiled once against the catalog
+schema into a plan of predicates, and repeated shapes reuse the cached
+plan with new values. Plans run over the catalog's column store:
+
+- season and suitable_* flags, diet type and cuisine use the constraint
+  index bitsets
+- allergen exclusion uses the allergen matrix
+- ranges use sorted column indexes, built once per catalog version; a
+  range whose exact match count is small drives the plan, so the other
+  predicates are only tested on its rows
+"""
+import numpy as np
+
+from cache import ConstraintCache
+
+QUERY_KEYS = ('where', 'exclude_allergens', 'sort', 'limit', 'columns')
+
+# Types of the values an 'in' or 'not_in' list may hold
+MEMBER_TYPES = (str, int, float, bool, type(None))
+
+# Columns whose values have a bitset in the constraint index, keyed by lowercase value
+BITSET_GROUPS = {'diet_type': 'diet_bits_lower', 'cuisine_type': 'cuisine_bits_lower'}
+
+
+def _matches(stored, values):
+    """Whether each stored value is one of values, strings compared lowercased"""
+    def folded(value):
+        return value.lower() if isinstance(value, str) else value
+
+    wanted = {folded(value) for value in values}
+    return np.fromiter((folded(value) in wanted for value in stored), dtype=bool, count=len(stored))
+
+
+class _Range:
+    """min <= column <= max over a sorted column index"""
+
+    def __init__(self, column):
+        self.column = column
+
+    def mask(self, catalog, bounds, rows=None):
+        values = catalog.sorted_column(self.column).values
+        if rows is not None:
+            values = values[rows]
+        low, high = bounds
+        return (values >= low) & (values <= high)
+
+
+class _BitsetMembership:
+    """Column in (or not in) a set of values, as an OR of constraint index bitsets"""
+
+    def __init__(self, column, negate):
+        self.column = column
+        self.negate = negate
+
+    def bitsets(self, index):
+        if self.column in BITSET_GROUPS:
+            return getattr(index, BITSET_GROUPS[self.column])
+        # 0/1 flag: its bitset holds the rows equal to 1
+        return {1: index.flag_bits[self.column]}
+
+    def mask(self, catalog, values, rows=None):
+        index = catalog.constraint_index
+        bitsets = self.bitsets(index)
+        if self.column in BITSET_GROUPS:
+            # Missing values have no bitset, so they never match
+            negate = self.negate
+            values = [str(value).lower() for value in values if value is not None]
+        elif 0 in values:
+            # Flags are only 0 or 1, so membership of 0 selects the rows not set
+            negate = not self.negate
+            values = [value for value in (0, 1) if value not in values]
+        else:
+            negate = self.negate
+
+        mask = None
+        for value in values:
+            bits = bitsets.get(value)
+            if bits is not None:
+                bits = bits if rows is None else bits[rows]
+                mask = bits if mask is None else mask | bits
+        if mask is None:
+            mask = np.zeros(index.n_rows if rows is None else len(rows), dtype=bool)
+        return ~mask if negate else mask
+
+
+class _ValueMembership:
+    """Column in (or not in) a set of values, compared on the stored values with strings lowercased"""
+
+    def __init__(self, column, negate):
+        self.column = column
+        self.negate = negate
+
+    def mask(self, catalog, values, rows=None):
+        foods = catalog.foods
+        strings = foods.strings.get(self.column)
+        if strings is None:
+            mask = np.isin(foods.take(self.column, rows), list(values))
+        elif foods.kinds[self.column] == 'dictionary':
+            # Compare codes against the codes of the vocabulary entries equal to a requested value
+            codes = strings.codes if rows is None else strings.codes[rows]
+            matching = np.flatnonzero(_matches(strings.vocabulary, values))
+            mask = np.isin(codes, matching)
+        else:
+            mask = _matches(foods.take(self.column, rows), values)
+        return ~mask if self.negate else mask
+
+
+class CompiledQuery:
+    """
+    A query shape compiled against a catalog schema.
+
+    Holds the predicate of every condition in the order of the query
+    shape. execute() binds the values of one query and returns the
+    matching rows.
+    """
+
+    # Largest share of the catalog a range may match to drive the plan
+    DRIVER_SHARE = 0.2
+
+    # Smallest share of the catalog matched for sorting by walking the sorted index
+    SORT_SCAN_SHARE = 0.1
+
+    def __init__(self, predicates, sort_column, descending, columns):
+        self.predicates = predicates
+        self.sort_column = sort_column
+        self.descending = descending
+        self.columns = columns
+
+    def execute(self, catalog, values, allergens, limit):
+        """
+        Run the plan with the values of one query.
+
+        Returns:
+        --------
+        tuple
+            (rows, total): the row positions of the first limit matches in
+            result order, and the number of matches
+        """
+        n = len(catalog)
+        ranges = []
+        others = []
+        for predicate, value in zip(self.predicates, values):
+            if isinstance(predicate, _Range):
+                start, stop = catalog.sorted_column(predicate.column).span(*value)
+                ranges.append((stop - start, start, stop, predicate, value))
+            else:
+                others.append((predicate, value))
+        ranges.sort(key=lambda entry: entry[0])
+
+        if ranges and ranges[0][0] <= self.DRIVER_SHARE * n:
+            # The most selective range gives the candidate rows, the rest is tested on those only
+            _, start, stop, predicate, _ = ranges.pop(0)
+            rows = np.sort(catalog.sorted_column(predicate.column).order[start:stop])
+            keep = np.ones(len(rows), dtype=bool)
+            for _, _, _, predicate, value in ranges:
+                keep &= predicate.mask(catalog, value, rows)
+            for predicate, value in others:
+                keep &= predicate.mask(catalog, value, rows)
+            if allergens:
+                keep &= ~catalog.constraint_index.allergen_mask(allergens)[rows]
+            rows = rows[keep]
+        else:
+            mask = None
+            for predicate, value in [(predicate, value) for _, _, _, predicate, value in ranges] + others:
+                bits = predicate.mask(catalog, value)
+                mask = bits if mask is None else mask & bits
+            if allergens:
+                allowed = ~catalog.constraint_index.allergen_mask(allergens)
+                mask = allowed if mask is None else mask & allowed
+            rows = np.arange(n) if mask is None else np.flatnonzero(mask)
+
+        total = len(rows)
+        if self.sort_column is not None:
+            rows = self._sorted(catalog, rows)
+        return rows[:limit], total
+
+    def _sorted(self, catalog, rows):
+        """Matching rows in sort order, ties and missing values as in a stable sort"""
+        index = catalog.sorted_column(self.sort_column)
+        if len(rows) >= self.SORT_SCAN_SHARE * len(index.values):
+            # Many matches: keep the matching rows of the precomputed order
+            order = index.descending_order if self.descending else index.order
+            matched = np.zeros(len(index.values), dtype=bool)
+            matched[rows] = True
+            return order[matched[order]]
+        keys = index.values[rows]
+        return rows[np.argsort(-keys if self.descending else keys, kind='stable')]
+
+
+def _is_numeric(foods, column):
+    """Whether a column of a FoodStore holds numbers"""
+    kind = foods.kinds.get(column)
+    if kind == 'id':
+        return foods.food_id.dtype.kind in 'iuf'
+    return kind in ('flag', 'numeric', 'wide')
+
+
+def parse_query(spec):
+    """
+    Split a query into its shape and its values.
+
+    Parameters:
+    -----------
+    spec : dict
+        The query, see the module documentation
+
+    Returns:
+    --------
+    tuple
+        (shape, values, allergens, limit): shape is hashable and equal for
+        queries that only differ in their values; values lists the values
+        of each condition of the shape
+
+    Raises:
+    -------
+    ValueError
+        If the query is malformed
+    """
+    if not isinstance(spec, dict):
+        raise ValueError("A query must be an object")
+    unknown = [key for key in spec if key not in QUERY_KEYS]
+    if unknown:
+        raise ValueError(f"Unknown query keys: {unknown}, expected some of {list(QUERY_KEYS)}")
+
+    where = spec.get('where') or {}
+    if not isinstance(where, dict):
+        raise ValueError("'where' must be an object keyed by column")
+
+    conditions = []
+    values = []
+    for column in sorted(where):
+        condition = where[column]
+        if not isinstance(condition, dict):
+            condition = {'in': [condition]}
+
+        if condition and set(condition) <= {'min', 'max'}:
+            bounds = []
+            for key, default in (('min', -np.inf), ('max', np.inf)):
+                bound = condition.get(key)
+                if bound is None:
+                    bound = default
+                elif isinstance(bound, bool) or not isinstance(bound, (int, float)):
+                    raise ValueError(f"'{key}' of {column} must be a number, got {bound!r}")
+                bounds.append(float(bound))
+            conditions.append((column, 'range'))
+            values.append(tuple(bounds))
+        elif len(condition) == 1 and set(condition) & {'in', 'not_in'}:
+            operator, members = next(iter(condition.items()))
+            if not isinstance(members, (list, tuple)) or not all(isinstance(member, MEMBER_TYPES) for member in members):
+                raise ValueError(f"'{operator}' of {column} must be a list of values")
+            conditions.append((column, operator))
+            values.append(tuple(members))
+        else:
+            raise ValueError(f"Condition on {column} must be a value, {{'min', 'max'}}, "
+                             f"{{'in': [...]}} or {{'not_in': [...]}}, got {condition!r}")
+
+    allergens = spec.get('exclude_allergens') or []
+    if not isinstance(allergens, (list, tuple)) or not all(isinstance(allergen, str) for allergen in allergens):
+        raise ValueError("'exclude_allergens' must be a list of allergens")
+
+    sort = spec.get('sort')
+    if sort is not None and (not isinstance(sort, str) or not sort.lstrip('-')):
+        raise ValueError("'sort' must be a column name, prefixed with '-' for descending order")
+
+    limit = spec.get('limit', QueryEngine.DEFAULT_LIMIT)
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 0:
+        raise ValueError(f"'limit' must be a non-negative integer, got {limit!r}")
+
+    columns = spec.get('columns')
+    if columns is not None and (not isinstance(columns, (list, tuple))
+                                or not all(isinstance(column, str) for column in columns)):
+        raise ValueError("'columns' must be a list of column names")
+
+    shape = (tuple(conditions), sort, None if columns is None else tuple(columns))
+    return shape, values, list(allergens), limit
+
+
+class QueryEngine:
+    """Compiles query shapes into plans, cached by shape, and runs them over a catalog"""
+
+    # Matches returned when a query has no limit
+    DEFAULT_LIMIT = 100
+
+    def __init__(self, max_plans=256):
+        """
+        Parameters:
+        -----------
+        max_plans : int
+            Maximum number of cached compiled plans
+        """
+        self.plans = ConstraintCache(max_plans, None, 'query_plans')
+
+    def compile(self, shape, foods):
+        """Return the plan of a query shape, compiled on first use"""
+        conditions, sort, columns = shape
+        referenced = [column for column, _ in conditions] + ([sort.lstrip('-')] if sort else []) + list(columns or [])
+        # Plans depend on the kinds of the columns they use, which a rebuilt catalog may change
+        key = (shape, tuple(foods.kinds.get(column) for column in referenced))
+        return self.plans.get_or_compute(key, lambda: self._compile(shape, foods))
+
+    @staticmethod
+    def _compile(shape, foods):
+        conditions, sort, columns = shape
+        predicates = []
+        for column, operator in conditions:
+            kind = foods.kinds.get(column)
+            if kind is None:
+                raise ValueError(f"Unknown column: {column}")
+            if operator == 'range':
+                if not _is_numeric(foods, column):
+                    raise ValueError(f"Range on {column}, which is not numeric")
+                predicates.append(_Range(column))
+            elif column in BITSET_GROUPS or kind == 'flag':
+                predicates.append(_BitsetMembership(column, operator == 'not_in'))
+            else:
+                predicates.append(_ValueMembership(column, operator == 'not_in'))
+
+        sort_column = sort.lstrip('-') if sort else None
+        if sort_column is not None and not _is_numeric(foods, sort_column):
+            raise ValueError(f"Cannot sort by {sort_column}, expected a numeric column")
+
+        if columns is not None:
+            unknown = [column for column in columns if column not in foods.kinds]
+            if unknown:
+                raise ValueError(f"Unknown columns: {unknown}")
+            columns = list(columns)
+        return CompiledQuery(predicates, sort_column, bool(sort and sort.startswith('-')), columns)
+
+    def run(self, catalog, spec):
+        """
+        Run a query over a catalog.
+
+        Returns:
+        --------
+        dict
+            'total' number of matching foods and 'foods' the records of the
+            first limit matches
+        """
+        shape, values, allergens, limit = parse_query(spec)
+        plan = self.compile(shape, catalog.foods)
+        rows, total = plan.execute(catalog, values, allergens, limit)
+        return {'total': total, 'foods': catalog.foods.records(rows, plan.columns)}
+
+    def stats(self):
+        """Return the plan cache counters; hits are queries that skipped compilation"""
+        return self.plans.stats()
@@ -0,0 +1,476 @@
+import numpy as np
+import pandas as pd
+
+# Columns packed into the flag bitfield when they only hold 0/1
+FLAG_PREFIXES = ('suitable_',)
+FLAG_COLUMNS = ('spring', 'summer', 'fall', 'winter')
+
+# String columns with more distinct values than this share of the rows are
+# stored as one UTF-8 buffer instead of dictionary codes (e.g. food_name)
+TEXT_CARDINALITY = 0.5
+
+# Largest number of decimals tried when storing a numeric column as float32
+MAX_DECIMALS = 6
+
+
+def _code_dtype(n_values):
+    """Smallest integer type holding a code for each of n_values"""
+    return np.uint8 if n_values <= 2**8 else np.uint16 if n_values <= 2**16 else np.int32
+
+
+class DictionaryColumn:
+    """A string column stored as integer codes into a vocabulary of distinct values"""
+
+    def __init__(self, codes, vocabulary):
+        self.codes = codes
+        self.vocabulary = vocabulary
+
+    @classmethod
+    def encode(cls, values):
+        # Missing values become their own vocabulary entry
+        codes, vocabulary = pd.factorize(values, use_na_sentinel=False)
+        return cls(codes.astype(_code_dtype(len(vocabulary))), np.asarray(vocabulary, dtype=object))
+
+    def append(self, values):
+        """Return a new column with values appended, extending the vocabulary with unseen ones"""
+        codes = pd.Index(self.vocabulary).get_indexer(values)
+        unseen = codes < 0
+        vocabulary = self.vocabulary
+        if unseen.any():
+            added = pd.unique(values[unseen])
+            codes[unseen] = len(vocabulary) + pd.Index(added).get_indexer(values[unseen])
+            vocabulary = np.concatenate([vocabulary, np.asarray(added, dtype=object)])
+        dtype = _code_dtype(len(vocabulary))
+        return DictionaryColumn(np.concatenate([self.codes.astype(dtype), codes.astype(dtype)]), vocabulary)
+
+    def select(self, rows):
+        """Return a new column with only some rows, dropping vocabulary entries no longer used"""
+        codes = self.codes[rows]
+        used = np.zeros(len(self.vocabulary), dtype=bool)
+        used[codes] = True
+        remap = np.cumsum(used) - 1
+        return DictionaryColumn(remap[codes].astype(_code_dtype(used.sum())), self.vocabulary[used])
+
+    def take(self, rows):
+        return self.vocabulary[self.codes[rows]]
+
+    def decode(self):
+        return self.vocabulary[self.codes]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + sum(len(str(value)) + 49 for value in self.vocabulary)
+
+
+class TextColumn:
+    """A string column stored as one UTF-8 buffer with row offsets"""
+
+    def __init__(self, data, offsets, missing):
+        self.data = data
+        self.offsets = offsets
+        self.missing = missing
+
+    @classmethod
+    def encode(cls, values):
+        missing = pd.isna(values)
+        encoded = [b'' if absent else str(value).encode('utf-8') for value, absent in zip(values, missing)]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets, missing)
+
+    def append(self, values):
+        """Return a new column with values appended"""
+        added = TextColumn.encode(values)
+        return TextColumn(np.concatenate([self.data, added.data]),
+                          np.concatenate([self.offsets, added.offsets[1:] + self.offsets[-1]]),
+                          np.concatenate([self.missing, added.missing]))
+
+    def select(self, rows):
+        """Return a new column with only some rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Byte positions of every selected value, one run per row
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return TextColumn(self.data[positions], offsets, self.missing[rows])
+
+    def take(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.offsets[rows].tolist()
+        ends = self.offsets[rows + 1].tolist()
+        values = np.empty(len(rows), dtype=object)
+        if len(rows) > 64:
+            # Copying the buffer once is cheaper than converting every slice
+            data = self.data.tobytes()
+            values[:] = [data[start:end].decode('utf-8') for start, end in zip(starts, ends)]
+        else:
+            values[:] = [self.data[start:end].tobytes().decode('utf-8') for start, end in zip(starts, ends)]
+        values[self.missing[rows]] = np.nan
+        return values
+
+    def decode(self):
+        return self.take(np.arange(len(self.missing)))
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.offsets.nbytes + self.missing.nbytes
+
+
+class FoodStore:
+    """
+    Compact, typed in-memory food table.
+
+    Columns are stored by kind instead of as a generic DataFrame:
+
+    - 0/1 flag columns (suitable_* and seasons) packed into one bitfield
+    - string columns as dictionary codes, or as a UTF-8 buffer when nearly
+      every value is distinct
+    - numeric columns in one float32 matrix with one contiguous row per
+      column, restored to their original values through the number of
+      decimals they were stored with; columns that would not survive
+      float32 are kept as float64
+
+    Hot paths read the arrays directly. frame() and records() rebuild
+    DataFrames or dicts identical to pd.read_csv for the requested rows
+    only, at the API boundary.
+    """
+
+    def __init__(self):
+        self.n_rows = 0
+        self.columns = []
+        self.kinds = {}
+        self.food_id = None
+        self.flags = None
+        self.flag_bits = {}
+        self.strings = {}
+        self.numeric = None
+        self.numeric_index = {}
+        self.numeric_decimals = {}
+        self.numeric_dtypes = {}
+        self.wide = {}
+        self._id_order = None
+
+    @classmethod
+    def from_csv(cls, path):
+        """Load a food database CSV"""
+        return cls.from_frame(pd.read_csv(path))
+
+    @classmethod
+    def from_frame(cls, food_df):
+        """Build a store from a DataFrame with the food database schema"""
+        store = cls()
+        store.n_rows = len(food_df)
+        store.columns = list(food_df.columns)
+
+        flag_columns = [column for column in food_df.columns
+                        if (column.startswith(FLAG_PREFIXES) or column in FLAG_COLUMNS)
+                        and pd.api.types.is_integer_dtype(food_df[column])
+                        and food_df[column].isin([0, 1]).all()]
+        bitfield_dtype = np.uint16 if len(flag_columns) <= 16 else np.uint64
+        store.flags = np.zeros(store.n_rows, dtype=bitfield_dtype)
+        for bit, column in enumerate(flag_columns):
+            store.flag_bits[column] = bit
+            store.flags |= food_df[column].to_numpy().astype(bitfield_dtype) << bitfield_dtype(bit)
+            store.kinds[column] = 'flag'
+
+        numeric_columns = []
+        for column in food_df.columns:
+            if column in store.flag_bits:
+                continue
+            series = food_df[column]
+            if column == 'food_id':
+                store.food_id = series.to_numpy()
+                store.kinds[column] = 'id'
+            elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                numeric_columns.append(column)
+            elif series.nunique(dropna=False) > TEXT_CARDINALITY * max(store.n_rows, 1):
+                store.strings[column] = TextColumn.encode(series.to_numpy())
+                store.kinds[column] = 'text'
+            else:
+                store.strings[column] = DictionaryColumn.encode(series.to_numpy())
+                store.kinds[column] = 'dictionary'
+
+        # Numeric columns go into the float32 matrix when they round-trip
+        packed = []
+        for column in numeric_columns:
+            values = food_df[column].to_numpy()
+            decimals = cls._float32_decimals(values)
+            if decimals is None:
+                store.wide[column] = values
+                store.kinds[column] = 'wide'
+            else:
+                store.numeric_index[column] = len(packed)
+                store.numeric_decimals[column] = decimals
+                store.numeric_dtypes[column] = values.dtype
+                store.kinds[column] = 'numeric'
+                packed.append(values)
+        store.numeric = np.array(packed, dtype=np.float32).reshape(len(packed), store.n_rows)
+
+        if store.food_id is None:
+            store.food_id = np.arange(1, store.n_rows + 1)
+        return store
+
+    @staticmethod
+    def _float32_decimals(values):
+        """Fewest decimals that restore every value from float32, or None if none do"""
+        if values.dtype.kind in 'iu':
+            if len(values) == 0 or np.abs(values).max() < 2**24:
+                return 0
+            return None
+
+        values = values.astype(np.float64)
+        restored = values.astype(np.float32).astype(np.float64)
+        for decimals in range(MAX_DECIMALS + 1):
+            if np.array_equal(np.round(restored, decimals), values, equal_nan=True):
+                return decimals
+        return None
+
+    def to_arrays(self):
+        """
+        Export the store as plain arrays, e.g. to place them in shared memory.
+
+        Returns:
+        --------
+        tuple
+            (arrays, metadata): every array of the store by name, and the
+            column layout needed by from_arrays
+        """
+        order, sorted_ids = self._sorted_ids()
+        arrays = {'food_id': self.food_id, 'flags': self.flags, 'numeric': self.numeric,
+                  'id_order': order, 'sorted_ids': sorted_ids}
+        for i, (column, values) in enumerate(self.wide.items()):
+            arrays[f'wide/{i}'] = values
+        for i, (column, strings) in enumerate(self.strings.items()):
+            if isinstance(strings, TextColumn):
+                arrays[f'strings/{i}/data'] = strings.data
+                arrays[f'strings/{i}/offsets'] = strings.offsets
+                arrays[f'strings/{i}/missing'] = strings.missing
+            else:
+                arrays[f'strings/{i}/codes'] = strings.codes
+                arrays[f'strings/{i}/vocabulary'] = strings.vocabulary
+
+        metadata = {
+            'n_rows': self.n_rows,
+            'columns': self.columns,
+            'kinds': self.kinds,
+            'flag_bits': self.flag_bits,
+            'numeric_index': self.numeric_index,
+            'numeric_decimals': self.numeric_decimals,
+            'numeric_dtypes': self.numeric_dtypes,
+            'wide': list(self.wide),
+            'strings': list(self.strings),
+        }
+        return arrays, metadata
+
+    @classmethod
+    def from_arrays(cls, arrays, metadata):
+        """Rebuild a store from the output of to_arrays, using the arrays without copying them"""
+        store = cls()
+        store.n_rows = metadata['n_rows']
+        store.columns = list(metadata['columns'])
+        store.kinds = dict(metadata['kinds'])
+        store.flag_bits = metadata['flag_bits']
+        store.numeric_index = metadata['numeric_index']
+        store.numeric_decimals = metadata['numeric_decimals']
+        store.numeric_dtypes = metadata['numeric_dtypes']
+        store.food_id = arrays['food_id']
+        store.flags = arrays['flags']
+        store.numeric = arrays['numeric']
+        store._id_order = (arrays['id_order'], arrays['sorted_ids'])
+
+        for i, column in enumerate(metadata['wide']):
+            store.wide[column] = arrays[f'wide/{i}']
+        for i, column in enumerate(metadata['strings']):
+            if store.kinds[column] == 'text':
+                store.strings[column] = TextColumn(arrays[f'strings/{i}/data'], arrays[f'strings/{i}/offsets'],
+                                                   arrays[f'strings/{i}/missing'])
+            else:
+                store.strings[column] = DictionaryColumn(arrays[f'strings/{i}/codes'],
+                                                         arrays[f'strings/{i}/vocabulary'])
+        return store
+
+    def append(self, food_df):
+        """
+        Return a new store with rows appended, leaving this one unchanged.
+
+        The rows are encoded into the existing layout. If they do not fit it,
+        e.g. a flag that is not 0/1 or a numeric value that changes the
+        column's type or no longer survives float32, the store is rebuilt
+        from both tables instead, as if they had been loaded together.
+
+        Parameters:
+        -----------
+        food_df : pandas.DataFrame
+            New foods; columns missing from it are filled with NaN
+        """
+        food_df = food_df.reindex(columns=self.columns)
+        if len(food_df) == 0:
+            return self
+
+        store = FoodStore()
+        store.n_rows = self.n_rows + len(food_df)
+        store.columns = list(self.columns)
+        store.kinds = dict(self.kinds)
+        store.flag_bits = self.flag_bits
+        store.numeric_index = self.numeric_index
+        store.numeric_dtypes = self.numeric_dtypes
+        store.numeric_decimals = dict(self.numeric_decimals)
+
+        flags = np.zeros(len(food_df), dtype=self.flags.dtype)
+        for column, bit in self.flag_bits.items():
+            values = food_df[column].to_numpy()
+            if not np.isin(values, [0, 1]).all():
+                return self._rebuilt(food_df)
+            flags |= values.astype(self.flags.dtype) << self.flags.dtype.type(bit)
+        store.flags = np.concatenate([self.flags, flags])
+
+        if self.kinds.get('food_id') == 'id':
+            food_id = food_df['food_id'].to_numpy()
+            if np.result_type(self.food_id, food_id) != self.food_id.dtype:
+                return self._rebuilt(food_df)
+            store.food_id = np.concatenate([self.food_id, food_id])
+        else:
+            store.food_id = np.arange(1, store.n_rows + 1)
+
+        for column, values in self.wide.items():
+            added = food_df[column].to_numpy()
+            if np.result_type(values, added) != values.dtype:
+                return self._rebuilt(food_df)
+            store.wide[column] = np.concatenate([values, added])
+
+        block = np.empty((len(self.numeric_index), len(food_df)), dtype=np.float32)
+        for column, i in self.numeric_index.items():
+            dtype = self.numeric_dtypes[column]
+            added = food_df[column].to_numpy()
+            if np.result_type(dtype, added) != dtype:
+                return self._rebuilt(food_df)
+            added = added.astype(dtype)
+            decimals = self._float32_decimals(added)
+            if decimals is not None and decimals != store.numeric_decimals[column]:
+                # One number of decimals must restore the existing and the new values
+                decimals = self._float32_decimals(np.concatenate([self.take(column), added]))
+            if decimals is None:
+                return self._rebuilt(food_df)
+            store.numeric_decimals[column] = decimals
+            block[i] = added
+        store.numeric = np.concatenate([self.numeric, block], axis=1)
+
+        for column, strings in self.strings.items():
+            store.strings[column] = strings.append(food_df[column].to_numpy())
+        return store
+
+    def _rebuilt(self, food_df):
+        """Store for this table followed by food_df, encoded from scratch"""
+        return FoodStore.from_frame(pd.concat([self.frame(), food_df], ignore_index=True))
+
+    def select(self, rows):
+        """Return a new store with only some rows, in the given order"""
+        rows = np.asarray(rows, dtype=np.int64)
+        store = FoodStore()
+        store.n_rows = len(rows)
+        store.columns = list(self.columns)
+        store.kinds = dict(self.kinds)
+        store.food_id = self.food_id[rows]
+        store.flags = self.flags[rows]
+        store.flag_bits = self.flag_bits
+        store.strings = {column: strings.select(rows) for column, strings in self.strings.items()}
+        store.numeric = self.numeric[:, rows]
+        store.numeric_index = self.numeric_index
+        store.numeric_decimals = self.numeric_decimals
+        store.numeric_dtypes = self.numeric_dtypes
+        store.wide = {column: values[rows] for column, values in self.wide.items()}
+        return store
+
+    def replace(self, rows, food_df):
+        """Return a new store where the given rows are replaced by the rows of food_df"""
+        rows = np.asarray(rows, dtype=np.int64)
+        order = np.arange(self.n_rows)
+        order[rows] = self.n_rows + np.arange(len(rows))
+        return self.append(food_df).select(order)
+
+    def __len__(self):
+        return self.n_rows
+
+    def __contains__(self, column):
+        return column in self.kinds
+
+    def flag(self, column):
+        """Return a flag column as a boolean array"""
+        return ((self.flags >> self.flags.dtype.type(self.flag_bits[column])) & 1).astype(bool)
+
+    def numeric_matrix(self, columns):
+        """Return numeric columns as a float32 (n_rows, len(columns)) view for row-wise lookups"""
+        return self.numeric[[self.numeric_index[column] for column in columns]].T
+
+    def take(self, column, rows=None):
+        """Return the values of a column for some rows (all rows if None) with their original types"""
+        kind = self.kinds[column]
+        if rows is None:
+            rows = slice(None)
+
+        if kind == 'id':
+            return self.food_id[rows]
+        if kind == 'flag':
+            return ((self.flags[rows] >> self.flags.dtype.type(self.flag_bits[column])) & 1).astype(np.int64)
+        if kind == 'numeric':
+            values = self.numeric[self.numeric_index[column], rows].astype(np.float64)
+            dtype = self.numeric_dtypes[column]
+            if dtype.kind in 'iu':
+                return np.rint(values).astype(dtype)
+            return np.round(values, self.numeric_decimals[column]).astype(dtype)
+        if kind == 'wide':
+            return self.wide[column][rows]
+        if isinstance(rows, slice):
+            return self.strings[column].decode()
+        return self.strings[column].take(rows)
+
+    def frame(self, rows=None, columns=None):
+        """
+        Materialize a DataFrame, as pd.read_csv would have produced it.
+
+        Parameters:
+        -----------
+        rows : array-like, optional
+            Row positions, all rows if None; they become the index
+        columns : list, optional
+            Columns to include, all if None
+        """
+        columns = self.columns if columns is None else list(columns)
+        if rows is None:
+            index = pd.RangeIndex(self.n_rows)
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            index = rows
+        return pd.DataFrame({column: self.take(column, rows) for column in columns}, index=index)
+
+    def records(self, rows, columns=None):
+        """Materialize rows as a list of dicts, like frame(rows).to_dict('records')"""
+        columns = self.columns if columns is None else list(columns)
+        rows = np.asarray(rows, dtype=np.int64)
+        values = [self.take(column, rows).tolist() for column in columns]
+        return [dict(zip(columns, row)) for row in zip(*values)]
+
+    def _sorted_ids(self):
+        """Row order sorting the food ids, and the sorted ids, computed on first use"""
+        if self._id_order is None:
+            order = np.argsort(self.food_id, kind='stable')
+            self._id_order = (order, self.food_id[order])
+        return self._id_order
+
+    def row_of(self, food_id):
+        """Row position of a food id, or None; the first row wins for duplicate ids"""
+        order, sorted_ids = self._sorted_ids()
+        position = np.searchsorted(sorted_ids, food_id, side='left')
+        if position < len(order) and sorted_ids[position] == food_id:
+            return int(order[position])
+        return None
+
+    @property
+    def nbytes(self):
+        """Approximate memory used by the store"""
+        total = self.food_id.nbytes + self.flags.nbytes + self.numeric.nbytes
+        total += sum(values.nbytes for values in self.wide.values())
+        total += sum(column.nbytes for column in self.strings.values())
+        return total
@@ -0,0 +1,502 @@
+"""
+Timing spans, counters and a slow-request profiler for the recommender.
+
+Instrumentation is disabled by default: span() then returns a shared
+no-op object and count()/observe() return immediately, so the hooks left
+in the hot paths cost one attribute check each. When enabled, every
+event is passed to the configured sinks:
+
+    HistogramSink       in-memory latency percentiles and counter totals
+    PrometheusSink      Prometheus text exposition format via render()
+    SpanExporterSink    OpenTelemetry (OTLP/JSON) span dicts for an exporter
+
+SlowRequestProfiler optionally samples the stacks of threads inside a
+root span and writes folded stacks (flamegraph.pl / speedscope format)
+for root spans slower than a threshold.
+
+Usage:
+    histograms = HistogramSink()
+    app = DietRecommendationApp(csv, models_dir, instrumentation=Instrumentation([histograms]))
+    app.recommend_daily_meals(profile)
+    print(histograms.summary())
+"""
+import functools
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+import numpy as np
+
+
+class Span:
+    """A timed section of work, nested under the span that was open when it started"""
+
+    __slots__ = ('name', 'attributes', 'trace_id', 'span_id', 'parent_id',
+                 'start_unix_ns', 'start_ns', 'end_ns', 'thread_id', '_instrumentation')
+
+    def __init__(self, instrumentation, name, attributes):
+        self._instrumentation = instrumentation
+        self.name = name
+        self.attributes = attributes
+        self.end_ns = None
+
+    def set(self, key, value):
+        """Attach an attribute to the span"""
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def __enter__(self):
+        self._instrumentation._start(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        self._instrumentation._finish(self)
+        return False
+
+
+class _NullSpan:
+    """Span returned while instrumentation is disabled"""
+
+    __slots__ = ()
+
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Instrumentation:
+    """
+    Entry point for spans, counters and observations.
+
+    Components hold a reference to an Instrumentation and call span(),
+    count() and observe() unconditionally; nothing is recorded unless it
+    is enabled.
+    """
+
+    def __init__(self, sinks=(), enabled=True, profiler=None):
+        """
+        Parameters:
+        -----------
+        sinks : list
+            Objects with span(span), count(name, value, labels) and
+            observe(name, value, labels) methods
+        enabled : bool
+            Whether anything is recorded
+        profiler : SlowRequestProfiler, optional
+            Sampling profiler for slow root spans
+        """
+        self.sinks = list(sinks)
+        self.enabled = enabled
+        self.profiler = profiler
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+        self._trace_prefix = random.getrandbits(64)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def span(self, name, **attributes):
+        """Return a context manager timing a section of work"""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attributes)
+
+    def count(self, name, value=1, **labels):
+        """Increment a counter"""
+        if not self.enabled:
+            return
+        for sink in self.sinks:
+            sink.count(name, value, labels)
+
+    def observe(self, name, value, **labels):
+        """Record one value of a distribution, e.g. a row count"""
+        if not self.enabled:
+            return
+        for sink in self.sinks:
+            sink.observe(name, value, labels)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _start(self, span):
+        stack = self._stack()
+        span.span_id = next(self._ids)
+        span.thread_id = threading.get_ident()
+        if stack:
+            span.trace_id = stack[-1].trace_id
+            span.parent_id = stack[-1].span_id
+        else:
+            span.trace_id = (self._trace_prefix << 64) | span.span_id
+            span.parent_id = None
+            if self.profiler is not None:
+                self.profiler.begin(span)
+        stack.append(span)
+        span.start_unix_ns = time.time_ns()
+        span.start_ns = time.perf_counter_ns()
+
+    def _finish(self, span):
+        span.end_ns = time.perf_counter_ns()
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+        if span.parent_id is None and self.profiler is not None:
+            self.profiler.end(span)
+        for sink in self.sinks:
+            sink.span(span)
+
+
+# Shared disabled instance used as the default everywhere
+NULL_INSTRUMENTATION = Instrumentation(enabled=False)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class HistogramSink:
+    """Keeps recent span durations and observations in memory and sums counters"""
+
+    def __init__(self, max_samples=10000):
+        """
+        Parameters:
+        -----------
+        max_samples : int
+            Number of most recent values kept per span name or observation
+        """
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._durations = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self._observations = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self._counters = Counter()
+
+    def span(self, span):
+        with self._lock:
+            self._durations[span.name].append(span.duration_ms)
+
+    def count(self, name, value, labels):
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += value
+
+    def observe(self, name, value, labels):
+        with self._lock:
+            self._observations[(name, _label_key(labels))].append(value)
+
+    @staticmethod
+    def _describe(values):
+        values = np.asarray(values, dtype=float)
+        return {
+            'count': len(values),
+            'mean': float(values.mean()),
+            'p50': float(np.percentile(values, 50)),
+            'p90': float(np.percentile(values, 90)),
+            'p99': float(np.percentile(values, 99)),
+            'max': float(values.max()),
+        }
+
+    def summary(self):
+        """Return span latency percentiles (ms), counter totals and observation percentiles"""
+        def label_name(name, labels):
+            return name + ''.join(f'[{key}={value}]' for key, value in labels)
+
+        with self._lock:
+            return {
+                'spans_ms': {name: self._describe(values) for name, values in self._durations.items() if values},
+                'counters': {label_name(*key): value for key, value in self._counters.items()},
+                'observations': {label_name(*key): self._describe(values)
+                                 for key, values in self._observations.items() if values},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._observations.clear()
+            self._counters.clear()
+
+
+class PrometheusSink:
+    """Aggregates spans, counters and observations into Prometheus metrics"""
+
+    # Upper bounds of the span duration histogram buckets, in seconds
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, namespace='diet'):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = Counter()
+        self._summaries = defaultdict(lambda: [0, 0.0])
+
+    def span(self, span):
+        seconds = span.duration_ms / 1000
+        with self._lock:
+            histogram = self._histograms.get(span.name)
+            if histogram is None:
+                histogram = self._histograms[span.name] = [[0] * len(self.BUCKETS), 0, 0.0]
+            buckets = histogram[0]
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            histogram[1] += 1
+            histogram[2] += seconds
+
+    def count(self, name, value, labels):
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += value
+
+    def observe(self, name, value, labels):
+        with self._lock:
+            summary = self._summaries[(name, _label_key(labels))]
+            summary[0] += 1
+            summary[1] += value
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+        return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            if self._histograms:
+                metric = f'{self.namespace}_span_duration_seconds'
+                lines.append(f'# HELP {metric} Duration of instrumented sections')
+                lines.append(f'# TYPE {metric} histogram')
+                for name, (buckets, count, total) in sorted(self._histograms.items()):
+                    for bound, bucket_count in zip(self.BUCKETS, buckets):
+                        lines.append(f'{metric}_bucket{self._labels((("span", name), ("le", bound)))} {bucket_count}')
+                    lines.append(f'{metric}_bucket{self._labels((("span", name), ("le", "+Inf")))} {count}')
+                    lines.append(f'{metric}_sum{self._labels((("span", name),))} {total}')
+                    lines.append(f'{metric}_count{self._labels((("span", name),))} {count}')
+
+            for name in sorted({name for name, _ in self._counters}):
+                metric = f'{self.namespace}_{name}_total'
+                lines.append(f'# TYPE {metric} counter')
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f'{metric}{self._labels(labels)} {value}')
+
+            for name in sorted({name for name, _ in self._summaries}):
+                metric = f'{self.namespace}_{name}'
+                lines.append(f'# TYPE {metric} summary')
+                for (summary, labels), (count, total) in sorted(self._summaries.items()):
+                    if summary == name:
+                        lines.append(f'{metric}_sum{self._labels(labels)} {total}')
+                        lines.append(f'{metric}_count{self._labels(labels)} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _otlp_value(value):
+    if isinstance(value, (bool, np.bool_)):
+        return {'boolValue': bool(value)}
+    if isinstance(value, (int, np.integer)):
+        return {'intValue': str(int(value))}
+    if isinstance(value, (float, np.floating)):
+        return {'doubleValue': float(value)}
+    return {'stringValue': str(value)}
+
+
+def otlp_span(span):
+    """Convert a finished span to an OTLP/JSON span dict"""
+    return {
+        'traceId': f'{span.trace_id:032x}',
+        'spanId': f'{span.span_id:016x}',
+        'parentSpanId': f'{span.parent_id:016x}' if span.parent_id is not None else '',
+        'name': span.name,
+        'kind': 1,  # SPAN_KIND_INTERNAL
+        'startTimeUnixNano': str(span.start_unix_ns),
+        'endTimeUnixNano': str(span.start_unix_ns + span.end_ns - span.start_ns),
+        'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in span.attributes.items()],
+        'status': {'code': 2, 'message': span.attributes['error']} if 'error' in span.attributes else {},
+    }
+
+
+def otlp_json_lines(path, service_name='diet-recommender'):
+    """
+    Return an export function appending each batch of spans to a file as one
+    OTLP/JSON ExportTraceServiceRequest per line, e.g. for an OpenTelemetry
+    Collector file receiver.
+    """
+    lock = threading.Lock()
+
+    def export(spans):
+        request = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': service_name}}]},
+            'scopeSpans': [{'scope': {'name': 'diet_recommender'}, 'spans': spans}],
+        }]}
+        with lock, open(path, 'a') as f:
+            f.write(json.dumps(request) + '\n')
+
+    return export
+
+
+class SpanExporterSink:
+    """Buffers finished spans as OTLP/JSON dicts and passes them to an exporter in batches"""
+
+    def __init__(self, export, batch_size=512):
+        """
+        Parameters:
+        -----------
+        export : callable
+            Called with a list of OTLP/JSON span dicts, e.g. otlp_json_lines(path)
+        batch_size : int
+            Number of spans buffered before export is called
+        """
+        self.export = export
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._buffer = []
+
+    def span(self, span):
+        with self._lock:
+            self._buffer.append(otlp_span(span))
+            if len(self._buffer) < self.batch_size:
+                return
+            batch, self._buffer = self._buffer, []
+        self.export(batch)
+
+    def count(self, name, value, labels):
+        pass
+
+    def observe(self, name, value, labels):
+        pass
+
+    def flush(self):
+        """Export the buffered spans"""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            self.export(batch)
+
+
+class SlowRequestProfiler:
+    """
+    Sampling profiler for slow requests.
+
+    While a root span is open, a background thread samples the stack of
+    the thread running it every interval_ms. When the root span ends after
+    more than threshold_ms, its samples are written as folded stacks to
+    output_dir; samples of fast requests are discarded.
+    """
+
+    def __init__(self, threshold_ms=200, interval_ms=5, output_dir='profiles', max_depth=128):
+        """
+        Parameters:
+        -----------
+        threshold_ms : float
+            Root spans at least this slow are written out
+        interval_ms : float
+            Sampling interval
+        output_dir : str
+            Directory for the .folded files
+        max_depth : int
+            Maximum number of frames kept per sample
+        """
+        self.threshold_ms = threshold_ms
+        self.interval = interval_ms / 1000
+        self.output_dir = output_dir
+        self.max_depth = max_depth
+        self.dumps = []
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def begin(self, span):
+        with self._lock:
+            self._active[span.thread_id] = (span, Counter())
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._sample, name='slow-request-profiler', daemon=True)
+                self._thread.start()
+
+    def end(self, span):
+        """Stop sampling a root span; write its samples if it was slow and return the file path"""
+        with self._lock:
+            _, samples = self._active.pop(span.thread_id, (None, None))
+        if not samples or span.duration_ms < self.threshold_ms:
+            return None
+        samples = samples.most_common()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f'{span.name}_{span.trace_id:032x}.folded')
+        with open(path, 'w') as f:
+            for stack, count in samples:
+                f.write(f"{span.name};{';'.join(stack)} {count}\n")
+        self.dumps.append(path)
+        return path
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                thread_ids = list(self._active)
+            if not thread_ids:
+                continue
+
+            frames = sys._current_frames()
+            stacks = {}
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stacks[thread_id] = tuple(reversed(stack))
+            del frames
+
+            # Counters are only touched under the lock, end() may be reading them
+            with self._lock:
+                for thread_id, stack in stacks.items():
+                    entry = self._active.get(thread_id)
+                    if entry is not None:
+                        entry[1][stack] += 1
+
+    def stop(self):
+        """Stop the sampling thread"""
+        self._stopped.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+
+def traced(name):
+    """Decorator timing each call of a method as a span, for classes with an instrumentation attribute"""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            instrumentation = self.instrumentation
+            if not instrumentation.enabled:
+                return method(self, *args, **kwargs)
+            with instrumentation.span(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
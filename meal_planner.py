@@ -0,0 +1,277 @@
+import numpy as np
+
+
+class WeeklyPlanner:
+    """
+    Multi-day meal planner that picks one food per meal per day.
+
+    The objective is the sum over days of the relative deviation of the
+    day's calories, protein, fat and carbs from the user's targets, plus a
+    penalty for every pair of identical foods within repeat_window days and
+    for every meal above max_cuisine_per_day of the same cuisine on a day.
+    The penalties are large compared to a typical day's deviation, so they
+    act as hard constraints whenever the candidate pools allow it.
+
+    Each meal draws from a pool of the pool_size foods closest to its
+    calorie target. A greedy pass fills the days in order, assuming the
+    meals not chosen yet will hit their share of the targets, and a local
+    search then re-picks single slots while that lowers the total cost.
+    Every slot move is scored against its whole pool at once with NumPy.
+    """
+
+    NUTRIENTS = ['calories', 'protein_g', 'fat_g', 'carbs_g']
+    TARGET_KEYS = ['daily_calories', 'protein_g', 'fat_g', 'carbs_g']
+
+    # Cost of one repeated pair / one meal over the cuisine limit
+    REPEAT_PENALTY = 10.0
+    CUISINE_PENALTY = 10.0
+
+    def __init__(self, app, user_profile, days=7, pool_size=40, repeat_window=3,
+                 max_cuisine_per_day=2, weights=None, max_passes=10):
+        """
+        Parameters:
+        -----------
+        app : DietRecommendationApp
+            The recommendation system providing candidates and targets
+        user_profile : dict
+            Same profile as for recommend_daily_meals
+        days : int
+            Number of days to plan
+        pool_size : int
+            Number of candidate foods per meal, closest to the meal's calories
+        repeat_window : int
+            A food may not appear twice within this many days
+        max_cuisine_per_day : int
+            Maximum number of meals of the same cuisine on a day
+        weights : dict, optional
+            Weight of each nutrient's relative deviation, keyed like NUTRIENTS
+        max_passes : int
+            Maximum number of local search passes
+        """
+        self.app = app
+        # Rows refer to the catalog the plan was made on, also across later swaps
+        self.catalog = app.catalog
+        self.days = days
+        self.repeat_window = repeat_window
+        self.max_cuisine_per_day = max_cuisine_per_day
+        self.max_passes = max_passes
+
+        self.targets = app.get_user_calorie_targets(user_profile)
+        self.season = user_profile.get('season') or app.determine_current_season()
+        target = np.array([self.targets[key] for key in self.TARGET_KEYS], dtype=float)
+        weights = weights or {}
+        weight = np.array([weights.get(nutrient, 1.0) for nutrient in self.NUTRIENTS])
+        self._target = target
+        self._scale = weight / np.where(target == 0, 1, np.abs(target))
+
+        # Candidate pool of every meal
+        self.meals = list(app.MEAL_DISTRIBUTION)
+        cuisines = user_profile.get('cuisines', {})
+        self._pool_rows = []
+        self._shares = []
+        for meal, percentage in app.MEAL_DISTRIBUTION.items():
+            candidates = self.catalog.candidate_set(
+                diet_type=user_profile.get('diet_type', None),
+                meal_type=meal,
+                season=self.season,
+                cuisines=cuisines.get(meal, None),
+                allergens=user_profile.get('allergies', [])
+            )
+            rows = candidates.nearest(self.targets['daily_calories'] * percentage, pool_size)[0] \
+                if len(candidates) else np.empty(0, dtype=np.int64)
+            self._pool_rows.append(np.asarray(rows, dtype=np.int64))
+            self._shares.append(target * percentage)
+
+        # Chosen pool index per slot (-1 if empty), with the food rows and
+        # cuisine codes per slot kept alongside for the constraint checks
+        shape = (days, len(self.meals))
+        self._choice = np.full(shape, -1, dtype=np.int64)
+        self._rows = np.full(shape, -1, dtype=np.int64)
+        self._codes = np.full(shape, -1, dtype=np.int64)
+        self._day_sums = np.zeros((days, len(self.NUTRIENTS)))
+        self._locked = np.zeros(shape, dtype=bool)
+        self._banned = {}
+        self._solved = False
+
+    def _slot_costs(self, day, meal, greedy=False):
+        """Cost of the slot's day and constraints for every food in the meal's pool"""
+        rows = self._pool_rows[meal]
+        nutrients = self.catalog.nutrients[rows]
+        current = self._rows[day, meal]
+
+        rest = self._day_sums[day].copy()
+        if current >= 0:
+            rest -= self.catalog.nutrients[current]
+        if greedy:
+            # Meals not chosen yet are assumed to hit their share of the targets
+            for other in range(len(self.meals)):
+                if other != meal and self._rows[day, other] < 0 and len(self._pool_rows[other]):
+                    rest += self._shares[other]
+
+        costs = (np.abs(rest + nutrients - self._target) * self._scale).sum(axis=1)
+
+        # Same food elsewhere within the repeat window
+        start = max(0, day - self.repeat_window + 1)
+        window = self._rows[start:day + self.repeat_window].copy()
+        window[day - start, meal] = -1
+        others = window[window >= 0]
+        if len(others):
+            costs += self.REPEAT_PENALTY * (rows[:, None] == others[None, :]).sum(axis=1)
+
+        # Meals of the same cuisine already on this day
+        day_codes = np.delete(self._codes[day], meal)
+        day_codes = day_codes[day_codes >= 0]
+        if len(day_codes):
+            same = (self.catalog.cuisine_codes[rows][:, None] == day_codes[None, :]).sum(axis=1)
+            costs += self.CUISINE_PENALTY * (same >= self.max_cuisine_per_day)
+
+        banned = self._banned.get((day, meal))
+        if banned:
+            costs[np.isin(rows, list(banned))] = np.inf
+
+        return costs
+
+    def _assign(self, day, meal, choice):
+        """Put a pool food into a slot and update the day's totals"""
+        current = self._rows[day, meal]
+        if current >= 0:
+            self._day_sums[day] -= self.catalog.nutrients[current]
+
+        row = self._pool_rows[meal][choice]
+        self._choice[day, meal] = choice
+        self._rows[day, meal] = row
+        self._codes[day, meal] = self.catalog.cuisine_codes[row]
+        self._day_sums[day] += self.catalog.nutrients[row]
+
+    def _improve(self, days):
+        """Local search: re-pick single slots of the given days while the cost drops"""
+        for _ in range(self.max_passes):
+            improved = False
+            for day in days:
+                for meal in range(len(self.meals)):
+                    if self._locked[day, meal] or self._choice[day, meal] < 0:
+                        continue
+                    costs = self._slot_costs(day, meal)
+                    best = int(np.argmin(costs))
+                    if costs[best] < costs[self._choice[day, meal]] - 1e-9:
+                        self._assign(day, meal, best)
+                        improved = True
+            if not improved:
+                break
+
+    def solve(self):
+        """Build the plan with a greedy pass followed by local search"""
+        for day in range(self.days):
+            for meal in range(len(self.meals)):
+                if len(self._pool_rows[meal]) and not self._locked[day, meal]:
+                    costs = self._slot_costs(day, meal, greedy=True)
+                    if np.isfinite(costs).any():
+                        self._assign(day, meal, int(np.argmin(costs)))
+
+        self._improve(range(self.days))
+        self._solved = True
+        return self
+
+    def swap(self, day, meal_type, food_id=None):
+        """
+        Change one meal and re-plan around it.
+
+        With a food_id the slot is fixed to that food, otherwise its current
+        food is excluded from the slot. Only the days sharing a repeat window
+        with the changed day are re-optimized, the rest of the plan is kept.
+
+        Returns:
+        --------
+        dict
+            The updated plan, see plan()
+        """
+        if not self._solved:
+            self.solve()
+
+        meal = self.meals.index(meal_type)
+        if food_id is not None:
+            row = self.catalog.foods.row_of(food_id)
+            if row is None:
+                raise ValueError(f"Unknown food_id: {food_id}")
+            matches = np.flatnonzero(self._pool_rows[meal] == row)
+            if len(matches):
+                choice = int(matches[0])
+            else:
+                self._pool_rows[meal] = np.append(self._pool_rows[meal], row)
+                choice = len(self._pool_rows[meal]) - 1
+            self._assign(day, meal, choice)
+            self._locked[day, meal] = True
+        else:
+            if self._rows[day, meal] >= 0:
+                self._banned.setdefault((day, meal), set()).add(int(self._rows[day, meal]))
+            self._locked[day, meal] = False
+            costs = self._slot_costs(day, meal)
+            if np.isfinite(costs).any():
+                self._assign(day, meal, int(np.argmin(costs)))
+
+        start = max(0, day - self.repeat_window + 1)
+        self._improve(range(start, min(self.days, day + self.repeat_window)))
+        return self.plan()
+
+    def violations(self):
+        """Count repeated pairs within the window and meals over the cuisine limit"""
+        repeats = 0
+        for day in range(self.days):
+            window = self._rows[day:day + self.repeat_window].ravel()[len(self.meals):]
+            for meal in range(len(self.meals)):
+                row = self._rows[day, meal]
+                if row >= 0:
+                    # Later meals of the same day, then the following days
+                    repeats += int((self._rows[day, meal + 1:] == row).sum() + (window == row).sum())
+
+        cuisine = 0
+        for codes in self._codes:
+            counts = np.bincount(codes[codes >= 0])
+            cuisine += int(np.maximum(counts - self.max_cuisine_per_day, 0).sum())
+
+        return {'repeats': repeats, 'cuisine': cuisine}
+
+    def plan(self):
+        """
+        Return the plan in the shape of recommend_daily_meals, one entry per day.
+
+        Each day lists one option per meal, the day's nutrient totals and
+        their relative deviation from the daily targets.
+        """
+        if not self._solved:
+            self.solve()
+
+        chosen = self._rows[self._rows >= 0]
+        records = dict(zip(chosen.tolist(), self.catalog.foods.records(chosen)))
+
+        days = []
+        for day in range(self.days):
+            meals = {}
+            for meal, (meal_type, percentage) in enumerate(self.app.MEAL_DISTRIBUTION.items()):
+                row = self._rows[day, meal]
+                if row < 0:
+                    meals[meal_type] = {"error": f"No suitable {meal_type} options found with your constraints"}
+                    continue
+                meal_calories = self.targets['daily_calories'] * percentage
+                option = dict(records[row])
+                option['calorie_diff'] = float(abs(self.catalog.calories[row] - meal_calories))
+                meals[meal_type] = {
+                    'target_calories': round(meal_calories),
+                    'options': [option]
+                }
+
+            totals = self._day_sums[day]
+            deviation = (totals - self._target) / np.where(self._target == 0, 1, self._target)
+            days.append({
+                'day': day,
+                'meals': meals,
+                'totals': {nutrient: round(float(total), 1) for nutrient, total in zip(self.NUTRIENTS, totals)},
+                'deviation': {nutrient: float(dev) for nutrient, dev in zip(self.NUTRIENTS, deviation)}
+            })
+
+        return {
+            'daily_targets': self.targets,
+            'current_season': self.season,
+            'days': days,
+            'violations': self.violations()
+        }
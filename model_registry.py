@@ -0,0 +1,174 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import joblib
+
+from instrumentation import NULL_INSTRUMENTATION
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """
+    Lazily loaded, size-bounded set of model artifacts.
+
+    Each artifact is registered with a loader and only loaded the first
+    time it is requested. Concurrent first requests for the same artifact
+    wait for a single load. When max_resident is set, the least recently
+    used artifacts are dropped once more than that many are in memory and
+    reloaded on their next use. A file that is missing is reported once and
+    not looked for again until the artifact is registered anew.
+    """
+
+    # Replaced by the owning app to report artifact loads
+    instrumentation = NULL_INSTRUMENTATION
+
+    def __init__(self, max_resident=None):
+        """
+        Parameters:
+        -----------
+        max_resident : int, optional
+            Maximum number of artifacts kept in memory, unbounded if None
+        """
+        self.max_resident = max_resident
+        self._loaders = {}
+        self._paths = {}
+        self._models = OrderedDict()
+        self._missing = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def register(self, name, loader, path=None):
+        """Register an artifact under a name with a zero-argument loader"""
+        with self._lock:
+            self._loaders[name] = loader
+            self._paths[name] = path
+            self._locks[name] = threading.Lock()
+            self._stats[name] = {'loads': 0, 'evictions': 0, 'last_load_seconds': None,
+                                 'total_load_seconds': 0.0}
+            self._models.pop(name, None)
+            self._missing.pop(name, None)
+
+    def register_file(self, name, path):
+        """Register a joblib pickle"""
+        self.register(name, lambda: joblib.load(path), path)
+
+    def __contains__(self, name):
+        return name in self._loaders
+
+    def get(self, name):
+        """Return an artifact, loading it on first use"""
+        with self._lock:
+            if name in self._models:
+                self._models.move_to_end(name)
+                return self._models[name]
+            if name not in self._loaders:
+                raise KeyError(f"Unknown model artifact: {name}")
+            self._raise_if_missing(name)
+            name_lock = self._locks[name]
+
+        # Only one thread loads a given artifact, the others wait for it
+        with name_lock:
+            with self._lock:
+                if name in self._models:
+                    self._models.move_to_end(name)
+                    return self._models[name]
+                self._raise_if_missing(name)
+
+            start = time.perf_counter()
+            try:
+                with self.instrumentation.span('load_artifact', artifact=name):
+                    model = self._loaders[name]()
+            except FileNotFoundError as e:
+                logger.warning("Model file of %s not found: %s. Run the training code first to generate "
+                               "the model files.", name, e)
+                with self._lock:
+                    self._missing[name] = e
+                raise
+            elapsed = time.perf_counter() - start
+            self.instrumentation.observe('artifact_load_seconds', elapsed, artifact=name)
+
+            with self._lock:
+                stats = self._stats[name]
+                stats['loads'] += 1
+                stats['last_load_seconds'] = elapsed
+                stats['total_load_seconds'] += elapsed
+                self._models[name] = model
+                self._evict_over_limit(keep=name)
+
+        return model
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def _raise_if_missing(self, name):
+        """Raise FileNotFoundError again for an artifact whose file was missing (caller holds the lock)"""
+        error = self._missing.get(name)
+        if error is not None:
+            raise FileNotFoundError(error.errno, error.strerror, error.filename)
+
+    def _evict_over_limit(self, keep):
+        """Drop least recently used artifacts above max_resident (caller holds the lock)"""
+        if self.max_resident is None:
+            return
+
+        while len(self._models) > max(self.max_resident, 1):
+            oldest = next(iter(self._models))
+            if oldest == keep:
+                self._models.move_to_end(oldest)
+                continue
+            del self._models[oldest]
+            self._stats[oldest]['evictions'] += 1
+
+    def evict(self, name):
+        """Drop an artifact from memory; it is reloaded on its next use"""
+        with self._lock:
+            if self._models.pop(name, None) is not None:
+                self._stats[name]['evictions'] += 1
+
+    def resident(self):
+        """Return the names of the artifacts currently in memory, least recently used first"""
+        with self._lock:
+            return list(self._models)
+
+    def stats(self):
+        """Return per-artifact residency, load counts, load times and file sizes"""
+        with self._lock:
+            report = {}
+            for name, stats in self._stats.items():
+                path = self._paths[name]
+                report[name] = dict(stats,
+                                    resident=name in self._models,
+                                    missing=name in self._missing,
+                                    file_bytes=os.path.getsize(path) if path and os.path.exists(path) else None)
+            return report
+
+
+class ModelMapping(Mapping):
+    """Read-only mapping view over a group of registry artifacts, e.g. one predictor per meal type"""
+
+    def __init__(self, registry, names):
+        """
+        Parameters:
+        -----------
+        registry : ModelRegistry
+            Registry holding the artifacts
+        names : dict
+            Mapping key -> registry artifact name
+        """
+        self._registry = registry
+        self._names = dict(names)
+
+    def __getitem__(self, key):
+        return self._registry.get(self._names[key])
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
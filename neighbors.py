@@ -0,0 +1,513 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def normalize_rows(features):
+    """Scale each row to unit length so dot products are cosine similarities"""
+    features = np.asarray(features, dtype=np.float64)
+    norms = np.sqrt(np.einsum('ij,ij->i', features, features))
+    norms[norms == 0] = 1
+    return features / norms[:, None]
+
+
+def rank_neighbors(scores, candidates, width):
+    """
+    Order candidate neighbours by descending score, then ascending row.
+
+    This is the order a stable descending sort of a full similarity row
+    produces, so the result can be compared with the dense matrix directly.
+
+    Parameters:
+    -----------
+    scores : numpy.ndarray
+        Similarity scores, shape (n_queries, n_candidates)
+    candidates : numpy.ndarray
+        Row ids matching scores, same shape
+    width : int
+        Number of neighbours to keep per query
+    """
+    order = np.lexsort((candidates, -scores), axis=-1)[:, :width]
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def _block_top_k(block_scores, width):
+    """Select the top `width` entries of each row of a score block, ties by row id"""
+    n_rows, n_cols = block_scores.shape
+    all_ids = np.broadcast_to(np.arange(n_cols), block_scores.shape)
+    if width >= n_cols:
+        return rank_neighbors(block_scores, all_ids, width)
+
+    # Partition to the top `width` candidates, then sort only those
+    part = np.argpartition(-block_scores, width - 1, axis=1)[:, :width]
+    part_scores = np.take_along_axis(block_scores, part, axis=1)
+    ids, scores = rank_neighbors(part_scores, part, width)
+
+    # Rows where the cut-off score is tied may have dropped a lower row id
+    cutoff = scores[:, -1]
+    tied = np.flatnonzero((block_scores >= cutoff[:, None]).sum(axis=1) > width)
+    for i in tied:
+        candidates = np.flatnonzero(block_scores[i] >= cutoff[i])
+        row_ids, row_scores = rank_neighbors(block_scores[i, candidates][None, :], candidates[None, :], width)
+        ids[i], scores[i] = row_ids[0], row_scores[0]
+
+    return ids, scores
+
+
+def build_exact_neighbors(features, k=20, max_block_mb=64, workers=1, checkpoint_dir=None, progress=None):
+    """
+    Compute the exact top-k cosine neighbours of every row in blocks.
+
+    Only one (block_rows x n) score block is held in memory at a time per
+    worker, so peak memory is bounded by about workers * max_block_mb
+    rather than growing with n^2.
+
+    With several workers the rows are split into chunks that a process
+    pool scores in parallel. The normalized vectors are placed in shared
+    memory once and every worker reads them from there instead of
+    receiving a copy. The result does not depend on the number of workers.
+
+    Parameters:
+    -----------
+    features : numpy.ndarray
+        Feature matrix, one row per food
+    k : int
+        Number of neighbours kept per food, not counting the food itself
+    max_block_mb : int
+        Upper bound on the size of one score block
+    workers : int
+        Number of processes, 1 computes in this process
+    checkpoint_dir : str, optional
+        Directory where every finished chunk is saved. A build interrupted
+        and started again with the same features resumes from the chunks
+        already there; they are removed once the build completes
+    progress : callable, optional
+        Called as progress(rows_done, n_rows) after every chunk
+
+    Returns:
+    --------
+    NeighborTable
+    """
+    vectors = normalize_rows(features)
+    n = len(vectors)
+    width = min(k + 1, n)
+    if workers <= 1 and checkpoint_dir is None and progress is None:
+        ids, scores = _exact_top_k(vectors, np.arange(n), width, max_block_mb)
+        return NeighborTable(ids, scores, vectors)
+
+    # Chunks are a few blocks each, so there are several per worker to balance the load
+    block_rows = max(1, int(max_block_mb * 1024 * 1024 // (8 * max(n, 1))))
+    chunk_rows = max(block_rows, -(-n // (max(workers, 1) * 16)))
+    chunks = [(start, min(start + chunk_rows, n)) for start in range(0, n, chunk_rows)]
+
+    ids = np.empty((n, width), dtype=np.int64)
+    scores = np.empty((n, width), dtype=np.float64)
+    checkpoint = _NeighborCheckpoint(checkpoint_dir, vectors, width, chunk_rows) if checkpoint_dir else None
+
+    pending = []
+    done = 0
+    for start, stop in chunks:
+        saved = checkpoint.load(start, stop) if checkpoint else None
+        if saved is None:
+            pending.append((start, stop))
+        else:
+            ids[start:stop], scores[start:stop] = saved
+            done += stop - start
+    if progress is not None:
+        progress(done, n)
+
+    def finish(start, stop, chunk_ids, chunk_scores):
+        nonlocal done
+        ids[start:stop], scores[start:stop] = chunk_ids, chunk_scores
+        if checkpoint:
+            checkpoint.save(start, stop, chunk_ids, chunk_scores)
+        done += stop - start
+        if progress is not None:
+            progress(done, n)
+
+    if workers <= 1:
+        for start, stop in pending:
+            finish(start, stop, *_exact_top_k(vectors, np.arange(start, stop), width, max_block_mb))
+    elif pending:
+        shared = shared_memory.SharedMemory(create=True, size=max(vectors.nbytes, 1))
+        try:
+            np.ndarray(vectors.shape, dtype=vectors.dtype, buffer=shared.buf)[:] = vectors
+            pool = ProcessPoolExecutor(workers, initializer=_attach_vectors,
+                                       initargs=(shared.name, vectors.shape, vectors.dtype.str))
+            try:
+                futures = {pool.submit(_neighbor_chunk, start, stop, width, max_block_mb): (start, stop)
+                           for start, stop in pending}
+                for future in as_completed(futures):
+                    finish(*futures[future], *future.result())
+            finally:
+                # On an error or interrupt, chunks not started yet are dropped; finished ones are checkpointed
+                pool.shutdown(cancel_futures=True)
+        finally:
+            shared.close()
+            shared.unlink()
+
+    if checkpoint:
+        checkpoint.clear()
+    return NeighborTable(ids, scores, vectors)
+
+
+# Vectors of the build in progress, attached once per pool worker
+_shared_vectors = None
+
+
+def _attach_vectors(name, shape, dtype):
+    """Pool initializer: map the shared vectors without copying them"""
+    global _shared_vectors
+    block = shared_memory.SharedMemory(name=name)
+    _shared_vectors = (block, np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf))
+
+
+def _neighbor_chunk(start, stop, width, max_block_mb):
+    """Pool task: top-k lists of rows start to stop"""
+    return _exact_top_k(_shared_vectors[1], np.arange(start, stop), width, max_block_mb)
+
+
+class _NeighborCheckpoint:
+    """Finished chunks of a neighbour build, saved as one .npz file each"""
+
+    def __init__(self, directory, vectors, width, chunk_rows):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        # Chunks are only reused for the same vectors and layout
+        state = {
+            'vectors_sha256': hashlib.sha256(np.ascontiguousarray(vectors).tobytes()).hexdigest(),
+            'shape': list(vectors.shape),
+            'width': width,
+            'chunk_rows': chunk_rows,
+        }
+        state_path = os.path.join(directory, 'state.json')
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                if json.load(f) != state:
+                    self.clear()
+        with open(state_path, 'w') as f:
+            json.dump(state, f)
+
+    def _path(self, start, stop):
+        return os.path.join(self.directory, f'rows_{start}_{stop}.npz')
+
+    def load(self, start, stop):
+        path = self._path(start, stop)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return data['ids'], data['scores']
+
+    def save(self, start, stop, ids, scores):
+        # Written under a temporary name so an interrupted write is never loaded
+        path = self._path(start, stop)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, ids=ids, scores=scores)
+        os.replace(path + '.tmp', path)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if (name.startswith('rows_') and name.endswith(('.npz', '.tmp'))) or name == 'state.json':
+                os.remove(os.path.join(self.directory, name))
+
+
+def _exact_top_k(vectors, queries, width, max_block_mb=64):
+    """Exact top `width` neighbours of the query rows among all rows, one score block at a time"""
+    n = len(vectors)
+    block_rows = max(1, int(max_block_mb * 1024 * 1024 // (8 * max(n, 1))))
+
+    ids = np.empty((len(queries), width), dtype=np.int64)
+    scores = np.empty((len(queries), width), dtype=np.float64)
+    for start in range(0, len(queries), block_rows):
+        stop = min(start + block_rows, len(queries))
+        block_scores = vectors[queries[start:stop]] @ vectors.T
+        ids[start:stop], scores[start:stop] = _block_top_k(block_scores, width)
+    return ids, scores
+
+
+def build_approximate_neighbors(features, k=20, n_lists=None, n_probe=8, n_iter=10, seed=0):
+    """
+    Compute approximate top-k cosine neighbours with an inverted-file index.
+
+    The normalized vectors are grouped into n_lists clusters with a few
+    rounds of spherical k-means. Each food is then compared only with the
+    members of its n_probe closest clusters instead of the whole catalog.
+
+    Parameters:
+    -----------
+    features : numpy.ndarray
+        Feature matrix, one row per food
+    k : int
+        Number of neighbours kept per food, not counting the food itself
+    n_lists : int, optional
+        Number of clusters, defaults to about sqrt(n)
+    n_probe : int
+        Number of clusters searched per food
+    n_iter : int
+        Number of k-means iterations
+    seed : int
+        Random seed for the initial centroids
+
+    Returns:
+    --------
+    NeighborTable
+    """
+    vectors = normalize_rows(features)
+    n = len(vectors)
+    width = min(k + 1, n)
+    if n_lists is None:
+        n_lists = max(1, int(np.sqrt(n)))
+    n_lists = min(n_lists, n)
+    n_probe = min(n_probe, n_lists)
+
+    # Spherical k-means for the coarse clusters
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(n, n_lists, replace=False)]
+    for _ in range(n_iter):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = np.flatnonzero(np.bincount(assignment, minlength=n_lists) == 0)
+        sums[empty] = centroids[empty]
+        centroids = normalize_rows(sums)
+
+    assignment = np.argmax(vectors @ centroids.T, axis=1)
+    members = [np.flatnonzero(assignment == c) for c in range(n_lists)]
+
+    # Probe the closest clusters of every food, one cluster of queries at a time
+    probes = np.argsort(-(centroids @ centroids.T), axis=1)[:, :n_probe]
+    ids = np.empty((n, width), dtype=np.int64)
+    scores = np.empty((n, width), dtype=np.float64)
+    for c in range(n_lists):
+        queries = members[c]
+        if len(queries) == 0:
+            continue
+        candidates = np.concatenate([members[p] for p in probes[c]])
+        block_scores = vectors[queries] @ vectors[candidates].T
+        block_ids, block_top = _block_top_k(block_scores, min(width, len(candidates)))
+        found = block_ids.shape[1]
+        ids[queries, :found] = candidates[block_ids]
+        scores[queries, :found] = block_top
+        if found < width:
+            ids[queries, found:] = -1
+            scores[queries, found:] = -np.inf
+
+    return NeighborTable(ids, scores, vectors)
+
+
+class NeighborTable:
+    """
+    Precomputed nearest-neighbour lists for every food.
+
+    Stores an (n x width) array of neighbour row ids and their similarity
+    scores, ordered by descending score with ties by row id. Each food's
+    list starts with itself, so a lookup skips the first entry. Memory is
+    linear in the catalog size and a lookup is a slice, with no sort on the
+    request path.
+    """
+
+    def __init__(self, ids, scores, vectors=None):
+        """
+        Parameters:
+        -----------
+        ids : numpy.ndarray
+            Neighbour row ids, shape (n, width)
+        scores : numpy.ndarray
+            Similarity scores matching ids
+        vectors : numpy.ndarray, optional
+            Normalized feature vectors, used to answer requests for more
+            neighbours than were stored
+        """
+        self.ids = ids
+        self.scores = scores
+        self.vectors = vectors
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def k(self):
+        """Number of neighbours stored per food, not counting itself"""
+        return self.ids.shape[1] - 1
+
+    def query(self, row, top_n=5):
+        """Return the ids and scores of the top_n neighbours of a row"""
+        if top_n > self.k and self.vectors is not None:
+            # More neighbours than stored, score this row against everything
+            row_scores = self.vectors @ self.vectors[row]
+            ids, scores = rank_neighbors(row_scores[None, :], np.arange(len(row_scores))[None, :], top_n + 1)
+            return ids[0, 1:], scores[0, 1:]
+
+        ids = self.ids[row, 1:top_n + 1]
+        scores = self.scores[row, 1:top_n + 1]
+        valid = ids >= 0
+        return ids[valid], scores[valid]
+
+    def append(self, features, k=None):
+        """
+        Return a new table with rows appended for new foods.
+
+        Only the new rows are scored against the catalog. Existing lists are
+        repaired by merging in the new foods that score above their current
+        last entry.
+
+        Parameters:
+        -----------
+        features : numpy.ndarray
+            Feature matrix of the new foods, scaled like the catalog
+        k : int, optional
+            Number of neighbours per food, defaults to the current k
+        """
+        vectors = np.vstack([self._require_vectors(), normalize_rows(features)])
+        old_rows = np.concatenate([np.arange(len(self)), np.full(len(features), -1)])
+        return self._repaired(vectors, old_rows, k)
+
+    def remove(self, rows, k=None):
+        """Return a new table without some rows; lists that contained them are recomputed"""
+        keep = np.ones(len(self), dtype=bool)
+        keep[rows] = False
+        keep = np.flatnonzero(keep)
+        return self._repaired(self._require_vectors()[keep], keep, k)
+
+    def replace(self, rows, features, k=None):
+        """Return a new table where the given rows have new feature vectors"""
+        rows = np.asarray(rows, dtype=np.int64)
+        vectors = self._require_vectors().copy()
+        vectors[rows] = normalize_rows(features)
+        old_rows = np.arange(len(self))
+        old_rows[rows] = -1
+        return self._repaired(vectors, old_rows, k)
+
+    def _require_vectors(self):
+        if self.vectors is None:
+            raise ValueError("Updating a neighbour table requires its feature vectors")
+        return self.vectors
+
+    def _repaired(self, vectors, old_rows, k=None, max_block_mb=64):
+        """
+        Build the table of a changed catalog from this one.
+
+        Parameters:
+        -----------
+        vectors : numpy.ndarray
+            Normalized vectors of the changed catalog
+        old_rows : numpy.ndarray
+            Row in this table of every row of the changed catalog, or -1 for
+            rows that are new or whose vector changed
+
+        Lists of new or changed rows, and lists that referenced a removed or
+        changed row, are recomputed exactly. Every other list is kept,
+        renumbered, and merged with the new or changed rows that score at
+        least as high as its last entry. For an exact table the result is the
+        same as a full rebuild.
+        """
+        n = len(vectors)
+        k = self.k if k is None else k
+        width = min(k + 1, n)
+        old_width = self.ids.shape[1]
+
+        # Renumber kept lists; ids of removed or changed rows become -1
+        new_row = np.full(len(self), -1, dtype=np.int64)
+        kept = np.flatnonzero(old_rows >= 0)
+        new_row[old_rows[kept]] = kept
+        ids = np.full((n, width), -1, dtype=np.int64)
+        scores = np.full((n, width), -np.inf)
+        columns = min(width, old_width)
+        old_ids = self.ids[old_rows[kept], :columns]
+        ids[kept, :columns] = np.where(old_ids >= 0, new_row[np.maximum(old_ids, 0)], -1)
+        scores[kept, :columns] = self.scores[old_rows[kept], :columns]
+
+        # Kept lists that lost an entry, or cannot grow to the new width from the rows added
+        broken = ((old_ids >= 0) & (ids[kept, :columns] < 0)).any(axis=1)
+        if width > old_width and old_width < len(self):
+            broken[:] = True
+        dirty = np.concatenate([np.flatnonzero(old_rows < 0), kept[broken]])
+        intact = kept[~broken]
+
+        if len(dirty):
+            ids[dirty], scores[dirty] = _exact_top_k(vectors, dirty, width, max_block_mb)
+
+        # Merge new and changed rows into intact lists they now belong to
+        fresh = np.flatnonzero(old_rows < 0)
+        if len(fresh) and len(intact):
+            block_rows = max(1, int(max_block_mb * 1024 * 1024 // (8 * len(fresh))))
+            for start in range(0, len(intact), block_rows):
+                rows = intact[start:start + block_rows]
+                fresh_scores = vectors[rows] @ vectors[fresh].T
+                hit = (fresh_scores >= scores[rows, -1:]).any(axis=1)
+                if not hit.any():
+                    continue
+                rows, fresh_scores = rows[hit], fresh_scores[hit]
+                candidates = np.hstack([ids[rows], np.broadcast_to(fresh, fresh_scores.shape)])
+                candidate_scores = np.hstack([scores[rows], fresh_scores])
+                ids[rows], scores[rows] = rank_neighbors(candidate_scores, candidates, width)
+
+        return NeighborTable(ids, scores, vectors)
+
+    def save(self, path, food_ids=None, source_sha256=None):
+        """
+        Save the table to a .npz file.
+
+        Optionally tagged with the food ids it was built for and the
+        SHA-256 of the food table file it was computed from, see load().
+        """
+        arrays = {'ids': self.ids, 'scores': self.scores}
+        if self.vectors is not None:
+            arrays['vectors'] = self.vectors
+        if food_ids is not None:
+            arrays['food_ids'] = np.asarray(food_ids)
+        if source_sha256 is not None:
+            arrays['source_sha256'] = np.asarray(source_sha256)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path, food_ids=None, vectors=None, source_sha256=None):
+        """
+        Load a table saved with save().
+
+        Raises ValueError if the table is stale: food_ids is given and does
+        not match the ids the table was built for, or source_sha256 is given
+        and does not match the hash of the file it was computed from (e.g.
+        nutrient values changed while the ids stayed the same).
+        """
+        with np.load(path) as data:
+            if food_ids is not None:
+                if 'food_ids' not in data or not np.array_equal(data['food_ids'], np.asarray(food_ids)):
+                    raise ValueError(f"Neighbour table {path} does not match the current food table")
+            if source_sha256 is not None:
+                if 'source_sha256' not in data or str(data['source_sha256']) != source_sha256:
+                    raise ValueError(f"Neighbour table {path} was computed from a different food table file")
+            if vectors is None and 'vectors' in data:
+                vectors = data['vectors']
+            return cls(data['ids'], data['scores'], vectors)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from diet_recommender import DietRecommendationApp
+
+    parser = argparse.ArgumentParser(
+        description="Build the similar-foods table offline, where DietRecommendationApp loads it from")
+    parser.add_argument('--csv', default='seasonal_food_database.csv', help="food database CSV")
+    parser.add_argument('--models', default='./', help="directory with the pickled models, the table is saved there")
+    parser.add_argument('--backend', choices=['exact', 'approximate'], default='exact')
+    parser.add_argument('--k', type=int, default=20, help="neighbours per food")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="processes for an exact table")
+    parser.add_argument('--checkpoint-dir', help="save finished chunks here and resume from them")
+    args = parser.parse_args()
+
+    def report(done, total):
+        sys.stderr.write(f"\r{done}/{total} foods ({100 * done / max(total, 1):.0f}%)")
+        sys.stderr.flush()
+
+    path = DietRecommendationApp.build_neighbor_table(args.csv, args.models, args.backend, args.k,
+                                                      args.workers, args.checkpoint_dir, report)
+    sys.stderr.write("\n")
+    print(f"Neighbour table written to {path}")
@@ -0,0 +1,150 @@
+import numpy as np
+
+from cache import ConstraintCache
+from food_index import SortedCalories
+
+
+class _BucketOptions:
+    """
+    Cached options of one (constraint key, calorie bucket).
+
+    In exact mode the entry holds the window of candidates that can be
+    among the k closest for any target in the bucket, and the records of
+    the rows served so far. Otherwise it holds the k options closest to
+    the bucket's centre.
+    """
+
+    def __init__(self, foods, calories, window=None, rows=None):
+        self.foods = foods
+        self.calories = calories
+        self.window = window
+        self.rows = rows
+        self.records = {}
+
+    def options(self, target, k):
+        """Return the options for a target as records with their calorie difference"""
+        if self.window is not None:
+            rows = self.window.nearest(target, k)[0].tolist()
+        else:
+            rows = self.rows
+
+        missing = [row for row in rows if row not in self.records]
+        if missing:
+            self.records.update(zip(missing, self.foods.records(np.asarray(missing, dtype=np.int64))))
+
+        options = []
+        for row in rows:
+            option = dict(self.records[row])
+            option['calorie_diff'] = float(abs(self.calories[row] - target))
+            options.append(option)
+        return options
+
+
+class PlanCache:
+    """
+    Memoized meal options per (constraint key, calorie bucket).
+
+    Meal calorie targets are quantized into buckets of bucket_kcal, so
+    users whose targets differ by a few kcal share one entry and repeat
+    traffic is answered without selecting or materializing foods again.
+    Entries are kept in a bounded LRU cache keyed by catalog version.
+
+    In exact mode an entry keeps every candidate that can be among the k
+    closest for some target in its bucket, and each request still picks
+    its own k from that window, so results are identical to the uncached
+    path. Windows grow with the number of candidates per bucket. With
+    exact=False an entry keeps only the k options closest to the bucket's
+    centre; each option's calorie difference is then at most bucket_kcal
+    above that of the same rank on the exact path (max_deviation).
+    """
+
+    def __init__(self, bucket_kcal=25, exact=True, max_entries=4096, ttl_seconds=None):
+        """
+        Parameters:
+        -----------
+        bucket_kcal : float
+            Width of a calorie bucket
+        exact : bool
+            Return exactly the options of the uncached path
+        max_entries : int
+            Maximum number of cached buckets
+        ttl_seconds : float, optional
+            Maximum age of an entry, unlimited if None
+        """
+        if bucket_kcal <= 0:
+            raise ValueError(f"bucket_kcal must be positive, got {bucket_kcal}")
+        self.bucket_kcal = bucket_kcal
+        self.exact = exact
+        self.entries = ConstraintCache(max_entries, ttl_seconds, 'plans')
+
+    @property
+    def max_deviation(self):
+        """Largest extra calorie difference of an option compared to the exact path"""
+        return 0.0 if self.exact else float(self.bucket_kcal)
+
+    def options(self, catalog, candidates, key, target, k=3):
+        """
+        Return the k options closest to a calorie target.
+
+        Parameters:
+        -----------
+        catalog : FoodCatalog
+            The catalog the candidates belong to
+        candidates : SortedCalories
+            The candidate set for the constraint key
+        key : tuple
+            Normalized constraint key of the candidate set
+        target : float
+            Meal calorie target
+        k : int
+            Number of options
+
+        Returns:
+        --------
+        list of dict
+            Food records with their 'calorie_diff', closest first
+        """
+        bucket = int(np.floor(target / self.bucket_kcal))
+        lo, hi = bucket * self.bucket_kcal, (bucket + 1) * self.bucket_kcal
+        if self.exact and not lo <= target <= hi:
+            # Rounding put the target outside its bucket, select it directly
+            return _BucketOptions(catalog.foods, catalog.calories, window=candidates).options(target, k)
+
+        def compute():
+            if self.exact:
+                return _BucketOptions(catalog.foods, catalog.calories,
+                                      window=self._window(candidates, catalog.calories, lo, hi, k))
+            rows = candidates.nearest((lo + hi) / 2, k)[0].tolist()
+            return _BucketOptions(catalog.foods, catalog.calories, rows=rows)
+
+        entry = self.entries.get_or_compute(('plan', catalog.version, k, bucket) + key, compute)
+        return entry.options(target, k)
+
+    @staticmethod
+    def _window(candidates, calories, lo, hi, k):
+        """
+        The candidates that can be among the k closest to a target in [lo, hi].
+
+        Those lie within k positions below lo and above hi in calorie
+        order. The window is widened to whole groups of equal calories, so
+        it holds the same foods whichever way ties are ordered.
+        """
+        sorted_calories = candidates.calories
+        n = len(sorted_calories)
+        start = max(0, int(np.searchsorted(sorted_calories, lo, side='left')) - k)
+        stop = min(n, int(np.searchsorted(sorted_calories, hi, side='right')) + k)
+        if start > 0:
+            start = int(np.searchsorted(sorted_calories, sorted_calories[start], side='left'))
+        if stop < n:
+            stop = int(np.searchsorted(sorted_calories, sorted_calories[stop - 1], side='right'))
+        return SortedCalories(candidates.rows[start:stop], calories)
+
+    def invalidate(self):
+        """Drop every entry"""
+        self.entries.invalidate()
+
+    def stats(self):
+        """Return the cache counters with the bucket settings"""
+        stats = self.entries.stats()
+        stats.update({'bucket_kcal': self.bucket_kcal, 'exact': self.exact, 'max_deviation': self.max_deviation})
+        return stats
@@ -0,0 +1,379 @@
+"""
+Sinks for writing meal plans in bulk.
+
+Columnar sinks store plans in two tables and reference foods by id
+instead of copying every food column into every option:
+
+    plans:    plan_id, season, bmr, tdee, daily_calories, protein_g, fat_g, carbs_g
+    options:  plan_id, day, meal, rank, food_id, target_calories, calorie_diff
+
+Join options with the food table (optionally written by the sink as
+foods) on food_id to expand them. NDJSONSink instead appends each plan as
+one JSON line.
+
+Usage:
+    batch = app.recommend_daily_meals_batch(profiles)
+    with SQLiteSink('plans.db', foods=app.food_df) as sink:
+        sink.write_batch(batch)
+"""
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+TARGET_COLUMNS = ['bmr', 'tdee', 'daily_calories', 'protein_g', 'fat_g', 'carbs_g']
+PLAN_COLUMNS = ['plan_id', 'season'] + TARGET_COLUMNS
+OPTION_COLUMNS = ['plan_id', 'day', 'meal', 'rank', 'food_id', 'target_calories', 'calorie_diff']
+
+# Columns added by recommend_daily_meals_batch around the food columns
+BATCH_KEY_COLUMNS = ['profile', 'meal', 'rank', 'target_calories', 'calorie_diff', 'relaxed_constraints']
+
+
+def json_default(obj):
+    """Encode NumPy scalars and arrays for json.dumps"""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_json(obj, indent=False):
+    """
+    Encode an object as UTF-8 JSON bytes.
+
+    NumPy scalars and arrays are encoded where they are found, without
+    copying the object first. Uses orjson when it is installed.
+    """
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=json_default, option=option)
+
+    if indent:
+        return json.dumps(obj, indent=2, default=json_default, ensure_ascii=False).encode('utf-8')
+    return json.dumps(obj, separators=(',', ':'), default=json_default, ensure_ascii=False).encode('utf-8')
+
+
+def plans_from_batch(batch, meal_types=None):
+    """
+    Convert the output of recommend_daily_meals_batch to recommend_daily_meals-style plans.
+
+    Parameters:
+    -----------
+    batch : dict
+        Result of recommend_daily_meals_batch
+    meal_types : list, optional
+        Meals every plan should list, in order; meals without options get
+        an error entry. Defaults to the meals present in the batch.
+
+    Returns:
+    --------
+    list of dict
+        One plan per profile, in profile order
+    """
+    targets = batch['daily_targets']
+    meals_df = batch['meals']
+    food_columns = [column for column in meals_df.columns if column not in BATCH_KEY_COLUMNS]
+
+    plans = []
+    for values, season in zip(targets[TARGET_COLUMNS].to_numpy().tolist(), targets['season']):
+        plans.append({
+            'daily_targets': dict(zip(TARGET_COLUMNS, values)),
+            'current_season': season,
+            'meals': {}
+        })
+
+    positions = targets.index.get_indexer(meals_df['profile'])
+    for position, record in zip(positions.tolist(), meals_df.to_dict('records')):
+        meals = plans[position]['meals']
+        meal = record['meal']
+        if meal not in meals:
+            meals[meal] = {'target_calories': int(record['target_calories']), 'options': []}
+            if record.get('relaxed_constraints'):
+                # Constraints the options do not satisfy, so clients can explain them
+                meals[meal]['relaxed_constraints'] = list(record['relaxed_constraints'])
+        option = {column: record[column] for column in food_columns}
+        option['calorie_diff'] = float(record['calorie_diff'])
+        meals[meal]['options'].append(option)
+
+    if meal_types is not None:
+        for plan in plans:
+            found = plan['meals']
+            plan['meals'] = {
+                meal: found.get(meal, {"error": f"No suitable {meal} options found with your constraints"})
+                for meal in meal_types
+            }
+
+    return plans
+
+
+def _typed_tables(plans, options):
+    """Build the plans and options DataFrames with fixed column types"""
+    plans = pd.DataFrame(plans, columns=PLAN_COLUMNS)
+    options = pd.DataFrame(options, columns=OPTION_COLUMNS)
+    for column in PLAN_COLUMNS:
+        if column != 'season':
+            plans[column] = plans[column].astype(np.int64)
+    plans['season'] = plans['season'].astype(object)
+    for column in ['plan_id', 'day', 'rank', 'food_id', 'target_calories']:
+        options[column] = options[column].astype(np.int64)
+    options['meal'] = options['meal'].astype(object)
+    options['calorie_diff'] = options['calorie_diff'].astype(np.float64)
+    return plans, options
+
+
+def plan_tables(plans, first_id=0):
+    """
+    Flatten plan dicts into the plans and options tables.
+
+    Accepts daily plans from recommend_daily_meals and multi-day plans
+    from recommend_weekly_meals (one 'days' entry per day).
+    """
+    plan_rows, option_rows = [], []
+    for plan_id, plan in enumerate(plans, first_id):
+        targets = plan['daily_targets']
+        plan_rows.append([plan_id, plan.get('current_season')] + [targets[column] for column in TARGET_COLUMNS])
+
+        days = plan['days'] if 'days' in plan else [plan]
+        for day_number, day in enumerate(days):
+            for meal, meal_data in day['meals'].items():
+                for rank, option in enumerate(meal_data.get('options', []), 1):
+                    option_rows.append([plan_id, day_number, meal, rank, option['food_id'],
+                                        meal_data['target_calories'], option['calorie_diff']])
+
+    return _typed_tables(plan_rows, option_rows)
+
+
+def batch_tables(batch, first_id=0):
+    """Build the plans and options tables directly from recommend_daily_meals_batch output"""
+    targets = batch['daily_targets']
+    meals = batch['meals']
+
+    plans = targets[TARGET_COLUMNS].reset_index(drop=True)
+    plans.insert(0, 'plan_id', np.arange(first_id, first_id + len(targets), dtype=np.int64))
+    plans.insert(1, 'season', targets['season'].to_numpy())
+
+    options = pd.DataFrame({
+        'plan_id': first_id + targets.index.get_indexer(meals['profile']),
+        'day': np.zeros(len(meals), dtype=np.int64),
+        'meal': meals['meal'].to_numpy(),
+        'rank': meals['rank'].to_numpy(),
+        'food_id': meals['food_id'].to_numpy(),
+        'target_calories': meals['target_calories'].to_numpy(),
+        'calorie_diff': meals['calorie_diff'].to_numpy()
+    })
+
+    return _typed_tables(plans, options)
+
+
+class PlanSink:
+    """
+    Base class for plan sinks.
+
+    Subclasses implement _write_tables(plans, options) for the columnar
+    form; plan ids are numbered consecutively from first_id across writes.
+    """
+
+    def __init__(self, first_id=0):
+        self.next_id = first_id
+        self.plans_written = 0
+
+    def write(self, plan):
+        """Write one plan and return its plan id"""
+        return self.write_many([plan])[0]
+
+    def write_many(self, plans):
+        """Write an iterable of plan dicts and return their plan ids"""
+        plans_df, options_df = plan_tables(plans, self.next_id)
+        return self._commit(plans_df, options_df)
+
+    def write_batch(self, batch):
+        """Write the output of recommend_daily_meals_batch and return the plan ids"""
+        plans_df, options_df = batch_tables(batch, self.next_id)
+        return self._commit(plans_df, options_df)
+
+    def _commit(self, plans_df, options_df):
+        if len(plans_df):
+            self._write_tables(plans_df, options_df)
+        ids = list(range(self.next_id, self.next_id + len(plans_df)))
+        self.next_id += len(plans_df)
+        self.plans_written += len(plans_df)
+        return ids
+
+    def _write_tables(self, plans, options):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class NDJSONSink(PlanSink):
+    """Appends each plan as one line of JSON, with its plan id"""
+
+    def __init__(self, path, append=True, first_id=0, meal_types=None):
+        """
+        Parameters:
+        -----------
+        path : str or file
+            Output path, or a binary file object
+        append : bool
+            Append to an existing file instead of replacing it
+        first_id : int
+            Plan id of the first plan written
+        meal_types : list, optional
+            Meal order for plans written with write_batch, see plans_from_batch
+        """
+        super().__init__(first_id)
+        self.meal_types = meal_types
+        self._owned = isinstance(path, (str, os.PathLike))
+        self._file = open(path, 'ab' if append else 'wb') if self._owned else path
+
+    def write_many(self, plans):
+        ids = []
+        lines = []
+        for plan in plans:
+            ids.append(self.next_id)
+            lines.append(encode_json({'plan_id': self.next_id, **plan}))
+            self.next_id += 1
+        if lines:
+            self._file.write(b'\n'.join(lines) + b'\n')
+        self.plans_written += len(ids)
+        return ids
+
+    def write_batch(self, batch):
+        return self.write_many(plans_from_batch(batch, self.meal_types))
+
+    def close(self):
+        if self._owned:
+            self._file.close()
+        else:
+            self._file.flush()
+
+
+class ParquetSink(PlanSink):
+    """
+    Writes the plans and options tables as Parquet (or Arrow IPC) files.
+
+    Every write appends one row group / record batch, so memory use stays
+    bounded by the size of a single batch. Requires pyarrow.
+    """
+
+    def __init__(self, directory, foods=None, format='parquet', first_id=0):
+        """
+        Parameters:
+        -----------
+        directory : str
+            Output directory; plans, options and foods files are replaced
+        foods : pandas.DataFrame, optional
+            Food table to write once alongside the plans
+        format : str
+            'parquet' or 'arrow'
+        first_id : int
+            Plan id of the first plan written
+        """
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("ParquetSink requires pyarrow, install it with `pip install pyarrow`")
+
+        if format not in ('parquet', 'arrow'):
+            raise ValueError(f"Unknown format: {format}")
+
+        super().__init__(first_id)
+        self._pa = pyarrow
+        self.directory = directory
+        self.format = format
+        self._writers = {}
+        os.makedirs(directory, exist_ok=True)
+
+        if foods is not None:
+            self._append('foods', foods)
+            self._writers.pop('foods').close()
+
+    def _append(self, name, df):
+        pa = self._pa
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        writer = self._writers.get(name)
+        if writer is None:
+            path = os.path.join(self.directory, f"{name}.{self.format}")
+            if self.format == 'parquet':
+                writer = pa.parquet.ParquetWriter(path, table.schema)
+            else:
+                writer = pa.ipc.new_file(path, table.schema)
+            self._writers[name] = writer
+        writer.write_table(table)
+
+    def _write_tables(self, plans, options):
+        self._append('plans', plans)
+        self._append('options', options)
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+
+class SQLiteSink(PlanSink):
+    """Bulk-inserts the plans and options tables into a SQLite database"""
+
+    def __init__(self, path, foods=None):
+        """
+        Parameters:
+        -----------
+        path : str
+            Database file; plans are appended after the existing ones
+        foods : pandas.DataFrame, optional
+            Food table, written as the foods table (replacing it)
+        """
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS plans (
+                plan_id INTEGER PRIMARY KEY, season TEXT,
+                bmr INTEGER, tdee INTEGER, daily_calories INTEGER,
+                protein_g INTEGER, fat_g INTEGER, carbs_g INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS options (
+                plan_id INTEGER, day INTEGER, meal TEXT, rank INTEGER,
+                food_id INTEGER, target_calories INTEGER, calorie_diff REAL
+            );
+            CREATE INDEX IF NOT EXISTS options_plan ON options (plan_id);
+        """)
+        last_id = self._conn.execute("SELECT MAX(plan_id) FROM plans").fetchone()[0]
+        super().__init__(0 if last_id is None else last_id + 1)
+
+        if foods is not None:
+            foods.to_sql('foods', self._conn, if_exists='replace', index=False)
+            self._conn.commit()
+
+    def _write_tables(self, plans, options):
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT INTO plans VALUES ({', '.join('?' * len(PLAN_COLUMNS))})",
+                plans.itertuples(index=False, name=None))
+            self._conn.executemany(
+                f"INSERT INTO options VALUES ({', '.join('?' * len(OPTION_COLUMNS))})",
+                options.itertuples(index=False, name=None))
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,265 @@
+import weakref
+
+import numpy as np
+import pandas as pd
+
+MEALS = ['breakfast', 'lunch', 'dinner', 'snack']
+
+# Columns one-hot encoded by the training notebook's encoder
+CATEGORICAL_COLUMNS = ['cuisine_type', 'region', 'country', 'diet_type', 'meal_type']
+SEASON_COLUMNS = ['spring', 'summer', 'fall', 'winter']
+
+
+class FoodScores:
+    """
+    Model outputs of every food, computed once per catalog.
+
+    suitability[row, meal] is the meal predictor's probability that the
+    food suits the meal type, in the order of MEALS, and clusters[row] is
+    the food's KMeans cluster. Meal types without a predictor file get a
+    suitability of 1 for every food, so they do not affect the ranking.
+    """
+
+    def __init__(self, suitability, clusters):
+        self.suitability = suitability
+        self.clusters = clusters
+
+    def __len__(self):
+        return len(self.clusters)
+
+    @classmethod
+    def from_models(cls, foods, scaled, scaled_columns, encoder, kmeans, meal_predictors):
+        """
+        Score every food of a store with the models.
+
+        The feature frame is rebuilt the way the training notebook built it:
+        one-hot categoricals, scaled numericals, season flags and
+        'contains_<token>' allergen flags.
+
+        Parameters:
+        -----------
+        foods : FoodStore
+            The foods to score
+        scaled : numpy.ndarray
+            Their scaled numerical features, see DietRecommendationApp._scaled_features
+        scaled_columns : list
+            Column names of scaled
+        encoder : OneHotEncoder
+            The fitted categorical encoder
+        kmeans : KMeans
+            The fitted food clusters
+        meal_predictors : Mapping
+            Meal type -> fitted classifier
+        """
+        n = len(foods)
+        columns = {column: scaled[:, i] for i, column in enumerate(scaled_columns)}
+
+        # Object columns even when every value is missing, e.g. for foods added without a meal_type
+        categoricals = pd.DataFrame({
+            column: np.asarray(foods.take(column), dtype=object) if column in foods else np.full(n, None, dtype=object)
+            for column in encoder.feature_names_in_
+        })
+        encoded = encoder.transform(categoricals)
+        if hasattr(encoded, 'toarray'):
+            encoded = encoded.toarray()
+        for i, column in enumerate(encoder.get_feature_names_out()):
+            columns[column] = encoded[:, i]
+
+        for column in SEASON_COLUMNS:
+            if column in foods:
+                columns[column] = foods.take(column)
+
+        # The notebook matched every allergen token case-insensitively against the raw string
+        if 'allergens' in foods:
+            allergens = pd.Series(foods.take('allergens'), dtype=object).fillna('').astype(str).str.lower()
+        else:
+            allergens = pd.Series([''] * n)
+
+        def features(names):
+            frame = {}
+            for name in names:
+                if name in columns:
+                    frame[name] = columns[name]
+                elif name.startswith('contains_'):
+                    frame[name] = allergens.str.contains(name[len('contains_'):], regex=False).to_numpy(dtype=np.int64)
+                else:
+                    frame[name] = np.zeros(n)
+            return pd.DataFrame(frame)
+
+        clusters = np.asarray(kmeans.predict(features(kmeans.feature_names_in_)), dtype=np.int32)
+
+        suitability = np.ones((n, len(MEALS)), dtype=np.float32)
+        for j, meal in enumerate(MEALS):
+            try:
+                predictor = meal_predictors[meal]
+            except FileNotFoundError:
+                continue
+            classes = list(predictor.classes_)
+            if 1 in classes:
+                probabilities = predictor.predict_proba(features(predictor.feature_names_in_))
+                suitability[:, j] = probabilities[:, classes.index(1)]
+            else:
+                suitability[:, j] = 0
+
+        return cls(suitability, clusters)
+
+    def append(self, other):
+        """Return new scores with the rows of other appended"""
+        return FoodScores(np.concatenate([self.suitability, other.suitability]),
+                          np.concatenate([self.clusters, other.clusters]))
+
+    def select(self, rows):
+        """Return new scores with only some rows"""
+        return FoodScores(self.suitability[rows], self.clusters[rows])
+
+    def replace(self, rows, other):
+        """Return new scores where the given rows are replaced by the rows of other"""
+        suitability = self.suitability.copy()
+        clusters = self.clusters.copy()
+        suitability[rows] = other.suitability
+        clusters[rows] = other.clusters
+        return FoodScores(suitability, clusters)
+
+
+class BlendedRanker:
+    """
+    Ranks a meal's candidates by a blend of calorie fit, macro fit, meal
+    suitability and cluster diversity.
+
+    The pool scored for a target is the pool_size candidates on either
+    side of it in calorie order, and each food in it scores
+
+        calories * |calories - target| / target
+        + macros * mean relative deviation of protein, fat and carbs
+        + suitability * (1 - predicted suitability for the meal)
+        + diversity * number of better-scored pool foods in the same cluster
+
+    The diversity term pushes down foods whose cluster is already
+    represented, so the options spread over clusters. Everything is
+    computed with NumPy over the pools of all targets at once, from the
+    scores precomputed in the catalog; no model is called per request.
+    """
+
+    DEFAULT_WEIGHTS = {'calories': 1.0, 'macros': 0.25, 'suitability': 0.1, 'diversity': 0.05}
+
+    def __init__(self, weights=None, pool_size=20):
+        """
+        Parameters:
+        -----------
+        weights : dict, optional
+            Weight of each term, keyed like DEFAULT_WEIGHTS; missing keys keep their default
+        pool_size : int
+            Number of candidates scored on each side of a target
+        """
+        unknown = set(weights or {}) - set(self.DEFAULT_WEIGHTS)
+        if unknown:
+            raise ValueError(f"Unknown ranking weights: {sorted(unknown)}")
+        self.weights = dict(self.DEFAULT_WEIGHTS, **(weights or {}))
+        self.pool_size = pool_size
+        # Pairs (i, j) with j before i, for counting better-scored foods
+        self._earlier = np.tri(2 * pool_size, k=-1, dtype=bool)
+        # Candidate-aligned score inputs per (candidate set, meal), dropped with the candidate set
+        self._aligned = weakref.WeakKeyDictionary()
+
+    def _inputs(self, catalog, candidates, meal):
+        """Nutrients, unsuitability and cluster of every candidate, in the candidate set's calorie order"""
+        inputs = self._aligned.get(candidates, {}).get(meal)
+        if inputs is None:
+            rows = candidates.rows
+            values = np.column_stack([catalog.nutrients[rows],
+                                      1 - catalog.scores.suitability[rows, MEALS.index(meal)]])
+            inputs = (values, catalog.scores.clusters[rows])
+            self._aligned.setdefault(candidates, {})[meal] = inputs
+        return inputs
+
+    def _window(self, candidates, k):
+        width = min(2 * max(self.pool_size, k), len(candidates))
+        if width > len(self._earlier):
+            self._earlier = np.tri(width, k=-1, dtype=bool)
+        return width, self._earlier[:width, :width]
+
+    def _scores(self, values, diffs, calorie_targets, macro_targets):
+        """Blended score without the diversity term, over the last axis of a pool"""
+        weights = self.weights
+        macro_fit = np.abs(values[..., 1:4] - macro_targets) / np.where(macro_targets == 0, 1, np.abs(macro_targets))
+        return (weights['calories'] * diffs / np.maximum(np.abs(calorie_targets), 1)
+                + weights['macros'] * macro_fit.mean(axis=-1)
+                + weights['suitability'] * values[..., 4])
+
+    def rank_one(self, catalog, candidates, meal, calorie_target, macro_targets, k=3):
+        """
+        Pick the k best candidates for one target, see rank().
+
+        Returns:
+        --------
+        tuple of numpy.ndarray
+            Row positions and calorie differences, best first
+        """
+        n = len(candidates)
+        width, earlier = self._window(candidates, k)
+        if width == 0:
+            return candidates.rows[:0], np.empty(0)
+        values, clusters = self._inputs(catalog, candidates, meal)
+
+        start = min(max(int(np.searchsorted(candidates.calories, calorie_target)) - width // 2, 0), n - width)
+        window = slice(start, start + width)
+        values = values[window]
+        diffs = np.abs(values[:, 0] - calorie_target)
+        score = self._scores(values, diffs, calorie_target, np.asarray(macro_targets, dtype=float))
+
+        # Count the better-scored foods of the same cluster in the pool
+        order = np.argsort(score, kind='stable')
+        pool_clusters = clusters[window][order]
+        same_cluster = ((pool_clusters[:, None] == pool_clusters[None, :]) & earlier).sum(axis=1)
+        blended = score[order] + self.weights['diversity'] * same_cluster
+
+        best = order[np.argsort(blended, kind='stable')[:k]]
+        return candidates.rows[window][best], diffs[best]
+
+    def rank(self, catalog, candidates, meal, calorie_targets, macro_targets, k=3):
+        """
+        Pick the k best candidates for many targets of one meal.
+
+        Parameters:
+        -----------
+        catalog : FoodCatalog
+            Catalog holding the precomputed scores
+        candidates : SortedCalories
+            The meal's candidate set
+        meal : str
+            Meal type
+        calorie_targets : numpy.ndarray
+            Meal calorie target of every user, shape (m,)
+        macro_targets : numpy.ndarray
+            Meal protein, fat and carbs targets of every user, shape (m, 3)
+
+        Returns:
+        --------
+        tuple of numpy.ndarray
+            Row positions and calorie differences, shape (m, min(k, len(candidates))), best first
+        """
+        calorie_targets = np.asarray(calorie_targets, dtype=float)
+        macro_targets = np.asarray(macro_targets, dtype=float)
+        n = len(candidates)
+        width, earlier = self._window(candidates, k)
+        if width == 0:
+            empty = np.empty((len(calorie_targets), 0))
+            return empty.astype(candidates.rows.dtype), empty
+        values, clusters = self._inputs(catalog, candidates, meal)
+
+        # Same-width window around every target's position in calorie order
+        start = np.clip(np.searchsorted(candidates.calories, calorie_targets) - width // 2, 0, n - width)
+        positions = start[:, None] + np.arange(width)
+        values = values[positions]
+        diffs = np.abs(values[..., 0] - calorie_targets[:, None])
+        score = self._scores(values, diffs, calorie_targets[:, None], macro_targets[:, None, :])
+
+        # Count the better-scored foods of the same cluster in each pool
+        lines = np.arange(len(positions))[:, None]
+        order = np.argsort(score, axis=1, kind='stable')
+        pool_clusters = clusters[positions[lines, order]]
+        same_cluster = ((pool_clusters[:, :, None] == pool_clusters[:, None, :]) & earlier).sum(axis=2)
+        blended = score[lines, order] + self.weights['diversity'] * same_cluster
+
+        best = order[lines, np.argsort(blended, axis=1, kind='stable')[:, :k]]
+        return candidates.rows[positions[lines, best]], diffs[lines, best]
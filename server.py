@@ -0,0 +1,576 @@
+"""
+Long-lived HTTP/JSON service around DietRecommendationApp.
+
+The app is loaded once per process. CPU-bound work runs in a bounded
+thread pool, concurrent daily-plan requests are collected for a few
+milliseconds and answered with one recommend_daily_meals_batch call, and
+requests beyond max_pending are rejected with 503 instead of queueing
+without bound.
+
+Endpoints:
+    GET  /health                      liveness check
+    GET  /stats                       cache, model and queue statistics
+    GET  /metrics                     Prometheus metrics (with --metrics)
+    POST /plans/daily[?seasonal=1]    body: user profile -> daily plan
+    POST /plans/daily/batch           body: list of profiles -> list of plans
+    GET  /foods/<food_id>/similar     ?top_n=5
+    POST /foods                       body: food or list of foods -> added to the catalog
+    POST /foods/query                 body: food query (see food_query.py) -> matching foods
+    PATCH /foods/<food_id>            body: changed fields of a food
+    DELETE /foods/<food_id>           removes a food from the catalog
+    GET  /seasonal                    ?diet_type=&meal_type=&cuisines=Thai,Indian
+
+With --processes, daily plans are computed by a WorkerPool of processes
+sharing one copy of the catalog (see worker_pool.py), and catalog updates
+are published to them.
+
+Usage:
+    python server.py --bundle food_bundle --port 8000
+    python server.py --bundle food_bundle --processes 8 --max-requests-per-process 100000
+    python server.py --csv seasonal_food_database.csv --models ./ --port 8000
+    python server.py --bundle food_bundle --metrics --profile-slow-ms 250
+"""
+import argparse
+import asyncio
+import json
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from diet_recommender import DietRecommendationApp
+from food_index import ConstraintIndex
+from instrumentation import Instrumentation, PrometheusSink, SlowRequestProfiler
+from plan_sinks import encode_json, plans_from_batch
+from worker_pool import WorkerPool
+
+# Required profile fields and the type each is converted to
+PROFILE_FIELDS = {
+    'age': int,
+    'sex': str,
+    'weight_kg': float,
+    'height_cm': float,
+    'activity_level': str,
+    'goal': str,
+}
+
+MEALS = list(DietRecommendationApp.MEAL_DISTRIBUTION)
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class HTTPError(Exception):
+    """An error returned to the client with a status code"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _is_string_list(value):
+    """Whether a value is a list of strings"""
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def parse_profile(body):
+    """Validate a user profile from a request body and convert its field types"""
+    if not isinstance(body, dict):
+        raise HTTPError(400, "Profile must be a JSON object")
+
+    profile = dict(body)
+    for field, field_type in PROFILE_FIELDS.items():
+        if profile.get(field) in (None, ''):
+            raise HTTPError(400, f"Missing profile field: {field}")
+        try:
+            profile[field] = field_type(profile[field])
+        except (TypeError, ValueError):
+            raise HTTPError(400, f"Invalid value for {field}: {profile[field]!r}")
+
+    diet_type = profile.get('diet_type')
+    if diet_type is not None and not isinstance(diet_type, str):
+        raise HTTPError(400, f"Invalid value for diet_type: {diet_type!r}")
+
+    # A missing season means the current one
+    season = profile.get('season')
+    if season not in (None, '') and season not in ConstraintIndex.SEASONS:
+        raise HTTPError(400, f"Invalid value for season: {season!r}, expected one of {ConstraintIndex.SEASONS}")
+
+    # Empty cuisine lists mean "any cuisine"
+    cuisines = profile.get('cuisines') or {}
+    if not isinstance(cuisines, dict):
+        raise HTTPError(400, "cuisines must be an object keyed by meal")
+    for meal, value in cuisines.items():
+        if value is not None and not _is_string_list(value):
+            raise HTTPError(400, f"cuisines of {meal} must be a list of cuisine names")
+    profile['cuisines'] = {meal: (value or None) for meal, value in cuisines.items()}
+
+    # Allergies may come as a comma-separated string
+    allergies = profile.get('allergies') or []
+    if isinstance(allergies, str):
+        allergies = [allergy.strip() for allergy in allergies.split(',') if allergy.strip()]
+    if not _is_string_list(allergies):
+        raise HTTPError(400, "allergies must be a list of allergen names")
+    profile['allergies'] = allergies
+
+    return profile
+
+
+class PlanBatcher:
+    """
+    Micro-batches concurrent daily-plan requests.
+
+    Requests arriving within window_ms of each other (up to max_batch) are
+    answered by one vectorized recommend_daily_meals_batch call in the
+    worker pool, or in a WorkerPool process if pool is given. At most
+    max_concurrent batches run at the same time.
+    """
+
+    def __init__(self, app, executor, max_batch=64, window_ms=5, max_concurrent=4, pool=None):
+        self.app = app
+        self.executor = executor
+        self.pool = pool
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._task = None
+        self.batches = 0
+        self.batched_requests = 0
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, profile):
+        """Queue one profile and wait for its plan"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((profile, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+
+            # Collect whatever else arrives within the batching window
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._slots.acquire()
+            asyncio.ensure_future(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            profiles = [profile for profile, _ in batch]
+            plans = await loop.run_in_executor(self.executor, self.plan_batch, profiles)
+            for (_, future), plan in zip(batch, plans):
+                if not future.done():
+                    future.set_result(plan)
+            self.batches += 1
+            self.batched_requests += len(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(e)
+            else:
+                # Plan the profiles one at a time, so only the requests that caused the error fail
+                for profile, future in batch:
+                    try:
+                        plans = await loop.run_in_executor(self.executor, self.plan_batch, [profile])
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+                    else:
+                        if not future.done():
+                            future.set_result(plans[0])
+        finally:
+            self._slots.release()
+
+    def plan_batch(self, profiles):
+        """Plan validated profiles together, in the worker pool if any; one plan per profile"""
+        if self.pool is not None:
+            batch = self.pool.call('recommend_daily_meals_batch', profiles, option_columns=self.app.foods.columns)
+        else:
+            batch = self.app.recommend_daily_meals_batch(profiles, option_columns=self.app.foods.columns)
+        return plans_from_batch(batch, MEALS)
+
+
+class RecommendationService:
+    """HTTP/JSON front end for one warm DietRecommendationApp"""
+
+    def __init__(self, app, max_workers=4, max_pending=256, max_batch=64, batch_window_ms=5,
+                 max_body_bytes=1 << 20, pool=None):
+        """
+        Parameters:
+        -----------
+        app : DietRecommendationApp
+            The loaded recommendation system
+        max_workers : int
+            Size of the worker thread pool
+        max_pending : int
+            Requests in flight above which new requests get 503
+        max_batch : int
+            Maximum number of daily-plan requests answered by one batch call
+        batch_window_ms : float
+            How long the batcher waits for more requests
+        max_body_bytes : int
+            Largest accepted request body
+        pool : WorkerPool, optional
+            Worker processes computing the daily plans; catalog updates
+            are published to them
+        """
+        self.app = app
+        self.pool = pool
+        if pool is not None:
+            # A thread waits on each batch in flight, keep every process busy
+            max_workers = max(max_workers, pool.n_workers)
+        self.max_pending = max_pending
+        self.max_body_bytes = max_body_bytes
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recommender')
+        self.batcher = PlanBatcher(app, self.executor, max_batch, batch_window_ms, max_workers, pool)
+        self.pending = 0
+        self.rejected = 0
+
+    async def _run(self, func, *args):
+        """Run a blocking call in the worker pool"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _parse_profile(self, body):
+        """Validate a profile, rejecting allergies that would exclude no food"""
+        profile = parse_profile(body)
+        index = self.app.catalog.constraint_index
+        unmatched = index.unmatched_allergens(profile['allergies'])
+        if unmatched:
+            raise HTTPError(400, f"Unknown allergens: {unmatched}, known allergens are {index.allergens.tokens}")
+        return profile
+
+    async def handle(self, method, path, query, body):
+        """Dispatch one request and return (status, payload)"""
+        parts = [part for part in path.split('/') if part]
+
+        if parts == ['metrics']:
+            sinks = [sink for sink in self.app.instrumentation.sinks if isinstance(sink, PrometheusSink)]
+            if not self.app.instrumentation.enabled or not sinks:
+                raise HTTPError(404, "Metrics are not enabled, start the server with --metrics")
+            return 200, ''.join(sink.render() for sink in sinks)
+
+        if parts == ['health']:
+            return 200, {'status': 'ok'}
+
+        if parts == ['stats']:
+            stats = {
+                'pending': self.pending,
+                'rejected': self.rejected,
+                'batches': self.batcher.batches,
+                'batched_requests': self.batcher.batched_requests,
+                'catalog': {'version': self.app.catalog.version, 'n_foods': len(self.app.catalog)},
+                'candidate_cache': self.app.candidate_cache.stats(),
+                'models': self.app.models.stats(),
+                'query_plans': self.app.query_engine.stats(),
+            }
+            if self.pool is not None:
+                stats['worker_pool'] = self.pool.stats()
+            return 200, stats
+
+        if parts == ['plans', 'daily']:
+            if method != 'POST':
+                raise HTTPError(405, "Use POST")
+            profile = self._parse_profile(body)
+            plan = await self.batcher.submit(profile)
+            if query.get('seasonal', ['0'])[0] in ('1', 'true', 'yes'):
+                plan['seasonal_recommendations'] = await self._run(self._seasonal_for_profile, profile)
+            return 200, plan
+
+        if parts == ['plans', 'daily', 'batch']:
+            if method != 'POST':
+                raise HTTPError(405, "Use POST")
+            if not isinstance(body, list):
+                raise HTTPError(400, "Body must be a list of profiles")
+            profiles = [self._parse_profile(item) for item in body]
+            return 200, await self._run(self.batcher.plan_batch, profiles)
+
+        if len(parts) == 3 and parts[0] == 'foods' and parts[2] == 'similar':
+            try:
+                food_id = int(parts[1])
+                top_n = int(query.get('top_n', ['5'])[0])
+            except ValueError:
+                raise HTTPError(400, "food_id and top_n must be integers")
+            similar = await self._run(self.app.get_similar_foods, food_id, top_n)
+            if not similar:
+                raise HTTPError(404, f"Unknown food_id: {food_id}")
+            return 200, {'food_id': food_id, 'similar': similar}
+
+        if parts == ['foods', 'query']:
+            if method != 'POST':
+                raise HTTPError(405, "Use POST")
+            try:
+                if self.pool is not None:
+                    return 200, await asyncio.wrap_future(self.pool.submit('query_foods', body))
+                return 200, await self._run(self.app.query_foods, body)
+            except ValueError as e:
+                raise HTTPError(400, str(e))
+
+        if parts == ['foods']:
+            if method != 'POST':
+                raise HTTPError(405, "Use POST")
+            foods = body if isinstance(body, list) else [body]
+            if not foods or not all(isinstance(food, dict) for food in foods):
+                raise HTTPError(400, "Body must be a food or a list of foods")
+            return 200, await self._update_catalog(self.app.add_foods, foods)
+
+        if len(parts) == 2 and parts[0] == 'foods':
+            try:
+                food_id = int(parts[1])
+            except ValueError:
+                raise HTTPError(400, "food_id must be an integer")
+            if method == 'DELETE':
+                self._require_food(food_id)
+                return 200, await self._update_catalog(self.app.remove_foods, [food_id])
+            if method == 'PATCH':
+                if not isinstance(body, dict):
+                    raise HTTPError(400, "Body must be an object of changed fields")
+                self._require_food(food_id)
+                return 200, await self._update_catalog(self.app.update_food, food_id, body)
+            raise HTTPError(405, "Use PATCH or DELETE")
+
+        if parts == ['seasonal']:
+            cuisines = query.get('cuisines', [''])[0]
+            result = await self._run(
+                self.app.get_seasonal_recommendations,
+                query.get('diet_type', [None])[0],
+                query.get('meal_type', [None])[0],
+                [c.strip() for c in cuisines.split(',') if c.strip()] or None
+            )
+            return 200, result
+
+        raise HTTPError(404, f"No route for {method} {path}")
+
+    def _require_food(self, food_id):
+        """Answer 404 for a food that is not in the current catalog"""
+        if self.app.catalog.foods.row_of(food_id) is None:
+            raise HTTPError(404, f"Unknown food_id: {food_id}")
+
+    async def _update_catalog(self, update, *args):
+        """Apply a catalog update in the pool; plans already running finish on the previous catalog"""
+        try:
+            catalog = await self._run(update, *args)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        if self.pool is not None:
+            # The latest catalog, in case updates finished out of order
+            await self._run(self.pool.publish)
+        return {'catalog_version': catalog.version, 'n_foods': len(catalog)}
+
+    def _seasonal_for_profile(self, profile):
+        """Seasonal lists for each meal, as the command-line app shows them"""
+        return {
+            meal: self.app.get_seasonal_recommendations(
+                diet_type=profile.get('diet_type'),
+                meal_type=meal,
+                cuisines=profile['cuisines'].get(meal)
+            )
+            for meal in MEALS
+        }
+
+    async def _handle_connection(self, reader, writer):
+        status, payload, headers = 500, {'error': 'Internal server error'}, {}
+        try:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+
+            lines = head.decode('latin-1').split('\r\n')
+            try:
+                method, target, _ = lines[0].split(' ', 2)
+                url = urllib.parse.urlsplit(target)
+                query = urllib.parse.parse_qs(url.query)
+            except ValueError:
+                status, payload = 400, {'error': f"Malformed request line: {lines[0][:100]!r}"}
+                return
+            request_headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    request_headers[name.strip().lower()] = value.strip()
+
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                status, payload, headers = 503, {'error': 'Server overloaded, retry later'}, {'Retry-After': '1'}
+                return
+
+            self.pending += 1
+            try:
+                try:
+                    length = int(request_headers.get('content-length', 0))
+                except ValueError:
+                    raise HTTPError(400, "Invalid Content-Length")
+                if length > self.max_body_bytes:
+                    raise HTTPError(413, "Request body too large")
+                body = None
+                if length:
+                    try:
+                        body = json.loads(await reader.readexactly(length))
+                    except ValueError:
+                        raise HTTPError(400, "Request body is not valid JSON")
+
+                status, payload = await self.handle(method.upper(), url.path, query, body)
+            except HTTPError as e:
+                status, payload = e.status, {'error': e.message}
+            except Exception as e:
+                status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+            finally:
+                self.pending -= 1
+        finally:
+            if isinstance(payload, str):
+                data, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4'
+            else:
+                with self.app.instrumentation.span('serialize'):
+                    data, content_type = encode_json(payload), 'application/json'
+            response = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+                        f"Content-Type: {content_type}",
+                        f"Content-Length: {len(data)}",
+                        "Connection: close"]
+            response += [f"{name}: {value}" for name, value in headers.items()]
+            try:
+                writer.write(('\r\n'.join(response) + '\r\n\r\n').encode('latin-1') + data)
+                await writer.drain()
+                writer.close()
+            except ConnectionError:
+                pass
+
+    async def serve(self, host='127.0.0.1', port=8000, ready=None):
+        """Serve until cancelled; ready, if given, is an asyncio.Event set once listening"""
+        self.batcher.start()
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+            self.executor.shutdown(wait=False)
+
+
+class ServiceClient:
+    """Minimal blocking client for the service, e.g. for local testing"""
+
+    def __init__(self, base_url='http://127.0.0.1:8000', timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, method, path, body=None):
+        data = None if body is None else encode_json(body)
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise HTTPError(e.code, json.loads(e.read()).get('error', e.reason))
+
+    def daily_plan(self, profile, seasonal=False):
+        return self._request('POST', '/plans/daily' + ('?seasonal=1' if seasonal else ''), profile)
+
+    def daily_plans(self, profiles):
+        return self._request('POST', '/plans/daily/batch', profiles)
+
+    def similar_foods(self, food_id, top_n=5):
+        return self._request('GET', f'/foods/{food_id}/similar?top_n={top_n}')
+
+    def seasonal(self, diet_type=None, meal_type=None, cuisines=None):
+        params = {key: value for key, value in
+                  (('diet_type', diet_type), ('meal_type', meal_type),
+                   ('cuisines', ','.join(cuisines) if cuisines else None)) if value}
+        return self._request('GET', '/seasonal?' + urllib.parse.urlencode(params))
+
+    def query_foods(self, query):
+        return self._request('POST', '/foods/query', query)
+
+    def add_foods(self, foods):
+        return self._request('POST', '/foods', foods)
+
+    def update_food(self, food_id, values):
+        return self._request('PATCH', f'/foods/{food_id}', values)
+
+    def remove_food(self, food_id):
+        return self._request('DELETE', f'/foods/{food_id}')
+
+    def stats(self):
+        return self._request('GET', '/stats')
+
+    def metrics(self):
+        with urllib.request.urlopen(self.base_url + '/metrics', timeout=self.timeout) as response:
+            return response.read().decode('utf-8')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve DietRecommendationApp over HTTP")
+    parser.add_argument('--bundle', help="artifact bundle directory (see bundle.py)")
+    parser.add_argument('--csv', default='seasonal_food_database.csv', help="food database CSV")
+    parser.add_argument('--models', default='./', help="directory with the pickled models")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=4, help="worker threads")
+    parser.add_argument('--max-pending', type=int, default=256, help="requests in flight before 503")
+    parser.add_argument('--max-batch', type=int, default=64, help="plan requests per batch call")
+    parser.add_argument('--batch-window-ms', type=float, default=5)
+    parser.add_argument('--metrics', action='store_true', help="record spans and counters for GET /metrics")
+    parser.add_argument('--profile-slow-ms', type=float,
+                        help="write folded stacks of requests slower than this to --profile-dir")
+    parser.add_argument('--profile-dir', default='profiles')
+    parser.add_argument('--processes', type=int, default=0,
+                        help="worker processes sharing one catalog copy for daily plans, 0 to plan in this process")
+    parser.add_argument('--max-requests-per-process', type=int,
+                        help="batches after which a worker process is replaced")
+    parser.add_argument('--ranker', default='legacy', choices=DietRecommendationApp.RANKERS,
+                        help="how meal candidates are ranked, see DietRecommendationApp.configure_ranker")
+    args = parser.parse_args()
+
+    instrumentation = None
+    if args.metrics or args.profile_slow_ms is not None:
+        profiler = None
+        if args.profile_slow_ms is not None:
+            profiler = SlowRequestProfiler(threshold_ms=args.profile_slow_ms, output_dir=args.profile_dir)
+        instrumentation = Instrumentation([PrometheusSink()] if args.metrics else [], profiler=profiler)
+
+    if args.bundle:
+        recommender = DietRecommendationApp.from_bundle(args.bundle, instrumentation=instrumentation)
+    else:
+        recommender = DietRecommendationApp(food_data_path=args.csv, models_dir=args.models,
+                                            instrumentation=instrumentation)
+    if args.ranker != 'legacy':
+        recommender.configure_ranker(args.ranker)
+
+    pool = None
+    if args.processes:
+        pool = WorkerPool(recommender, args.processes, max_requests=args.max_requests_per_process)
+
+    service = RecommendationService(recommender, args.workers, args.max_pending,
+                                    args.max_batch, args.batch_window_ms, pool=pool)
+    print(f"Serving diet recommendations on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if pool is not None:
+            pool.close()
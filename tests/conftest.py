@@ -0,0 +1,28 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from diet_recommender import DietRecommendationApp
+
+FOOD_DATA = os.path.join(REPO_ROOT, 'seasonal_food_database.csv')
+
+
+@pytest.fixture(scope='session')
+def models_dir(tmp_path_factory):
+    # Copy the models so the neighbour table is cached outside the repository
+    models_dir = tmp_path_factory.mktemp('models')
+    for name in os.listdir(REPO_ROOT):
+        if name.endswith('.pkl'):
+            shutil.copy(os.path.join(REPO_ROOT, name), models_dir)
+    return str(models_dir)
+
+
+@pytest.fixture
+def app(models_dir):
+    """An app on the shipped food database, fresh for every test as tests change its catalog"""
+    return DietRecommendationApp(FOOD_DATA, models_dir)
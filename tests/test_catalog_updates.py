@@ -0,0 +1,128 @@
+import math
+
+import numpy as np
+import pytest
+
+from conftest import FOOD_DATA
+from diet_recommender import DietRecommendationApp
+
+# Only the columns a client must send; the scaler also uses fiber, sugar, sodium, cholesterol and serving size
+PARTIAL_FOOD = {
+    'food_id': 99999,
+    'food_name': 'Test Bowl',
+    'cuisine_type': 'Thai',
+    'diet_type': 'Vegan',
+    'calories': 200,
+    'protein_g': 10,
+    'fat_g': 5,
+    'carbs_g': 30,
+}
+
+PROFILES = [
+    {'age': 30, 'sex': 'female', 'weight_kg': 60, 'height_cm': 165, 'activity_level': 'moderate',
+     'goal': 'maintain', 'diet_type': 'Vegan', 'season': 'winter', 'cuisines': {'lunch': ['Thai']}},
+    {'age': 52, 'sex': 'male', 'weight_kg': 90, 'height_cm': 180, 'activity_level': 'sedentary',
+     'goal': 'lose', 'diet_type': 'Non-Vegetarian', 'season': 'summer', 'allergies': ['Dairy', 'Gluten']},
+]
+
+
+@pytest.fixture
+def reference(models_dir):
+    return DietRecommendationApp(FOOD_DATA, models_dir)
+
+
+def assert_matches_rebuild(app, reference, tmp_path):
+    """The app's catalog equals one rebuilt from scratch from the same foods"""
+    csv = tmp_path / 'foods.csv'
+    app.catalog.foods.frame().to_csv(csv, index=False)
+    reference.reload_food_data(str(csv))
+    catalog, rebuilt = app.catalog, reference.catalog
+
+    np.testing.assert_array_equal(catalog.foods.food_id, rebuilt.foods.food_id)
+    np.testing.assert_array_equal(catalog.neighbors.ids, rebuilt.neighbors.ids)
+    np.testing.assert_allclose(catalog.neighbors.scores, rebuilt.neighbors.scores, rtol=1e-5)
+    for diet_type in ('Vegan', 'Vegetarian', 'Non-Vegetarian'):
+        for cuisine in ('Thai', 'Italian'):
+            np.testing.assert_array_equal(
+                catalog.constraint_index.candidate_rows(diet_type, 'lunch', 'winter', [cuisine], ['Nuts']),
+                rebuilt.constraint_index.candidate_rows(diet_type, 'lunch', 'winter', [cuisine], ['Nuts']))
+    for profile in PROFILES:
+        assert app.recommend_daily_meals(profile) == reference.recommend_daily_meals(profile)
+
+
+def existing_food(app, food_id):
+    return app.catalog.foods.records([app.catalog.foods.row_of(food_id)])[0]
+
+
+def test_added_foods_match_a_rebuilt_catalog(app, reference, tmp_path):
+    # Near copies of existing foods enter many similar-food lists; exact copies would tie
+    foods = []
+    for food_id in (6, 201):
+        food = existing_food(app, food_id)
+        foods.append(dict(food, food_id=100000 + food_id, food_name=f"Copy {food_id}", calories=food['calories'] + 5))
+    app.add_foods(foods)
+
+    assert app.get_similar_foods(6, 1)[0]['food_id'] == 100006
+    assert_matches_rebuild(app, reference, tmp_path)
+
+
+def test_removed_foods_match_a_rebuilt_catalog(app, reference, tmp_path):
+    removed = [food['food_id'] for food in app.get_similar_foods(201, 3)]
+    app.remove_foods(removed)
+
+    assert all(food['food_id'] not in removed for food in app.get_similar_foods(201, 10))
+    assert_matches_rebuild(app, reference, tmp_path)
+
+
+def test_updated_food_matches_a_rebuilt_catalog(app, reference, tmp_path):
+    app.update_food(6, {'calories': 500, 'diet_type': 'Vegetarian', 'cuisine_type': 'Thai', 'winter': 0})
+
+    assert existing_food(app, 6)['diet_type'] == 'Vegetarian'
+    assert_matches_rebuild(app, reference, tmp_path)
+
+
+def test_updates_publish_new_versions(app):
+    original = app.catalog
+    app.add_foods([PARTIAL_FOOD])
+    app.update_food(PARTIAL_FOOD['food_id'], {'calories': 250})
+    app.remove_foods([PARTIAL_FOOD['food_id']])
+
+    assert app.catalog.version == original.version + 3
+    # A published catalog is never changed
+    assert original.foods.row_of(PARTIAL_FOOD['food_id']) is None
+    assert len(app.catalog) == len(original)
+
+
+def test_invalid_updates_are_rejected(app):
+    original = app.catalog
+
+    with pytest.raises(ValueError, match='Duplicate food ids'):
+        app.add_foods([dict(PARTIAL_FOOD, food_id=6)])
+    with pytest.raises(ValueError, match='Duplicate food ids'):
+        app.add_foods([PARTIAL_FOOD, PARTIAL_FOOD])
+    with pytest.raises(ValueError, match='Unknown food columns'):
+        app.add_foods([dict(PARTIAL_FOOD, colour='green')])
+    with pytest.raises(ValueError, match='Unknown food ids'):
+        app.remove_foods([PARTIAL_FOOD['food_id']])
+    with pytest.raises(ValueError, match='Unknown food_id'):
+        app.update_food(PARTIAL_FOOD['food_id'], {'calories': 250})
+    with pytest.raises(ValueError, match='Duplicate food ids'):
+        app.update_food(6, {'food_id': 201})
+
+    assert app.catalog is original
+
+
+def test_partial_food_has_finite_similarities(app):
+    app.add_foods([PARTIAL_FOOD])
+
+    similar = app.get_similar_foods(PARTIAL_FOOD['food_id'])
+    assert similar
+    assert all(math.isfinite(food['similarity']) for food in similar)
+
+
+def test_partial_food_keeps_blended_ranker_usable(app):
+    app.add_foods([PARTIAL_FOOD])
+    app.configure_ranker('blended')
+    app.update_food(PARTIAL_FOOD['food_id'], {'calories': 250})
+
+    assert not any(math.isnan(value) for value in app.catalog.scores.suitability.ravel())
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from food_index import ConstraintIndex
+from food_store import FoodStore
+
+COLUMNS = ['food_id', 'diet_type', 'cuisine_type', 'suitable_breakfast', 'suitable_lunch',
+           'spring', 'summer', 'fall', 'winter', 'allergens']
+
+# Each vegan food only meets some of the constraints of QUERY, and each has its own allergen,
+# so excluding allergens one by one walks the relaxation lattice
+FOODS = [
+    (0, 'Vegan', 'Thai', 1, 0, 0, 0, 0, 1, "['Soy']"),
+    (1, 'Vegan', 'Italian', 1, 0, 0, 0, 0, 1, "['Eggs']"),
+    (2, 'Vegan', 'Italian', 0, 1, 0, 0, 1, 1, "['Nuts']"),
+    (3, 'Vegan', 'Mexican', 0, 1, 1, 0, 0, 0, "['Gluten']"),
+    (4, 'Vegetarian', 'Thai', 1, 0, 0, 0, 0, 1, "['Dairy']"),
+] + [(10 + i, 'Non-Vegetarian', 'Mexican', 0, 1, 0, 1, 0, 0, "['Shellfish']") for i in range(12)]
+
+# Diet type, meal type, season and cuisines
+QUERY = ('Vegan', 'breakfast', 'winter', ['Thai'])
+
+ALL_ALLERGENS = ['Soy', 'Eggs', 'Nuts', 'Gluten', 'Dairy', 'Shellfish']
+
+
+def food_df():
+    return pd.DataFrame(FOODS, columns=COLUMNS)
+
+
+@pytest.fixture(params=['frame', 'store', 'arrays', 'appended', 'selected'])
+def index(request):
+    foods = food_df()
+    if request.param == 'frame':
+        return ConstraintIndex(foods)
+    index = ConstraintIndex.from_store(FoodStore.from_frame(foods))
+    if request.param == 'arrays':
+        return ConstraintIndex.from_arrays(*index.to_arrays())
+    if request.param == 'appended':
+        head = ConstraintIndex.from_store(FoodStore.from_frame(foods.iloc[:3]))
+        return head.append(ConstraintIndex.from_store(FoodStore.from_frame(foods.iloc[3:])))
+    if request.param == 'selected':
+        extra = pd.concat([foods, foods.assign(food_id=foods['food_id'] + 100)], ignore_index=True)
+        return ConstraintIndex.from_store(FoodStore.from_frame(extra)).select(np.arange(len(foods)))
+    return index
+
+
+@pytest.mark.parametrize('allergens, rows, relaxed', [
+    # 1. all given constraints
+    ([], [0], ()),
+    # 2. without cuisine
+    (['Soy'], [1], ('cuisine',)),
+    # 3. without cuisine and meal type
+    (['Soy', 'Eggs'], [2], ('meal_type', 'cuisine')),
+    # 4. without cuisine, meal type and season
+    (['Soy', 'Eggs', 'Nuts'], [3], ('meal_type', 'season', 'cuisine')),
+    # 6. allergens only, first 10 foods
+    (['Soy', 'Eggs', 'Nuts', 'Gluten'], list(range(4, 14)), ('diet_type', 'meal_type', 'season', 'cuisine')),
+])
+def test_relaxation_order(index, allergens, rows, relaxed):
+    candidates, explained = index.candidate_rows_explained(*QUERY, allergens)
+
+    np.testing.assert_array_equal(candidates, rows)
+    assert explained == relaxed
+
+
+def test_random_foods_when_allergens_exclude_everything(index):
+    candidates, explained = index.candidate_rows_explained(*QUERY, ALL_ALLERGENS)
+
+    assert len(candidates) == 10
+    assert explained == ('diet_type', 'meal_type', 'season', 'cuisine', 'allergens')
+
+
+def test_constraint_matching_nothing_is_skipped(index):
+    candidates, explained = index.candidate_rows_explained('Vegan', 'breakfast', 'winter', ['Nowhere'])
+
+    np.testing.assert_array_equal(candidates, [0, 1])
+    assert explained == ('cuisine',)
+
+
+def test_diet_type_falls_back_to_any_case(index):
+    candidates, explained = index.candidate_rows_explained('vegan', 'breakfast', 'winter', ['Thai'])
+
+    np.testing.assert_array_equal(candidates, [0])
+    assert explained == ()
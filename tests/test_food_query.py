@@ -0,0 +1,23 @@
+import pandas as pd
+import pytest
+
+from conftest import FOOD_DATA
+
+
+@pytest.fixture(scope='module')
+def food_df():
+    return pd.read_csv(FOOD_DATA)
+
+
+def test_diet_type_membership_ignores_case(app, food_df):
+    # The diet type condition of the module documentation's example
+    result = app.query_foods({'where': {'diet_type': {'in': ['vegan', 'vegetarian']}}, 'limit': 0})
+
+    assert result['total'] == food_df['diet_type'].isin(['Vegan', 'Vegetarian']).sum() > 0
+
+
+def test_categorical_equality_ignores_case(app, food_df):
+    assert app.query_foods({'where': {'diet_type': 'VEGAN'}})['total'] == (food_df['diet_type'] == 'Vegan').sum()
+    assert app.query_foods({'where': {'region': 'asian'}})['total'] == (food_df['region'] == 'Asian').sum()
+    assert app.query_foods({'where': {'cuisine_type': {'not_in': ['thai']}}})['total'] == \
+        (food_df['cuisine_type'] != 'Thai').sum()
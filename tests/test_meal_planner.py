@@ -0,0 +1,48 @@
+PROFILE = {
+    'age': 30,
+    'sex': 'female',
+    'weight_kg': 60,
+    'height_cm': 165,
+    'activity_level': 'moderate',
+    'goal': 'maintain',
+    'diet_type': 'Vegetarian',
+    'season': 'summer',
+    'allergies': ['Nuts'],
+}
+
+
+def planned_ids(plan):
+    return [[day['meals'][meal]['options'][0]['food_id'] for meal in ('breakfast', 'lunch', 'dinner', 'snack')]
+            for day in plan['days']]
+
+
+def test_week_has_no_violations(app):
+    planner = app.weekly_planner(PROFILE)
+    plan = planner.plan()
+
+    assert len(plan['days']) == 7
+    assert plan['violations'] == {'repeats': 0, 'cuisine': 0}
+    for day in plan['days']:
+        for meal in day['meals'].values():
+            food = meal['options'][0]
+            assert food['diet_type'] == 'Vegetarian'
+            assert 'Nuts' not in food['allergens']
+
+
+def test_swap_excludes_the_current_food(app):
+    planner = app.weekly_planner(PROFILE)
+    before = planned_ids(planner.plan())
+
+    after = planned_ids(planner.swap(3, 'lunch'))
+
+    assert after[3][1] != before[3][1]
+    assert planner.violations() == {'repeats': 0, 'cuisine': 0}
+
+
+def test_swap_to_a_given_food_locks_it(app):
+    planner = app.weekly_planner(PROFILE)
+    food_id = planner.plan()['days'][0]['meals']['dinner']['options'][0]['food_id']
+
+    after = planned_ids(planner.swap(5, 'dinner', food_id))
+
+    assert after[5][2] == food_id
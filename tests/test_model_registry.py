@@ -0,0 +1,29 @@
+import logging
+
+import pytest
+
+from model_registry import ModelRegistry
+
+
+def test_missing_file_is_reported_once(tmp_path, caplog):
+    registry = ModelRegistry()
+    registry.register_file('lunch_predictor', str(tmp_path / 'lunch_predictor.pkl'))
+
+    with caplog.at_level(logging.WARNING, logger='model_registry'):
+        for _ in range(3):
+            with pytest.raises(FileNotFoundError):
+                registry['lunch_predictor']
+
+    assert len(caplog.records) == 1
+    assert registry.stats()['lunch_predictor']['missing']
+
+
+def test_registering_again_retries_a_missing_file(tmp_path):
+    registry = ModelRegistry()
+    registry.register('model', lambda: open(tmp_path / 'model.txt').read())
+    with pytest.raises(FileNotFoundError):
+        registry['model']
+
+    (tmp_path / 'model.txt').write_text('weights')
+    registry.register('model', lambda: open(tmp_path / 'model.txt').read())
+    assert registry['model'] == 'weights'
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import shutil
+import socket
+import sys
+import threading
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from diet_recommender import DietRecommendationApp
+from server import HTTPError, RecommendationService, ServiceClient
+
+PROFILE = {
+    'age': 30,
+    'sex': 'female',
+    'weight_kg': 60,
+    'height_cm': 165,
+    'activity_level': 'moderate',
+    'goal': 'maintain',
+    'diet_type': 'Vegan',
+    'season': 'winter',
+    # No food has this cuisine, so the lunch options relax it
+    'cuisines': {'lunch': ['Nowhere']},
+}
+
+
+@pytest.fixture(scope='module')
+def client(tmp_path_factory):
+    # Copy the models so the neighbour table is cached outside the repository
+    models_dir = tmp_path_factory.mktemp('models')
+    for name in os.listdir(REPO_ROOT):
+        if name.endswith('.pkl'):
+            shutil.copy(os.path.join(REPO_ROOT, name), models_dir)
+    app = DietRecommendationApp(os.path.join(REPO_ROOT, 'seasonal_food_database.csv'), str(models_dir))
+    service = RecommendationService(app)
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    tasks = {}
+
+    async def serve():
+        listening = asyncio.Event()
+        tasks['serve'] = asyncio.ensure_future(service.serve('127.0.0.1', port, listening))
+        await listening.wait()
+        ready.set()
+        try:
+            await tasks['serve']
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=lambda: loop.run_until_complete(serve()), daemon=True)
+    thread.start()
+    assert ready.wait(30)
+    yield ServiceClient(f'http://127.0.0.1:{port}')
+    loop.call_soon_threadsafe(tasks['serve'].cancel)
+    thread.join(10)
+    loop.close()
+
+
+def test_daily_plan_reports_relaxed_constraints(client):
+    plan = client.daily_plan(PROFILE)
+
+    assert plan['meals']['lunch']['relaxed_constraints'] == ['cuisine']
+    assert plan['meals']['lunch']['options']
+    assert 'relaxed_constraints' not in plan['meals']['breakfast']
+
+
+def test_daily_plans_report_relaxed_constraints(client):
+    plans = client.daily_plans([PROFILE, dict(PROFILE, cuisines={})])
+
+    assert plans[0]['meals']['lunch']['relaxed_constraints'] == ['cuisine']
+    assert 'relaxed_constraints' not in plans[1]['meals']['lunch']
+
+
+def test_unknown_food_is_not_found(client):
+    with pytest.raises(HTTPError) as patched:
+        client.update_food(99999, {'calories': 100})
+    with pytest.raises(HTTPError) as deleted:
+        client.remove_food(99999)
+
+    assert patched.value.status == deleted.value.status == 404
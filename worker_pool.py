@@ -0,0 +1,630 @@
+"""
+Multi-process serving over one shared copy of the food catalog.
+
+WorkerPool runs DietRecommendationApp calls in worker processes. The
+supervisor exports the catalog (food table, constraint bitsets, allergen
+matrix, neighbour table, model scores and ranking arrays) into a single
+shared memory block. Every worker maps that block read-only instead of
+loading its own copy. An additional worker therefore costs its
+interpreter and per-request state, but not another copy of the data.
+
+Each worker has its own request queue. The supervisor thread:
+
+- sends each call to the ready worker with the fewest calls in flight
+- pings idle workers, and restarts workers that exit or stop responding
+- recycles a worker after max_requests calls, or once its private memory
+  exceeds max_private_mb; the replacement is started first
+- swaps catalogs gracefully: publish() shares the new version in a new
+  block, every worker switches to it after the calls already in its
+  queue, and the old block is freed once no worker uses it
+
+Usage:
+    app = DietRecommendationApp.from_bundle('food_bundle')
+    with WorkerPool(app, workers=8) as pool:
+        plan = pool.call('recommend_daily_meals', profile)
+        app.add_foods(new_foods)
+        pool.publish()
+"""
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import Future, InvalidStateError
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedArrays:
+    """
+    Named arrays packed into one shared memory block.
+
+    Object arrays, e.g. string vocabularies, cannot be shared; they travel
+    with the handle and are copied into every process that attaches.
+    """
+
+    # Byte alignment of every array in the block
+    ALIGNMENT = 64
+
+    def __init__(self, block, layout, objects):
+        self.block = block
+        self.layout = layout
+        self.objects = objects
+
+    @classmethod
+    def create(cls, arrays):
+        """Copy arrays into a new block"""
+        layout = {}
+        objects = {}
+        size = 0
+        for name, array in arrays.items():
+            array = np.asarray(array)
+            if array.dtype.hasobject:
+                objects[name] = array
+                continue
+            offset = -(-size // cls.ALIGNMENT) * cls.ALIGNMENT
+            layout[name] = (offset, array.shape, array.dtype.str)
+            size = offset + array.nbytes
+
+        block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        shared = cls(block, layout, objects)
+        for name, view in shared._views(writeable=True).items():
+            view[...] = arrays[name]
+        return shared
+
+    @classmethod
+    def attach(cls, name, layout, objects):
+        """Map an existing block, see handle"""
+        return cls(shared_memory.SharedMemory(name=name), layout, objects)
+
+    @property
+    def handle(self):
+        """Picklable arguments of attach()"""
+        return self.block.name, self.layout, self.objects
+
+    @property
+    def nbytes(self):
+        return self.block.size
+
+    def _views(self, writeable=False):
+        views = {}
+        for name, (offset, shape, dtype) in self.layout.items():
+            view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=self.block.buf, offset=offset)
+            view.flags.writeable = writeable
+            views[name] = view
+        return views
+
+    def arrays(self):
+        """Read-only views of every array, with the object arrays"""
+        arrays = self._views()
+        arrays.update(self.objects)
+        return arrays
+
+    def close(self):
+        """Unmap the block; raises BufferError while views of it are still referenced"""
+        self.block.close()
+
+    def unlink(self):
+        """Close the block and free it once every process has closed it"""
+        self.block.close()
+        self.block.unlink()
+
+
+class _Worker:
+    """Supervisor-side state of one worker process"""
+
+    def __init__(self, process, requests, replies, generation):
+        self.process = process
+        self.requests = requests
+        self.replies = replies
+        # Catalog generation the worker serves, or attaches to while starting
+        self.generation = generation
+        self.ready = False
+        self.draining = False
+        self.unresponsive = False
+        self.in_flight = {}
+        self.served = 0
+        self.memory = {}
+        self.started_at = time.monotonic()
+        self.last_seen = self.started_at
+        self.ping_sent_at = None
+
+    def stats(self):
+        return {
+            'pid': self.process.pid,
+            'ready': self.ready,
+            'draining': self.draining,
+            'generation': self.generation,
+            'in_flight': len(self.in_flight),
+            'served': self.served,
+            'uptime_seconds': round(time.monotonic() - self.started_at, 1),
+            **self.memory,
+        }
+
+
+class WorkerPool:
+    """
+    Worker processes serving read-only app calls over a shared catalog.
+
+    The app passed in stays the writer: catalog updates are applied to it
+    (add_foods, remove_foods, ...) and reach the workers with publish().
+    """
+
+    # App methods the workers answer; they only read the catalog
+    SERVED_METHODS = (
+        'recommend_daily_meals',
+        'recommend_daily_meals_batch',
+        'recommend_weekly_meals',
+        'get_user_calorie_targets',
+        'get_user_calorie_targets_batch',
+        'filter_foods_by_constraints',
+        'query_foods',
+        'get_similar_foods',
+        'get_seasonal_recommendations',
+        'recommend_goal',
+        'calculate_bmr',
+    )
+
+    # Longest time the supervisor thread waits for worker messages
+    POLL_SECONDS = 0.1
+
+    def __init__(self, app, workers=None, max_requests=None, max_private_mb=None,
+                 health_interval=5.0, health_timeout=60.0, start_method=None):
+        """
+        Share the app's catalog and start the workers.
+
+        Parameters:
+        -----------
+        app : DietRecommendationApp
+            The loaded app; workers load its models from app.models_dir
+        workers : int, optional
+            Number of worker processes, one per CPU by default
+        max_requests : int, optional
+            Calls after which a worker is replaced, unlimited if None
+        max_private_mb : float, optional
+            Private memory, outside the shared catalog, above which a worker
+            is replaced, unlimited if None (measured on Linux only)
+        health_interval : float
+            Seconds of silence after which a worker is pinged
+        health_timeout : float
+            Seconds a worker may take to start, or to answer while it has
+            calls or a ping outstanding, before it is killed and replaced
+        start_method : str, optional
+            multiprocessing start method; defaults to 'forkserver' where
+            available, so workers fork from a process that already imported
+            the app instead of importing it again
+        """
+        self.app = app
+        self.n_workers = workers or os.cpu_count() or 1
+        self.max_requests = max_requests
+        self.max_private_mb = max_private_mb
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver' and type(app).__module__ != '__main__':
+            self._context.set_forkserver_preload([type(app).__module__])
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._publish_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._workers = []
+        self._blocks = {}
+        self._generation = 0
+        self._catalog = None
+        self._closed = False
+        self.restarts = 0
+        self.recycled = 0
+        self.start_error = None
+
+        arrays, metadata = app.catalog.to_arrays()
+        with self._lock:
+            self._share(SharedArrays.create(arrays), metadata)
+            for _ in range(self.n_workers):
+                self._spawn()
+        self._supervisor = threading.Thread(target=self._supervise, name='worker-pool', daemon=True)
+        self._supervisor.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _share(self, block, metadata):
+        """Make a shared catalog the one new workers attach to; call with the lock held"""
+        self._generation += 1
+        self._blocks[self._generation] = block
+        self._catalog = (self._generation, block.handle, metadata, _app_settings(self.app))
+        return self._catalog
+
+    def _spawn(self):
+        """Start one worker on the current catalog; call with the lock held"""
+        requests = self._context.Queue()
+        replies, sender = self._context.Pipe(duplex=False)
+        generation, handle, metadata, settings = self._catalog
+        process = self._context.Process(
+            target=_serve,
+            args=(type(self.app), self.app.models_dir, generation, handle, metadata, settings, requests, sender),
+            name='recommender-worker',
+            daemon=True
+        )
+        process.start()
+        # The worker holds the only sending end, so its exit closes the pipe
+        sender.close()
+        worker = _Worker(process, requests, replies, generation)
+        self._workers.append(worker)
+        return worker
+
+    def wait_ready(self, timeout=None):
+        """Wait until every worker is ready; return False if timeout expired first"""
+        with self._lock:
+            self._changed.wait_for(lambda: self._closed or all(worker.ready for worker in self._workers), timeout)
+            return bool(self._workers) and all(worker.ready for worker in self._workers)
+
+    def submit(self, method, *args, **kwargs):
+        """
+        Queue one app call on the least busy worker.
+
+        Returns:
+        --------
+        concurrent.futures.Future
+            Resolves to the call's result, or to its exception; calls in
+            flight on a worker that exits or is killed fail with RuntimeError
+        """
+        if method not in self.SERVED_METHODS:
+            raise ValueError(f"{method} is not served by the workers, expected one of {self.SERVED_METHODS}")
+
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The worker pool is closed")
+            workers = [worker for worker in self._workers if not worker.draining and not worker.unresponsive]
+            if not workers:
+                raise RuntimeError(f"No worker is available: {self.start_error or 'every worker exited'}")
+            # Workers still starting only get calls when none is ready
+            worker = min(workers, key=lambda worker: (not worker.ready, len(worker.in_flight)))
+            request_id = next(self._request_ids)
+            worker.in_flight[request_id] = future
+            worker.requests.put(('call', request_id, method, args, kwargs))
+        return future
+
+    def call(self, method, *args, timeout=None, **kwargs):
+        """Run one app call on a worker and return its result"""
+        return self.submit(method, *args, **kwargs).result(timeout)
+
+    def publish(self, catalog=None, timeout=None):
+        """
+        Switch every worker to a new catalog.
+
+        The catalog is copied into a new shared block. Calls queued before
+        publish() are still answered from the previous catalog, later ones
+        from the new one. The previous block is freed once every worker
+        has switched. The app's ranker and plan cache settings are sent
+        along.
+
+        Parameters:
+        -----------
+        catalog : FoodCatalog, optional
+            The catalog to serve, the app's current one by default
+        timeout : float, optional
+            Longest time to wait for the workers to switch
+
+        Returns:
+        --------
+        bool
+            True once every worker serves the new catalog, False if timeout
+            expired first
+        """
+        with self._publish_lock:
+            catalog = self.app.catalog if catalog is None else catalog
+            arrays, metadata = catalog.to_arrays()
+            block = SharedArrays.create(arrays)
+            with self._lock:
+                if self._closed:
+                    block.unlink()
+                    raise RuntimeError("The worker pool is closed")
+                message = ('attach',) + self._share(block, metadata)
+                generation = message[1]
+                for worker in self._workers:
+                    if not worker.draining:
+                        worker.requests.put(message)
+                return self._changed.wait_for(
+                    lambda: self._closed or all(worker.generation >= generation
+                                                for worker in self._workers if not worker.draining),
+                    timeout)
+
+    def stats(self):
+        """Return the state of every worker and of the shared catalog"""
+        with self._lock:
+            generation = self._catalog[0]
+            return {
+                'workers': [worker.stats() for worker in self._workers],
+                'generation': generation,
+                'shared_mb': round(self._blocks[generation].nbytes / 1e6, 1),
+                'shared_blocks': len(self._blocks),
+                'restarts': self.restarts,
+                'recycled': self.recycled,
+                'start_error': self.start_error,
+            }
+
+    def close(self, timeout=30):
+        """Stop the workers after the calls they have queued, then free the shared catalog"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for worker in self._workers:
+                if not worker.draining:
+                    worker.draining = True
+                    worker.requests.put(('stop',))
+            self._changed.notify_all()
+
+        self._supervisor.join(timeout)
+        if self._supervisor.is_alive():
+            with self._lock:
+                for worker in self._workers:
+                    worker.process.kill()
+            self._supervisor.join()
+
+        with self._lock:
+            for block in self._blocks.values():
+                block.unlink()
+            self._blocks.clear()
+
+    def _supervise(self):
+        """Supervisor thread: collect replies, watch worker health and free unused blocks"""
+        while True:
+            with self._lock:
+                if self._closed and not self._workers:
+                    return
+                by_replies = {worker.replies: worker for worker in self._workers}
+                by_sentinel = {worker.process.sentinel: worker for worker in self._workers}
+
+            ready = multiprocessing.connection.wait(list(by_replies) + list(by_sentinel), self.POLL_SECONDS)
+
+            # Replies are read outside the lock, so large results do not hold up submit()
+            messages = [(by_replies[item], self._receive(item)) for item in ready if item in by_replies]
+            resolved = []
+            with self._lock:
+                for worker, received in messages:
+                    for message in received:
+                        resolved += self._handle(worker, message)
+                for item in ready:
+                    if item in by_sentinel:
+                        worker = by_sentinel[item]
+                        for message in self._receive(worker.replies):
+                            resolved += self._handle(worker, message)
+                        resolved += self._exited(worker)
+                self._check_health()
+                self._release_blocks()
+                self._changed.notify_all()
+
+            for future, ok, value in resolved:
+                _resolve(future, ok, value)
+
+    @staticmethod
+    def _receive(replies):
+        """Read every message waiting on a worker's pipe"""
+        messages = []
+        try:
+            while replies.poll():
+                messages.append(replies.recv())
+        except (EOFError, OSError):
+            # The worker exited; its sentinel reports it
+            pass
+        return messages
+
+    def _handle(self, worker, message):
+        """Apply one worker message; return the futures it resolves"""
+        worker.last_seen = time.monotonic()
+        kind = message[0]
+        if kind == 'result':
+            _, request_id, ok, value = message
+            future = worker.in_flight.pop(request_id, None)
+            worker.served += 1
+            if self.max_requests is not None and worker.served >= self.max_requests:
+                self._recycle(worker)
+            return [(future, ok, value)] if future is not None else []
+
+        if kind == 'ready':
+            worker.ready = True
+            worker.memory = message[2]
+        elif kind == 'attached':
+            worker.generation = message[1]
+        elif kind == 'pong':
+            worker.ping_sent_at = None
+            worker.memory = message[1]
+            private_mb = worker.memory.get('private_mb')
+            if self.max_private_mb is not None and private_mb is not None and private_mb > self.max_private_mb:
+                self._recycle(worker)
+        elif kind == 'failed':
+            self.start_error = message[1]
+        return []
+
+    def _recycle(self, worker):
+        """Replace a worker: start its successor, then let it finish its queue and exit"""
+        if worker.draining or self._closed:
+            return
+        worker.draining = True
+        worker.requests.put(('stop',))
+        self._spawn()
+        self.recycled += 1
+
+    def _exited(self, worker):
+        """Remove a worker whose process ended; return its calls in flight, failed"""
+        worker.process.join()
+        self._workers.remove(worker)
+        worker.replies.close()
+        worker.requests.close()
+        worker.requests.cancel_join_thread()
+
+        if worker.unresponsive:
+            reason = f"did not respond for {self.health_timeout}s and was killed"
+        else:
+            reason = f"exited with code {worker.process.exitcode}"
+        failed = [(future, False, RuntimeError(f"Worker {worker.process.pid} {reason}"))
+                  for future in worker.in_flight.values()]
+        if not worker.ready and self.start_error is None:
+            self.start_error = f"Worker {worker.process.pid} {reason} before it was ready"
+
+        # A worker that never got ready would fail the same way again, it is not replaced
+        if not worker.draining and not self._closed and worker.ready:
+            self._spawn()
+            self.restarts += 1
+        return failed
+
+    def _check_health(self):
+        """Ping silent workers and kill those that do not answer in time"""
+        now = time.monotonic()
+        for worker in self._workers:
+            if worker.unresponsive:
+                continue
+            silent = now - worker.last_seen
+            waiting = worker.in_flight or worker.ping_sent_at is not None or not worker.ready
+            if waiting and silent > self.health_timeout:
+                worker.unresponsive = True
+                worker.process.kill()
+            elif worker.ready and worker.ping_sent_at is None and silent > self.health_interval:
+                worker.ping_sent_at = now
+                worker.requests.put(('ping',))
+
+    def _release_blocks(self):
+        """Free the blocks of previous catalogs that no worker uses any more"""
+        used = {worker.generation for worker in self._workers}
+        used.add(self._catalog[0])
+        for generation in [generation for generation in self._blocks if generation not in used]:
+            self._blocks.pop(generation).unlink()
+
+
+def _resolve(future, ok, value):
+    """Set a call's outcome, unless the caller cancelled it"""
+    try:
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+    except InvalidStateError:
+        pass
+
+
+def _app_settings(app):
+    """Settings a worker app copies from the supervisor's app"""
+    ranker = app.ranker
+    plan_cache = app.plan_cache
+    return {
+        'neighbor_backend': app.neighbor_backend,
+        'neighbor_k': app.neighbor_k,
+        'ranker': None if ranker is None else {'weights': ranker.weights, 'pool_size': ranker.pool_size},
+        'plan_cache': None if plan_cache is None else {
+            'bucket_kcal': plan_cache.bucket_kcal,
+            'exact': plan_cache.exact,
+            'max_entries': plan_cache.entries.max_entries,
+            'ttl_seconds': plan_cache.entries.ttl_seconds,
+        },
+    }
+
+
+def _configure(app, settings):
+    """Apply the supervisor's ranker and plan cache settings to a worker app"""
+    ranker = settings['ranker']
+    if ranker is None:
+        app.configure_ranker('legacy')
+    else:
+        app.configure_ranker('blended', ranker['weights'], ranker['pool_size'])
+
+    plan_cache = settings['plan_cache']
+    if plan_cache is None:
+        app.configure_plan_cache(None)
+    else:
+        app.configure_plan_cache(**plan_cache)
+
+
+def _memory_usage():
+    """
+    Resident and private memory of this process in MB, on Linux.
+
+    Private memory leaves out shared memory blocks, so it only grows with
+    what the worker allocated itself.
+    """
+    rss = private = 0
+    shared = False
+    try:
+        with open('/proc/self/smaps') as f:
+            for line in f:
+                field, _, value = line.partition(':')
+                if not value:
+                    # Mapping header: address range, permissions, ..., path
+                    shared = '/dev/shm/' in line
+                elif field == 'Rss':
+                    rss += int(value.split()[0])
+                elif field in ('Private_Clean', 'Private_Dirty') and not shared:
+                    private += int(value.split()[0])
+    except (OSError, ValueError):
+        return {}
+    return {'rss_mb': round(rss / 1024, 1), 'private_mb': round(private / 1024, 1)}
+
+
+def _close_retired(blocks):
+    """Close the blocks of previous catalogs that nothing references any more; return the others"""
+    remaining = []
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError:
+            remaining.append(block)
+    return remaining
+
+
+def _serve(app_class, models_dir, generation, handle, metadata, settings, requests, replies):
+    """Worker process: attach the shared catalog and answer calls until told to stop"""
+    # Interrupts go to the supervisor, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        block = SharedArrays.attach(*handle)
+        app = app_class.from_catalog_arrays(block.arrays(), metadata, models_dir,
+                                            settings['neighbor_backend'], settings['neighbor_k'])
+        _configure(app, settings)
+    except Exception:
+        replies.send(('failed', traceback.format_exc()))
+        raise SystemExit(1)
+    replies.send(('ready', generation, _memory_usage()))
+
+    retired = []
+    while True:
+        message = requests.get()
+        kind = message[0]
+        if kind == 'call':
+            _, request_id, method, args, kwargs = message
+            try:
+                reply = ('result', request_id, True, getattr(app, method)(*args, **kwargs))
+            except Exception as e:
+                reply = ('result', request_id, False, e)
+            try:
+                replies.send(reply)
+            except Exception as e:
+                # The result or exception could not be pickled
+                replies.send(('result', request_id, False,
+                              RuntimeError(f"{method} returned a value that cannot be sent back: {e!r}")))
+            reply = None
+        elif kind == 'ping':
+            replies.send(('pong', _memory_usage()))
+        elif kind == 'attach':
+            _, generation, handle, metadata, settings = message
+            retired.append(block)
+            block = SharedArrays.attach(*handle)
+            app.load_catalog_arrays(block.arrays(), metadata)
+            _configure(app, settings)
+            replies.send(('attached', generation))
+        elif kind == 'stop':
+            return
+
+        if retired:
+            retired = _close_retired(retired)